@@ -0,0 +1,56 @@
+"""
+Benchmark of the python interface plafi.fit against fc.fit_data, that prints the parameters and creates the plot.
+It fits the same small dataset many times (as a pipeline fitting one acquisition after the other does) and prints
+the mean time per fit of: fit_data with the plot (rendered with Agg and closed), fit_data without the plot, and
+plafi.fit, that neither prints nor plots.
+
+Usage: python benchmarks/bench_api.py
+"""
+import contextlib
+import io
+import os
+import sys
+import timeit
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import plafi
+from plafi import functions as fc
+
+MODEL = "var1*cos(x+var2)+var3"
+
+
+def fit_data_with_plot(data, fitting_function):
+    with contextlib.redirect_stdout(io.StringIO()):
+        fig = fc.fit_data(data, fitting_function)[2]
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+def fit_data_without_plot(data, fitting_function):
+    with contextlib.redirect_stdout(io.StringIO()):
+        fc.fit_data(data, fitting_function, show_plot=False)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    x_values = np.linspace(0, 20, 500)
+    y_values = 2 * np.cos(x_values + 0.3) + 0.5 + rng.normal(0, 0.1, x_values.size)
+    data = np.column_stack([x_values, y_values])
+    fitting_function = fc.generate_fitting_function(MODEL)
+    plt.show = lambda *args, **kwargs: None
+
+    runs = [("fit_data, printed and plotted", lambda: fit_data_with_plot(data, fitting_function), 20),
+            ("fit_data, printed", lambda: fit_data_without_plot(data, fitting_function), 200),
+            ("plafi.fit", lambda: plafi.fit(x_values, y_values, MODEL), 200)]
+    for label, run, number in runs:
+        run()  # the modules are imported and the model is compiled before timing
+        elapsed = min(timeit.repeat(run, number=number, repeat=3)) / number
+        print("{:30} {:9.3f} ms per fit".format(label, elapsed * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Benchmark of the analytic jacobian passed to curve_fit against the finite differences estimate.
+It fits the cosine model of examples/example1.xlsx and a synthetic dataset with 1e6 points,
+and prints the number of function/jacobian evaluations and the wall time of both the approaches.
+
+Usage: python benchmarks/bench_jacobian.py
+"""
+import os
+import sys
+import timeit
+import numpy as np
+from scipy.optimize import curve_fit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from plafi import functions as fc
+
+# same model of the README example, with the constant T = 300 written as literal
+MODEL = "var1*cos(x+pi*var2)+300-var3"
+
+
+def run(x_values, y_values, fitting_function, jac, repeat):
+    popt, pcov, infodict, _, _ = curve_fit(fitting_function, x_values, y_values, jac=jac, full_output=True)
+    elapsed = min(timeit.repeat(lambda: curve_fit(fitting_function, x_values, y_values, jac=jac),
+                                number=1, repeat=repeat))
+    return infodict["nfev"], infodict.get("njev", 0), elapsed, popt
+
+
+def main():
+    fitting_function = fc.generate_fitting_function(MODEL, 3)
+
+    data = fc.read_data(os.path.join(os.path.dirname(__file__), "..", "examples", "example1.xlsx"))
+    rng = np.random.default_rng(0)
+    x_synthetic = np.linspace(0, 20, 1000000)
+    y_synthetic = 2 * np.cos(x_synthetic + np.pi * 0.3) + 0.5 + rng.normal(0, 0.1, x_synthetic.size)
+
+    datasets = [("example1.xlsx", data.T[0], data.T[1], 200), ("synthetic 1e6", x_synthetic, y_synthetic, 3)]
+    for name, x_values, y_values, repeat in datasets:
+        for label, jac in [("finite differences", None), ("analytic jacobian", fitting_function.jacobian)]:
+            nfev, njev, elapsed, popt = run(x_values, y_values, fitting_function, jac, repeat)
+            print("{:14} {:19} nfev={:3d} njev={:3d} time={:9.3f} ms  popt={}".format(
+                name, label, nfev, njev, elapsed * 1e3, np.round(popt, 6)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark of the built-in models against the same models written as fitting functions.
+Every model is fitted to random noisy datasets, once as an expression starting from p0 = 1 and once by name, with its
+analytic jacobian and its initial guess. For both it prints the fraction of fits that recover the true parameters
+(within 5%), the mean number of function evaluations and the mean time per fit.
+
+Usage: python benchmarks/bench_models.py
+"""
+import os
+import sys
+import time
+import warnings
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from plafi import functions as fc
+from plafi import models
+
+DATASETS = 50
+
+
+def random_parameters(model_name, rng):
+    if model_name == "gaussian" or model_name == "lorentzian":
+        return [rng.uniform(1, 5) * rng.choice([-1, 1]), rng.uniform(2, 8), rng.uniform(0.3, 1.5), rng.uniform(-1, 1)]
+    if model_name == "exponential":
+        return [rng.uniform(1, 5), rng.uniform(0.5, 5), rng.uniform(-1, 1)]
+    if model_name == "sine":
+        return [rng.uniform(1, 5), rng.uniform(0.5, 6), rng.uniform(0, np.pi), rng.uniform(-1, 1)]
+    if model_name == "damped_sine":
+        return [rng.uniform(1, 5), rng.uniform(2, 10), rng.uniform(0.5, 6), rng.uniform(0, np.pi), rng.uniform(-1, 1)]
+    return list(rng.uniform(-2, 2, 4))
+
+
+def run(fitting_function, x_values, y_values, parameters):
+    start = time.perf_counter()
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            result = fc.run_fit(fitting_function, x_values, y_values)
+    except (RuntimeError, ValueError):
+        return False, 0, time.perf_counter() - start
+    elapsed = time.perf_counter() - start
+    return np.allclose(result.popt, parameters, rtol=0.05, atol=0.05), result.nfev, elapsed
+
+
+def main():
+    x_values = np.linspace(0, 10, 500)
+    print("{:14} {:>22} {:>22}".format("", "expression, p0 = 1", "built-in model"))
+    print("{:14} {:>7} {:>6} {:>8} {:>7} {:>6} {:>8}".format("model", "success", "nfev", "ms", "success", "nfev",
+                                                                "ms"))
+    for model_name in ["gaussian", "lorentzian", "exponential", "sine", "damped_sine", "polynomial3"]:
+        rng = np.random.default_rng(0)
+        string_function = fc.generate_fitting_function(models.get_model(model_name).expression)
+        model_function = fc.generate_fitting_function(model_name)
+        totals = np.zeros((2, 3))
+        for _ in range(DATASETS):
+            parameters = random_parameters(model_name, rng)
+            y_values = model_function(x_values, *parameters) + rng.normal(0, 0.05, x_values.size)
+            for row, fitting_function in enumerate([string_function, model_function]):
+                totals[row] += run(fitting_function, x_values, y_values, parameters)
+        totals /= DATASETS
+        print("{:14} {:7.0%} {:6.1f} {:8.3f} {:7.0%} {:6.1f} {:8.3f}".format(
+            model_name, *totals[0, :2], totals[0, 2] * 1e3, *totals[1, :2], totals[1, 2] * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark of the read-only streaming .xlsx reader against pandas.read_excel.
+The rows of testing/data1.xlsx are repeated up to the requested number of rows, then the file is read
+in a fresh process with both the readers, printing the wall time and the peak RSS of the process.
+
+Usage: python benchmarks/bench_xlsx.py [number of rows, default 1000000]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import openpyxl
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (imports, reading statement) of every reader, only the reading statement is timed
+READERS = {
+    "pandas.read_excel": ("import pandas as pd",
+                          "data = pd.read_excel(path, header=None).to_numpy()"),
+    "streaming reader": ("from plafi import functions as fc",
+                         "data = fc._read_xlsx(path)"),
+}
+
+CHILD = """
+import resource, sys, time
+sys.path.insert(0, {root!r})
+path = {path!r}
+{imports}
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+{reader}
+elapsed = time.perf_counter() - start
+print(elapsed, rss_before, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def scaled_file(path, num_rows):
+    source = openpyxl.load_workbook(os.path.join(ROOT, "testing", "data1.xlsx"), read_only=True)
+    rows = [row for row in source.active.iter_rows(values_only=True)]
+    source.close()
+
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet()
+    for idx in range(num_rows):
+        worksheet.append(rows[idx % len(rows)])
+    workbook.save(path)
+
+
+def main():
+    num_rows = int(float(sys.argv[1])) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "data.xlsx")
+        scaled_file(path, num_rows)
+        print("{} rows, {:.1f} MB".format(num_rows, os.path.getsize(path) / 1024 ** 2))
+
+        for name, (imports, reader) in READERS.items():
+            child = CHILD.format(root=ROOT, path=path, imports=imports, reader=reader)
+            result = subprocess.run([sys.executable, "-c", child], capture_output=True, text=True, check=True)
+            elapsed, rss_before, max_rss = result.stdout.split()
+            print("{:18} time {:8.2f} s  peak RSS {:8.1f} MB (+{:.1f} MB while reading)".format(
+                name, float(elapsed), int(max_rss) / 1024, (int(max_rss) - int(rss_before)) / 1024))
+
+
+if __name__ == '__main__':
+    main()
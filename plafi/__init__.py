@@ -1,4 +1,10 @@
-from .functions import initialize_constants
+# the python interface is imported when it is first used, so that "import plafi" and the command line help
+# do not import numpy
+__all__ = ["fit", "FitResult", "read_data"]
 
 
-initialize_constants()
+def __getattr__(name):
+    if name in __all__:
+        from . import functions
+        return getattr(functions, name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
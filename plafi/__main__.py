@@ -1,5 +1,4 @@
 import argparse
-from . import functions as fc
 import os
 
 # Not showing the traceback in case of raising error
@@ -7,6 +6,17 @@ import sys
 sys.tracebacklimit = 0
 
 
+def positive_int(value):
+    # type of the options that must be at least 1, i.e. the number of worker processes
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid int value: {!r}".format(value))
+    if number < 1:
+        raise argparse.ArgumentTypeError("{} is not a positive integer".format(value))
+    return number
+
+
 def main():
     # parser initialization
     parser = argparse.ArgumentParser()
@@ -17,12 +27,80 @@ def main():
     plot_parser = subparsers.add_parser('plot', help='plot the data')
     plot_parser.add_argument("path", help='path to data to plot', type=str, nargs="?")
     plot_parser.add_argument("-v", "--verbose", help="Increase output verbosity", action="store_true")
+    plot_parser.add_argument("--no-plot", help="do not create the plot", action="store_true")
+    plot_parser.add_argument("--save-plot", help="save the plot in this file instead of showing it", type=str)
+    plot_parser.add_argument("-r", "--rows-to-skip", help="number of rows to skip", type=int, default=0)
+    plot_parser.add_argument("--chunk-size", help="read .txt and .csv files in chunks of this number of rows",
+                             type=int)
+    plot_parser.add_argument("--decimation", help="keep one row every DECIMATION when reading in chunks",
+                             type=int, default=1)
+    plot_parser.add_argument("--aggregate", help="average the blocks of DECIMATION rows instead of "
+                                                 "dropping rows", action="store_true")
+    plot_parser.add_argument("-w", "--watch", help="update the plot every time new rows are appended to the "
+                                                   "file (.txt and .csv only)", action="store_true")
+    plot_parser.add_argument("--interval", help="seconds between two checks of the watched file",
+                             type=float, default=1.0)
 
     # FITTING argument
     fit_parser = subparsers.add_parser('fit', help='fit the data')
     fit_parser.add_argument("path", help='path to fitting configuration file', type=str, nargs="?")
     fit_parser.add_argument("-v", "--verbose", help="Iterative input of fitting parameters", action="store_true")
     fit_parser.add_argument("-c", "--configuration", help="Create a configuration file in cwd", action="store_true")
+    fit_parser.add_argument("--no-plot", help="do not create the plot", action="store_true")
+    fit_parser.add_argument("--save-plot", help="save the plot in this file instead of showing it", type=str)
+    fit_parser.add_argument("-b", "--batch", help="fit every configuration file matching a glob pattern, "
+                                                  "i.e. 'runs/*.cfg'", type=str)
+    fit_parser.add_argument("-o", "--output", help="path of the batch results table (.csv or .parquet)",
+                            type=str, default="plafi_results.csv")
+    fit_parser.add_argument("--plot-dir", help="directory where the batch plots are saved", type=str)
+    fit_parser.add_argument("-g", "--global-fit", help="fit at once every configuration file matching a glob "
+                                                       "pattern, with the --shared parameters in common", type=str)
+    fit_parser.add_argument("--shared", help="numbers of the parameters shared in the global fit, i.e. 2 for var2",
+                            type=int, nargs="+", default=[])
+    fit_parser.add_argument("--warm-start", help="start every batch fit from the parameters of the previous one",
+                            action="store_true")
+    fit_parser.add_argument("-j", "--jobs", help="number of worker processes used for the batch fits "
+                                                 "and for the fits of more y columns",
+                            type=positive_int, default=1)
+    fit_parser.add_argument("--engine", help="optimizer used for the fit (default: the one of the configuration "
+                                             "file, or curve_fit)", choices=["curve_fit", "lm", "trf", "multistart"])
+    fit_parser.add_argument("--loss", help="loss function of the trf and multistart engines, i.e. soft_l1 to reduce "
+                                           "the weight of the outliers",
+                            choices=["linear", "soft_l1", "huber", "cauchy", "arctan"])
+    fit_parser.add_argument("--starts", help="number of starting points of the multistart engine", type=int)
+    fit_parser.add_argument("--bootstrap", help="number of bootstrap samples used to compute the 95%% intervals of "
+                                                "the parameters", type=int, default=0)
+    fit_parser.add_argument("--bootstrap-method", help="resample the residuals of the fit or the points",
+                            choices=["residuals", "points"], default="residuals")
+    fit_parser.add_argument("-w", "--watch", help="fit again every time new rows are appended to the data file "
+                                                  "(.txt and .csv only)", action="store_true")
+    fit_parser.add_argument("--interval", help="seconds between two checks of the watched file",
+                            type=float, default=1.0)
+    fit_parser.add_argument("-r", "--remote", help="send the fit to the fit server started with 'plafi serve' "
+                                                   "(the plot is never shown, it can be saved with --save-plot)",
+                            action="store_true")
+    fit_parser.add_argument("--socket", help="unix socket of the fit server", type=str)
+
+    # SERVER argument
+    serve_parser = subparsers.add_parser('serve', help='start the fit server, used by plafi fit --remote')
+    serve_parser.add_argument("--socket", help="path of the unix socket (default: $PLAFI_SOCKET or a file in the "
+                                               "temporary directory)", type=str)
+    serve_parser.add_argument("--port", help="also accept HTTP requests on this port of localhost", type=int)
+    serve_parser.add_argument("-j", "--jobs", help="number of worker processes (default: the number of CPUs)",
+                              type=positive_int)
+    serve_parser.add_argument("--root", help="directory that contains the files read and written by the requests "
+                                             "(default: the current working directory)", type=str)
+
+    # CONVERSION argument
+    convert_parser = subparsers.add_parser('convert', help='convert a datafile to the binary .npy/.npz format')
+    convert_parser.add_argument("path", help='path to the .txt, .xlsx or .csv datafile', type=str)
+    convert_parser.add_argument("-o", "--output", help="path of the converted file (.npy or .npz)", type=str)
+    convert_parser.add_argument("-r", "--rows-to-skip", help="number of rows to skip", type=int, default=0)
+
+    # CACHE argument
+    cache_parser = subparsers.add_parser('cache', help='manage the cache of the parsed data')
+    cache_parser.add_argument("action", help="show the cache statistics or delete all the entries",
+                              choices=["stats", "clear"])
 
     # CONSTANTS argument
     constants_parser = subparsers.add_parser('const', help='manage the constants')
@@ -32,31 +110,71 @@ def main():
     # arguments are converted into an argparser.Namespace object
     args = parser.parse_args()
 
+    # the server and its client import numpy only in the worker processes
+    if args.subparser == 'serve':
+        from . import server
+        server.serve(args.socket, args.port, args.jobs, args.root)
+        return
+    if args.subparser == 'fit' and args.remote:
+        # the options that the fit server does not support are rejected, instead of being ignored
+        unsupported = [option for option, used in [("-v", args.verbose), ("-c", args.configuration),
+                                                   ("--batch", args.batch), ("--global-fit", args.global_fit),
+                                                   ("--watch", args.watch), ("-j", args.jobs != 1),
+                                                   ("--bootstrap", args.bootstrap != 0)] if used]
+        if unsupported:
+            fit_parser.error("{} can not be used with --remote".format(", ".join(unsupported)))
+        from . import server
+        if args.path == None:
+            raise ValueError("A path to a configuration file must be passed")
+        server.remote_fitting_from_conf(args.path, args.socket, args.save_plot, args.engine, args.loss, args.starts)
+        return
+
+    # imported after the arguments parsing, so that the help messages do not import numpy
+    from . import functions as fc
+
+    # the plots that are not shown are rendered with the non-interactive Agg backend
+    if getattr(args, "save_plot", None) or getattr(args, "no_plot", False) or getattr(args, "batch", None):
+        import matplotlib
+        matplotlib.use("Agg")
+
     # MAIN IF STATEMENTS
     # plot case
     if args.subparser == 'plot':
         path = args.path
+        show_plot = not args.no_plot and args.save_plot is None
         if args.verbose:
-            fc.plot_data_verbose()
+            fc.plot_data_verbose(show_plot, args.save_plot)
         else:
             # an error is raised if the path is not passed or it does not exist
             if path == None:
                 raise ValueError("A path must be passed")
             elif not os.path.exists(path):
                 raise ValueError("The file does not exist")
+            elif args.watch:
+                if not show_plot:
+                    plot_parser.error("--watch can not be used with --no-plot or --save-plot")
+                fc.watch_plot(path, args.rows_to_skip, interval=args.interval)
             else:
                 try:
-                    data = fc.read_data(path)
-                    fc.plot_data(data)
+                    data = fc.read_data(path, args.rows_to_skip, chunk_size=args.chunk_size,
+                                        decimation=args.decimation, aggregate=args.aggregate)
                 except:
                     raise ValueError("It was not possible to read the file")
+                fc.plot_data(data, show_plot=show_plot, save_plot=args.save_plot)
 
     # fit case
     elif args.subparser == 'fit':
         if args.verbose:
-            fc.fitting_procedure()
+            fc.fitting_procedure(not args.no_plot and args.save_plot is None, args.save_plot)
         elif args.configuration:
             fc.initialize_conf_file()
+        elif args.global_fit:
+            show_plot = not args.no_plot and args.save_plot is None
+            fc.global_fitting_from_conf(args.global_fit, args.shared, show_plot, args.save_plot)
+        elif args.batch:
+            # the batch fits are performed headless
+            results = fc.batch_fitting(args.batch, args.output, args.plot_dir, args.jobs, args.warm_start)
+            print("{} fits saved in {}".format(len(results), args.output))
         else:
             path = args.path
             # an error is raised if the path is not passed or it does not exist
@@ -65,7 +183,28 @@ def main():
             elif not os.path.exists(path):
                 raise ValueError("The file does not exist")
             else:
-                fc.fitting_from_conf(path)
+                show_plot = not args.no_plot and args.save_plot is None
+                if args.watch:
+                    fc.watch_fit(path, show_plot, args.interval, engine=args.engine, loss=args.loss,
+                                 starts=args.starts)
+                else:
+                    fc.fitting_from_conf(path, show_plot, args.jobs, args.save_plot, args.engine, args.loss,
+                                         args.starts, args.bootstrap, args.bootstrap_method)
+
+    # convert case
+    elif args.subparser == 'convert':
+        if not os.path.exists(args.path):
+            raise ValueError("The file does not exist")
+        print("Data saved in", fc.convert_data(args.path, args.output, args.rows_to_skip))
+
+    # cache case
+    elif args.subparser == 'cache':
+        if args.action == "clear":
+            print("{} entries deleted".format(fc.clear_cache()))
+        else:
+            stats = fc.cache_stats()
+            print("directory: {}\nentries: {}\nsize: {:.1f} MB (max {:.1f} MB)".format(
+                stats["directory"], stats["entries"], stats["size"] / 1024 ** 2, stats["max size"] / 1024 ** 2))
 
     # const case
     elif args.subparser == 'const':
@@ -79,6 +218,10 @@ def main():
     else:
         print("Type 'plafi -h' to receive some help.")
 
+    # waiting for the plots saved in background
+    if args.subparser in ['plot', 'fit']:
+        fc.wait_for_plots()
+
 
 if __name__ == '__main__':
     main()
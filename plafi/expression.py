@@ -0,0 +1,511 @@
+import ast
+import collections
+import copy
+import numpy as np
+
+
+# functions that can be used in the fitting functions: numpy function that evaluates them and number of arguments.
+# They are the functions supported by numexpr, that evaluates the fitting functions.
+FUNCTIONS = {
+    "sin": (np.sin, 1), "cos": (np.cos, 1), "tan": (np.tan, 1),
+    "arcsin": (np.arcsin, 1), "arccos": (np.arccos, 1), "arctan": (np.arctan, 1), "arctan2": (np.arctan2, 2),
+    "sinh": (np.sinh, 1), "cosh": (np.cosh, 1), "tanh": (np.tanh, 1),
+    "arcsinh": (np.arcsinh, 1), "arccosh": (np.arccosh, 1), "arctanh": (np.arctanh, 1),
+    "exp": (np.exp, 1), "expm1": (np.expm1, 1),
+    "log": (np.log, 1), "log10": (np.log10, 1), "log2": (np.log2, 1), "log1p": (np.log1p, 1),
+    "sqrt": (np.sqrt, 1), "abs": (np.abs, 1), "hypot": (np.hypot, 2),
+    "floor": (np.floor, 1), "ceil": (np.ceil, 1), "minimum": (np.minimum, 2), "maximum": (np.maximum, 2),
+    "where": (np.where, 3),
+}
+
+_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow)
+_COMPARISONS = (ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+
+
+def _error(
+        text: str,  # expression
+        start: int,  # offset of the first character of the wrong token
+        end: int,  # offset after the last character of the wrong token
+        message: str  # description of the error
+) -> NameError:
+
+    """
+    Notes
+    -----
+    This function returns the error raised for a wrong expression, with the expression and a caret line
+    pointing at the wrong token.
+    """
+
+    start = max(0, min(start, len(text)))
+    end = max(start + 1, min(end, len(text)))
+    return NameError("{}:\n    {}\n    {}{}".format(message, text, " " * start, "^" * (end - start)))
+
+
+def _node_error(
+        text: str,  # expression
+        node: ast.AST,  # wrong node
+        message: str  # description of the error
+) -> NameError:
+    return _error(text, node.col_offset, node.end_col_offset, message)
+
+
+def parse_tree(
+        str_funct: str
+) -> ast.Expression:
+
+    """
+    Parameters
+    ----------
+    str_funct (str): fitting function written as string
+
+    Returns
+    -------
+    tree (ast.Expression): syntax tree of <str_funct>
+
+    Notes
+    -----
+    An error pointing at the wrong token is raised if <str_funct> is not a valid expression.
+    """
+
+    text = str_funct.strip()
+    try:
+        return ast.parse(text, mode="eval")
+    except SyntaxError as error:
+        offset = (error.offset or 1) - 1
+        raise _error(text, offset, offset + 1, "invalid syntax") from None
+
+
+def _check(
+        node: ast.AST,  # node to check
+        text: str,  # expression, used in the error messages
+        names: set,  # names of the variables and of the constants
+        condition: bool = False  # True if the node is the condition of where()
+):
+
+    """
+    Notes
+    -----
+    This function raises an error pointing at the first node of the expression that can not be used.
+    """
+
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise _node_error(text, node, "{} is not a number".format(ast.unparse(node)))
+    elif isinstance(node, ast.Name):
+        if node.id in FUNCTIONS and node.id not in names:
+            raise _node_error(text, node, "{} is a function, it must be called".format(node.id))
+        if node.id not in names:
+            raise _node_error(text, node, "{} can not be used".format(node.id))
+    elif isinstance(node, ast.BinOp) and isinstance(node.op, _OPERATORS):
+        _check(node.left, text, names)
+        _check(node.right, text, names)
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        _check(node.operand, text, names)
+    elif isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+            raise _node_error(text, node.func, "{} can not be used".format(ast.unparse(node.func)))
+        name, (_, num_args) = node.func.id, FUNCTIONS[node.func.id]
+        if node.keywords or len(node.args) != num_args:
+            raise _node_error(text, node, "{} takes {} argument{}".format(name, num_args, "s" * (num_args > 1)))
+        for idx, arg in enumerate(node.args):
+            _check(arg, text, names, condition=name == "where" and idx == 0)
+    elif isinstance(node, ast.Compare) and condition:
+        if not all(isinstance(op, _COMPARISONS) for op in node.ops):
+            raise _node_error(text, node, "{} can not be used".format(ast.unparse(node)))
+        for operand in [node.left] + node.comparators:
+            _check(operand, text, names)
+    else:
+        raise _node_error(text, node, "{} can not be used".format(ast.unparse(node)))
+
+
+def parse_expression(
+        str_funct: str,
+        variables: list,
+        constants: dict
+) -> ast.Expression:
+
+    """
+    Parameters
+    ----------
+    str_funct (str): fitting function written as string
+    variables (list): names of the variables
+    constants (dict): dictionary with the names of the constants and their values
+
+    Returns
+    -------
+    tree (ast.Expression): syntax tree of <str_funct>, with the constants folded
+
+    Notes
+    -----
+    This function is the front end of the fitting functions. The expression is parsed once, and it can
+    only contain numbers, <variables>, <constants>, the operators + - * / ** and the functions in FUNCTIONS
+    (the comparisons are allowed only as the condition of where()). An error pointing at the first token that
+    can not be used is raised otherwise.
+    The constants are then written as literals, and the operations between literals are computed, so that
+    they are not computed again at every evaluation.
+    """
+
+    tree = parse_tree(str_funct)
+    _check(tree.body, str_funct.strip(), set(variables) | set(constants))
+    constants = {name: value for name, value in constants.items() if name not in variables}
+    return ast.fix_missing_locations(_ConstantFolder(constants).visit(tree))
+
+
+class _ConstantFolder(ast.NodeTransformer):
+    """
+    Notes
+    -----
+    This transformer replaces the names of the constants with their values, so that they are
+    written in the expression as literals, and computes the operations between literals.
+    """
+
+    def __init__(self, constants: dict):
+        self.constants = constants
+
+    def visit_Name(self, node: ast.Name) -> ast.AST:
+        if node.id in self.constants:
+            return ast.copy_location(_constant(self.constants[node.id]), node)
+        return node
+
+    def visit_BinOp(self, node: ast.BinOp) -> ast.AST:
+        self.generic_visit(node)
+        if isinstance(node.op, _OPERATORS):
+            return ast.copy_location(_BUILDERS[type(node.op)](node.left, node.right), node)
+        return node
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.AST:
+        self.generic_visit(node)
+        if isinstance(node.op, ast.USub):
+            return ast.copy_location(_neg(node.operand), node)
+        if isinstance(node.op, ast.UAdd):
+            return node.operand
+        return node
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        self.generic_visit(node)
+        name = node.func.id if isinstance(node.func, ast.Name) else None
+        if name in FUNCTIONS and name != "where" and all(_is_constant(arg) for arg in node.args):
+            with np.errstate(all="ignore"):
+                value = FUNCTIONS[name][0](*[arg.value for arg in node.args])
+            return ast.copy_location(_constant(value), node)
+        return node
+
+
+def _constant(value: float) -> ast.Constant:
+    return ast.Constant(float(value))
+
+
+def _is_constant(node: ast.AST, value: float = None) -> bool:
+    # True if <node> is a numeric literal (equal to <value> if given)
+    if not isinstance(node, ast.Constant) or isinstance(node.value, bool):
+        return False
+    return value is None or node.value == value
+
+
+def _add(left: ast.AST, right: ast.AST) -> ast.AST:
+    if _is_constant(left) and _is_constant(right):
+        return _constant(left.value + right.value)
+    if _is_constant(left, 0):
+        return right
+    if _is_constant(right, 0):
+        return left
+    return ast.BinOp(left, ast.Add(), right)
+
+
+def _sub(left: ast.AST, right: ast.AST) -> ast.AST:
+    if _is_constant(left) and _is_constant(right):
+        return _constant(left.value - right.value)
+    if _is_constant(right, 0):
+        return left
+    if _is_constant(left, 0):
+        return _neg(right)
+    return ast.BinOp(left, ast.Sub(), right)
+
+
+def _mul(left: ast.AST, right: ast.AST) -> ast.AST:
+    if _is_constant(left) and _is_constant(right):
+        return _constant(left.value * right.value)
+    if _is_constant(left, 0) or _is_constant(right, 0):
+        return _constant(0)
+    if _is_constant(left, 1):
+        return right
+    if _is_constant(right, 1):
+        return left
+    return ast.BinOp(left, ast.Mult(), right)
+
+
+def _div(left: ast.AST, right: ast.AST) -> ast.AST:
+    if _is_constant(left) and _is_constant(right):
+        with np.errstate(all="ignore"):
+            return _constant(np.divide(np.float64(left.value), right.value))
+    if _is_constant(left, 0):
+        return _constant(0)
+    if _is_constant(right, 1):
+        return left
+    return ast.BinOp(left, ast.Div(), right)
+
+
+def _pow(left: ast.AST, right: ast.AST) -> ast.AST:
+    if _is_constant(left) and _is_constant(right):
+        with np.errstate(all="ignore"):
+            return _constant(np.power(np.float64(left.value), right.value))
+    if _is_constant(right, 1):
+        return left
+    if _is_constant(right, 0):
+        return _constant(1)
+    return ast.BinOp(left, ast.Pow(), right)
+
+
+def _neg(node: ast.AST) -> ast.AST:
+    if _is_constant(node):
+        return _constant(-node.value)
+    return ast.UnaryOp(ast.USub(), node)
+
+
+def _call(name: str, *args: ast.AST) -> ast.AST:
+    return ast.Call(ast.Name(name, ast.Load()), list(args), [])
+
+
+# functions used to build (and simplify) the binary operations
+_BUILDERS = {ast.Add: _add, ast.Sub: _sub, ast.Mult: _mul, ast.Div: _div, ast.Pow: _pow}
+
+# derivatives of the functions of one argument supported by numexpr, written as function of the argument u
+_DERIVATIVES = {
+    "sin": lambda u: _call("cos", u),
+    "cos": lambda u: _neg(_call("sin", u)),
+    "tan": lambda u: _div(_constant(1), _pow(_call("cos", u), _constant(2))),
+    "arcsin": lambda u: _div(_constant(1), _call("sqrt", _sub(_constant(1), _pow(u, _constant(2))))),
+    "arccos": lambda u: _div(_constant(-1), _call("sqrt", _sub(_constant(1), _pow(u, _constant(2))))),
+    "arctan": lambda u: _div(_constant(1), _add(_constant(1), _pow(u, _constant(2)))),
+    "sinh": lambda u: _call("cosh", u),
+    "cosh": lambda u: _call("sinh", u),
+    "tanh": lambda u: _div(_constant(1), _pow(_call("cosh", u), _constant(2))),
+    "arcsinh": lambda u: _div(_constant(1), _call("sqrt", _add(_pow(u, _constant(2)), _constant(1)))),
+    "arccosh": lambda u: _div(_constant(1), _call("sqrt", _sub(_pow(u, _constant(2)), _constant(1)))),
+    "arctanh": lambda u: _div(_constant(1), _sub(_constant(1), _pow(u, _constant(2)))),
+    "exp": lambda u: _call("exp", u),
+    "expm1": lambda u: _call("exp", u),
+    "log": lambda u: _div(_constant(1), u),
+    "log10": lambda u: _div(_constant(1), _mul(u, _constant(np.log(10)))),
+    "log2": lambda u: _div(_constant(1), _mul(u, _constant(np.log(2)))),
+    "log1p": lambda u: _div(_constant(1), _add(_constant(1), u)),
+    "sqrt": lambda u: _div(_constant(0.5), _call("sqrt", u)),
+    "abs": lambda u: _call("where", ast.Compare(u, [ast.Lt()], [_constant(0)]), _constant(-1), _constant(1)),
+}
+
+
+def differentiate(
+        node: ast.AST,
+        var: str
+) -> ast.AST:
+
+    """
+    Parameters
+    ----------
+    node (ast.AST): expression to differentiate
+    var (str): name of the variable with respect to the expression is differentiated
+
+    Returns
+    -------
+    derivative (ast.AST): derivative of <node> with respect to <var>
+
+    Notes
+    -----
+    The derivative is computed symbolically, applying the differentiation rules to the nodes of the expression.
+    Trivial operations (sum of zeros, product by one, ...) are simplified while the derivative is built.
+    An error is raised if the expression contains an operation that can not be differentiated.
+    """
+
+    if isinstance(node, ast.Expression):
+        return differentiate(node.body, var)
+    if isinstance(node, ast.Constant):
+        return _constant(0)
+    if isinstance(node, ast.Name):
+        return _constant(1 if node.id == var else 0)
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        d_operand = differentiate(node.operand, var)
+        return _neg(d_operand) if isinstance(node.op, ast.USub) else d_operand
+
+    if isinstance(node, ast.BinOp):
+        u, v = node.left, node.right
+        du, dv = differentiate(u, var), differentiate(v, var)
+        if isinstance(node.op, ast.Add):
+            return _add(du, dv)
+        if isinstance(node.op, ast.Sub):
+            return _sub(du, dv)
+        if isinstance(node.op, ast.Mult):
+            return _add(_mul(du, v), _mul(u, dv))
+        if isinstance(node.op, ast.Div):
+            if _is_constant(dv, 0):
+                return _div(du, v)
+            return _div(_sub(_mul(du, v), _mul(u, dv)), _pow(v, _constant(2)))
+        if isinstance(node.op, ast.Pow):
+            if _is_constant(dv, 0):
+                # power rule, the exponent does not depend on <var>
+                exponent = _sub(v, _constant(1))
+                return _mul(_mul(v, _pow(u, exponent)), du)
+            # general rule: d(u**v) = u**v * (dv*log(u) + v*du/u)
+            return _mul(node, _add(_mul(dv, _call("log", u)), _div(_mul(v, du), u)))
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+        name, args = node.func.id, node.args
+        if name in _DERIVATIVES and len(args) == 1:
+            return _mul(_DERIVATIVES[name](args[0]), differentiate(args[0], var))
+        if name == "arctan2" and len(args) == 2:
+            a, b = args
+            da, db = differentiate(a, var), differentiate(b, var)
+            numerator = _sub(_mul(b, da), _mul(a, db))
+            return _div(numerator, _add(_pow(a, _constant(2)), _pow(b, _constant(2))))
+
+    raise NameError("{} can not be differentiated".format(ast.unparse(node)))
+
+
+def _is_composite(node: ast.AST) -> bool:
+    # True if <node> is an operation, that can be computed once and reused
+    return isinstance(node, (ast.BinOp, ast.UnaryOp, ast.Call, ast.Compare))
+
+
+def eliminate_common_subexpressions(
+        nodes: list
+) -> [list, list]:
+
+    """
+    Parameters
+    ----------
+    nodes (list): expressions (ast.AST) evaluated together
+
+    Returns
+    -------
+    assignments (list): list of (name, expression) of the subexpressions that are repeated in <nodes>, in the
+                        order in which they must be computed. The names are _t0, _t1, ...
+    expressions (list): <nodes> with the repeated subexpressions replaced by their names
+
+    Notes
+    -----
+    The subexpressions are compared by structure, so that an operation repeated in the same expression or in
+    different ones (i.e. in the partial derivatives of a fitting function) is computed only once.
+    <nodes> are not modified.
+    """
+
+    counts = collections.Counter(ast.dump(sub) for node in nodes for sub in ast.walk(node) if _is_composite(sub))
+    assignments, names = [], {}
+
+    def replace(node):
+        if not _is_composite(node):
+            return node
+        key = ast.dump(node)
+        if key in names:
+            return ast.Name(names[key], ast.Load())
+        new_node = copy.copy(node)
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, list):
+                setattr(new_node, field, [replace(item) if isinstance(item, ast.AST) else item for item in value])
+            elif isinstance(value, ast.AST):
+                setattr(new_node, field, replace(value))
+        if counts[key] > 1:
+            names[key] = "_t{}".format(len(assignments))
+            assignments.append((names[key], new_node))
+            return ast.Name(names[key], ast.Load())
+        return new_node
+
+    expressions = [replace(node.body if isinstance(node, ast.Expression) else node) for node in nodes]
+    return assignments, expressions
+
+
+def compile_expression(
+        str_funct: str,
+        variables: list,
+        constants: dict
+) -> callable:
+
+    """
+    Parameters
+    ----------
+    str_funct (str): fitting function written as string
+    variables (list): names of the variables, in the order they are passed to the evaluator
+    constants (dict): dictionary with the names of the constants and their values
+
+    Returns
+    -------
+    evaluate (callable): function that evaluates <str_funct> given the values of <variables>
+
+    Notes
+    -----
+    The expression is checked and folded with parse_expression(), and compiled once into a numexpr program,
+    that also computes only once the subexpressions that are repeated. The program only takes as input the
+    variables that are actually used in the expression, the other ones are dropped by the returned evaluator.
+    The result has the shape of the first variable also if the folded expression does not depend on it.
+    An error pointing at the wrong token is raised if the expression can not be used.
+    """
+
+    import numexpr as ne
+
+    tree = parse_expression(str_funct, variables, constants)
+    used_names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+    used_indexes = [idx for idx, name in enumerate(variables) if name in used_names]
+    signature = [(variables[idx], np.double) for idx in used_indexes]
+    program = ne.NumExpr(ast.unparse(tree), signature=signature)
+
+    if len(used_indexes) == len(variables):
+        evaluate = program
+    elif 0 in used_indexes:
+        def evaluate(*values):
+            return program(*[values[idx] for idx in used_indexes])
+    else:
+        # the folded expression does not depend on the independent variable (i.e. 0*x+var1), the result is
+        # anyway an array with the shape of the independent variable
+        def evaluate(*values):
+            return np.full(np.shape(values[0]), program(*[values[idx] for idx in used_indexes]))
+
+    return evaluate
+
+
+# names available to the evaluators generated by compile_jacobian()
+_NAMESPACE = {**{name: function for name, (function, _) in FUNCTIONS.items()},
+              "empty": np.empty, "size": np.size, "errstate": np.errstate}
+
+
+def compile_jacobian(
+        str_funct: str,
+        variables: list,
+        constants: dict
+) -> callable:
+
+    """
+    Parameters
+    ----------
+    str_funct (str): fitting function written as string
+    variables (list): names of the variables, the first one is the independent variable and the others are
+                      the fitting parameters
+    constants (dict): dictionary with the names of the constants and their values
+
+    Returns
+    -------
+    jacobian (callable): function that returns the matrix of the derivatives of <str_funct> with respect to
+                         the fitting parameters, with shape (number of points, number of parameters)
+
+    Notes
+    -----
+    Every partial derivative is obtained symbolically with differentiate(). The subexpressions shared by
+    the partial derivatives (i.e. the argument of a sine, and the cosine that is the derivative of the sine) are
+    computed once with eliminate_common_subexpressions(), and the whole matrix is computed by a single python
+    function, generated and compiled once. The returned function can be passed as <jac> to
+    scipy.optimize.curve_fit.
+    An error is raised if the expression can not be used or differentiated.
+    """
+
+    tree = parse_expression(str_funct, variables, constants)
+    partials = [differentiate(tree, var) for var in variables[1:]]
+    assignments, expressions = eliminate_common_subexpressions(partials)
+
+    lines = ["def jacobian({}):".format(", ".join(variables)),
+             "    with errstate(divide='ignore', invalid='ignore', over='ignore'):"]
+    lines += ["        {} = {}".format(name, ast.unparse(node)) for name, node in assignments]
+    lines.append("        jac = empty((size({}), {}), order='F')".format(variables[0], len(expressions)))
+    lines += ["        jac[:, {}] = {}".format(idx, ast.unparse(node)) for idx, node in enumerate(expressions)]
+    lines.append("    return jac")
+
+    namespace = dict(_NAMESPACE)
+    exec(compile("\n".join(lines), "<jacobian of {}>".format(str_funct.strip()), "exec"), namespace)
+    return namespace["jacobian"]
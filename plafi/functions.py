@@ -1,23 +1,35 @@
+from __future__ import annotations
 import types
-import matplotlib.figure
+import functools
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
-from uncertainties import ufloat
-import numexpr as ne
 import os
-from tabulate import tabulate
 import sys
+import glob
 import configparser
-
+import struct
+import zipfile
+import hashlib
+import csv
+import re
+import inspect
+import ast
+
+# matplotlib, pandas, scipy, uncertainties, tabulate and openpyxl are imported inside the functions that use them,
+# so that every plafi subcommand imports only the modules it needs
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import graphics
+from . import expression as ex
+from . import models
 
 
 def read_data(
         path_to_data: str,
-        rows_to_skip: int = 0
+        rows_to_skip: int = 0,
+        columns: list = None,
+        chunk_size: int = None,
+        decimation: int = 1,
+        aggregate: bool = False,
+        sheet: int = 0
 ) -> np.ndarray:
 
     """
@@ -25,35 +37,654 @@ def read_data(
     ----------
     path_to_data (str): path to datafile
     rows_to_skip (int): number of rows to skip when the datafile is read
+    columns (list): indexes of the columns to read, if None all the columns are read
+    chunk_size (int): number of rows parsed at a time, if None the whole file is parsed at once
+    decimation (int): when the file is read in chunks, only one row every <decimation> is kept
+    aggregate (bool): if True, the mean of every block of <decimation> rows is kept instead of a single row
+    sheet (int | str): index or name of the sheet of .xlsx files
 
     Returns
     -------
-    data (np.ndarray): matrix with the data
+    data (np.ndarray): matrix with the data, every column is contiguous in memory
 
     Notes
     -----
     This function read <path_to_data> and returns the data contained in it.
     It skips the first <rows_to_skip> rows.
     The function can read .txt, .xlsx and .csv (with ";" as separator) files.
+    Binary .npy and .npz files (see convert_data()) are memory-mapped, so they are opened in constant time and
+    their columns are read only when they are used.
+    The parsed .txt, .xlsx and .csv files are stored in an on-disk cache (see _read_cached_data()), so
+    the following reads of the same unmodified file are memory-mapped too.
+    The memory-mapped arrays are copy-on-write: they can be modified as any other array, and the changes are
+    never written to the file or to the cache.
+    If <columns> is given, the returned matrix contains only those columns, in the given order, and only
+    those columns are parsed (and cached).
+    .txt and .csv files can be read in chunks of <chunk_size> rows, parsing only <columns> as float64 and
+    decimating or aggregating the rows as they are read, so that the memory used does not depend on the
+    size of the file.
     """
 
-    # reading data in <path_to_data> depending on its extension (.txt, .xlsx or .csv)
-    if path_to_data.endswith(".txt"):
-        data = np.loadtxt(path_to_data, skiprows=rows_to_skip)
-    elif path_to_data.endswith(".xlsx"):
-        data = pd.read_excel(path_to_data, header=None, skiprows=rows_to_skip).to_numpy()
-    elif path_to_data.endswith(".csv"):
-        data = pd.read_csv(path_to_data, delimiter=";", header=None, skiprows=rows_to_skip).to_numpy()
+    if chunk_size is not None:
+        if not (path_to_data.endswith(".txt") or path_to_data.endswith(".csv")):
+            raise NameError("Only .txt and .csv files can be read in chunks")
+        return _read_data_chunks(path_to_data, rows_to_skip, columns, chunk_size, decimation, aggregate)
+
+    # reading data in <path_to_data> depending on its extension (.txt, .xlsx, .csv, .npy or .npz)
+    if path_to_data.endswith(".npy"):
+        data = np.load(path_to_data, mmap_mode="c")
+    elif path_to_data.endswith(".npz"):
+        data = _load_npz(path_to_data)
+    elif path_to_data.endswith(".txt") or path_to_data.endswith(".xlsx") or path_to_data.endswith(".csv"):
+        return _read_cached_data(path_to_data, rows_to_skip, sheet, columns)
     else:
         # an error is raised if the extension is not between the one that can be read
         raise NameError("Could not read this file")
+
+    if columns is not None:
+        data = np.asfortranarray(data[:, columns])
+    return data
+
+
+def _parse_data(
+        path_to_data: str,  # path to a .txt, .xlsx or .csv datafile
+        rows_to_skip: int,  # number of rows to skip
+        sheet: int,  # index or name of the sheet of .xlsx files
+        columns: list = None  # indexes of the columns to parse, None for all the columns
+) -> np.ndarray:
+
+    """
+    Notes
+    -----
+    This function parses a .txt, .xlsx or .csv file, without using the cache. Only <columns> are parsed,
+    and they are returned in the given order, in a column-major matrix.
+    """
+
+    if path_to_data.endswith(".txt"):
+        data = np.loadtxt(path_to_data, skiprows=rows_to_skip, usecols=columns, ndmin=2)
+    elif path_to_data.endswith(".xlsx"):
+        data = _read_xlsx(path_to_data, rows_to_skip, sheet, columns)
+    else:
+        import pandas as pd
+        columns = _text_columns(path_to_data, rows_to_skip, ";", columns)
+        data = pd.read_csv(path_to_data, delimiter=";", header=None, skiprows=rows_to_skip, usecols=columns)
+        # usecols does not keep the order of the columns
+        data = (data if columns is None else data[columns]).to_numpy()
+    return np.asfortranarray(data)
+
+
+def _text_columns(
+        path_to_data: str,  # path to a .txt or .csv datafile
+        rows_to_skip: int,  # number of rows to skip
+        separator: str,  # separator of the columns
+        columns: list  # indexes of the columns to read, None for all the columns
+) -> list:
+
+    """
+    Notes
+    -----
+    This function returns <columns> with the negative indexes referred to the number of columns of the first
+    row of data (as data.T[idx] does), so that they can be used to select the columns that are parsed.
+    """
+
+    if columns is None or min(columns) >= 0:
+        return columns
+
+    import pandas as pd
+
+    num_columns = pd.read_csv(path_to_data, sep=separator, header=None, skiprows=rows_to_skip, nrows=1).shape[1]
+    return [idx + num_columns if idx < 0 else idx for idx in columns]
+
+
+def _read_xlsx(
+        path_to_data: str,
+        rows_to_skip: int = 0,
+        sheet: int = 0,
+        columns: list = None
+) -> np.ndarray:
+
+    """
+    Parameters
+    ----------
+    path_to_data (str): path to a .xlsx datafile
+    rows_to_skip (int): number of rows to skip
+    sheet (int | str): index or name of the sheet
+    columns (list): indexes of the columns to read, if None all the columns are read
+
+    Returns
+    -------
+    data (np.ndarray): float64 matrix with the data, the empty cells are nan
+
+    Notes
+    -----
+    The workbook is opened in read-only mode, so that its rows are streamed from the file instead of building
+    the whole workbook in memory. The values of every row are written directly into a preallocated array.
+    The negative indexes of <columns> are referred to the last filled column of the sheet.
+    """
+
+    if columns is not None and min(columns) < 0:
+        # the last filled column is known only once the whole sheet is read
+        return np.asfortranarray(_read_xlsx(path_to_data, rows_to_skip, sheet)[:, columns])
+
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(path_to_data, read_only=True, data_only=True)
+    try:
+        worksheet = workbook.worksheets[sheet] if isinstance(sheet, int) else workbook[sheet]
+        if columns is None:
+            min_column, max_column = None, None
+        else:
+            min_column, max_column = min(columns) + 1, max(columns) + 1
+        rows = worksheet.iter_rows(min_row=rows_to_skip + 1, min_col=min_column, max_col=max_column,
+                                   values_only=True)
+
+        # the number of rows written in the sheet is used as first estimate of the array size
+        capacity = max((worksheet.max_row or 0) - rows_to_skip, 1)
+        data = None
+        num_rows = 0
+        for row in rows:
+            if columns is not None:
+                row = [row[idx - min_column + 1] for idx in columns]
+            if data is None:
+                data = np.empty((capacity, len(row)))
+            elif num_rows == len(data):
+                data = np.concatenate([data, np.empty_like(data)])
+            try:
+                data[num_rows] = row
+            except (TypeError, ValueError):
+                # empty cells are read as None, the other cells that are not numbers raise an error
+                data[num_rows] = [_xlsx_cell_value(value, rows_to_skip + num_rows + 1,
+                                                   idx if columns is None else columns[idx])
+                                  for idx, value in enumerate(row)]
+            num_rows += 1
+    finally:
+        workbook.close()
+
+    if data is None:
+        raise NameError("The file does not contain any data")
+    data = data[:num_rows]
+
+    # the empty rows at the end of the sheet (and the empty columns, if not selected) are dropped
+    empty = np.isnan(data)
+    filled_rows = np.flatnonzero(~np.all(empty, axis=1))
+    data = data[:filled_rows[-1] + 1 if len(filled_rows) else 0]
+    if columns is None:
+        filled_columns = np.flatnonzero(~np.all(empty, axis=0))
+        data = data[:, :filled_columns[-1] + 1 if len(filled_columns) else 0]
+    return data
+
+
+def _xlsx_cell_value(
+        value,  # value of the cell read by openpyxl
+        row: int,  # row of the cell in the sheet, starting from 1
+        column: int  # index of the column of the cell, starting from 0
+) -> float:
+
+    """
+    Notes
+    -----
+    This function returns the value of a cell of a .xlsx file as float, nan if the cell is empty.
+    If the cell does not contain a number an error is raised with its position in the sheet, i.e. B3.
+    """
+
+    if value is None:
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        from openpyxl.utils import get_column_letter
+
+        raise NameError("The cell {}{} of the sheet is not a number: {!r}".format(get_column_letter(column + 1), row,
+                                                                                  value)) from None
+
+
+def _read_cached_data(
+        path_to_data: str,  # path to a .txt, .xlsx or .csv datafile
+        rows_to_skip: int,  # number of rows to skip
+        sheet: int,  # index or name of the sheet of .xlsx files
+        columns: list = None  # indexes of the columns to read, None for all the columns
+) -> np.ndarray:
+
+    """
+    Notes
+    -----
+    This function returns the data of a .txt, .xlsx or .csv file, using the on-disk cache.
+    The parsed arrays are saved as .npy in the cache directory (see cache_directory()), with a name obtained from
+    the absolute path, size and modification time of the file, <rows_to_skip>, <sheet> and <columns>: a modified
+    file is parsed again. The cache hits are memory-mapped, and the least recently used files are deleted
+    when the cache is bigger than its maximum size.
+    If only some columns are requested, they are taken from the cache entry of the whole file if it exists,
+    otherwise only they are parsed and cached.
+    """
+
+    max_size = _cache_max_size()
+    if max_size <= 0:
+        return _parse_data(path_to_data, rows_to_skip, sheet, columns)
+
+    stat = os.stat(path_to_data)
+    file_key = (os.path.abspath(path_to_data), stat.st_size, stat.st_mtime_ns, rows_to_skip, sheet)
+    cache_path = _cache_entry_path(file_key, columns)
+
+    data = _load_cache_entry(cache_path)
+    if data is None and columns is not None:
+        data = _load_cache_entry(_cache_entry_path(file_key, None))
+        if data is not None:
+            return np.asfortranarray(data[:, columns])
+    if data is not None:
+        return data
+
+    data = _parse_data(path_to_data, rows_to_skip, sheet, columns)
+    if data.dtype.kind in "iuf" and data.nbytes <= max_size:
+        # the cached data are float64 in column-major order, the returned ones are the same of a cache hit
+        data = np.asfortranarray(data, dtype=np.float64)
+        os.makedirs(cache_directory(), exist_ok=True)
+        # the entry is written in a temporary file and then renamed, so that it is never read partially written
+        temporary_path = "{}.{}.tmp".format(cache_path, os.getpid())
+        with open(temporary_path, "wb") as f:
+            np.save(f, data)
+        os.replace(temporary_path, cache_path)
+        _evict_cache(max_size)
     return data
 
 
+def _cache_entry_path(
+        file_key: tuple,  # absolute path, size, modification time, rows to skip and sheet of the datafile
+        columns: list  # indexes of the cached columns, None for all the columns
+) -> str:
+
+    """
+    Notes
+    -----
+    This function returns the path of the cache entry of the given columns of a datafile.
+    """
+
+    key = repr(file_key if columns is None else file_key + (tuple(int(idx) for idx in columns),))
+    return os.path.join(cache_directory(), hashlib.sha1(key.encode()).hexdigest() + ".npy")
+
+
+def _load_cache_entry(
+        cache_path: str  # path of the cache entry
+) -> np.ndarray:
+
+    """
+    Notes
+    -----
+    This function memory-maps a cache entry (copy-on-write) and marks it as recently used. It returns None if the entry
+    does not exist or it can not be read.
+    """
+
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        data = np.load(cache_path, mmap_mode="c")
+        os.utime(cache_path)  # the modification time is used for the LRU eviction
+        return data
+    except (OSError, ValueError):
+        return None  # corrupted or concurrently deleted entry, the file is parsed again
+
+
+def cache_directory(
+
+) -> str:
+
+    """
+    Returns
+    -------
+    directory (str): directory of the data cache
+
+    Notes
+    -----
+    The directory can be set with the environment variable PLAFI_CACHE_DIR, the default one is ~/.cache/plafi.
+    """
+
+    return os.environ.get("PLAFI_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "plafi")
+
+
+def _cache_max_size(
+
+) -> int:
+
+    """
+    Notes
+    -----
+    This function returns the maximum size of the data cache in bytes, set in MB with the environment
+    variable PLAFI_CACHE_SIZE (1024 MB by default). A size of 0 disables the cache.
+    """
+
+    return int(float(os.environ.get("PLAFI_CACHE_SIZE", 1024)) * 1024 ** 2)
+
+
+def _cache_entries(
+
+) -> list:
+
+    """
+    Notes
+    -----
+    This function returns a list of (path, size, modification time) of the cache entries,
+    from the least recently used.
+    """
+
+    directory = cache_directory()
+    if not os.path.isdir(directory):
+        return []
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(".npy"):
+            stat = entry.stat()
+            entries.append((entry.path, stat.st_size, stat.st_mtime_ns))
+    return sorted(entries, key=lambda entry: entry[2])
+
+
+def _evict_cache(
+        max_size: int  # maximum size of the cache in bytes
+):
+
+    """
+    Notes
+    -----
+    This function deletes the least recently used cache entries until the cache is smaller than <max_size>.
+    """
+
+    entries = _cache_entries()
+    total_size = sum(size for _, size, _ in entries)
+    for path, size, _ in entries:
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+
+def cache_stats(
+
+) -> dict:
+
+    """
+    Returns
+    -------
+    stats (dict): directory, number of entries, size and maximum size (in bytes) of the data cache
+    """
+
+    entries = _cache_entries()
+    return {"directory": cache_directory(), "entries": len(entries),
+            "size": sum(size for _, size, _ in entries), "max size": _cache_max_size()}
+
+
+def clear_cache(
+
+) -> int:
+
+    """
+    Returns
+    -------
+    removed (int): number of deleted cache entries
+
+    Notes
+    -----
+    This function deletes all the entries of the data cache.
+    """
+
+    entries = _cache_entries()
+    for path, _, _ in entries:
+        os.remove(path)
+    return len(entries)
+
+
+def _load_npz(
+        path_to_data: str  # path to a .npz file
+) -> np.ndarray:
+
+    """
+    Notes
+    -----
+    This function returns the array named "data" (or the first one) of a .npz file. If the array is
+    stored without compression it is memory-mapped, otherwise it is loaded in memory.
+    """
+
+    with zipfile.ZipFile(path_to_data) as archive:
+        names = archive.namelist()
+        if len(names) == 0:
+            raise NameError("The file does not contain any data")
+        info = archive.getinfo("data.npy" if "data.npy" in names else names[0])
+
+    if info.compress_type != zipfile.ZIP_STORED:
+        with np.load(path_to_data) as npz_file:
+            return npz_file[info.filename[:-len(".npy")]]
+
+    with open(path_to_data, "rb") as f:
+        # the array starts after the local header of the zip member
+        f.seek(info.header_offset)
+        local_header = f.read(30)
+        name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    return np.memmap(path_to_data, dtype=dtype, mode="c", offset=offset, shape=shape,
+                     order="F" if fortran_order else "C")
+
+
+def convert_data(
+        path_to_data: str,
+        output_path: str = None,
+        rows_to_skip: int = 0
+) -> str:
+
+    """
+    Parameters
+    ----------
+    path_to_data (str): path to a .txt, .xlsx or .csv datafile
+    output_path (str): path of the converted file (.npy or .npz), if None it is <path_to_data> with .npy extension
+    rows_to_skip (int): number of rows to skip when the datafile is read
+
+    Returns
+    -------
+    output_path (str): path of the converted file
+
+    Notes
+    -----
+    This function converts a datafile into the binary .npy (or uncompressed .npz) format, that read_data() can
+    memory-map. The data are saved as float64 in column-major order, so that every column is contiguous
+    and can be sliced without copies.
+    """
+
+    if output_path is None:
+        output_path = os.path.splitext(path_to_data)[0] + ".npy"
+    if not (output_path.endswith(".npy") or output_path.endswith(".npz")):
+        raise NameError("The converted file must be .npy or .npz")
+
+    data = np.asfortranarray(read_data(path_to_data, rows_to_skip), dtype=np.float64)
+    if output_path.endswith(".npy"):
+        np.save(output_path, data)
+    else:
+        np.savez(output_path, data=data)
+    return output_path
+
+
+def _read_data_chunks(
+        path_to_data: str,  # path to a .txt or .csv datafile
+        rows_to_skip: int,  # number of rows to skip
+        columns: list,  # indexes of the columns to read, None for all the columns
+        chunk_size: int,  # number of rows parsed at a time
+        decimation: int,  # one row every <decimation> is kept
+        aggregate: bool  # if True, the blocks of <decimation> rows are averaged
+) -> np.ndarray:
+
+    """
+    Notes
+    -----
+    This function reads a .txt or .csv file in chunks of <chunk_size> rows. Only <columns> are parsed,
+    directly as float64, and every chunk is decimated (or aggregated) before the next one is read.
+    """
+
+    import pandas as pd
+
+    if decimation < 1:
+        raise NameError("The decimation must be a positive integer")
+
+    separator = ";" if path_to_data.endswith(".csv") else r"\s+"
+    columns = _text_columns(path_to_data, rows_to_skip, separator, columns)
+    reader = pd.read_csv(path_to_data, sep=separator, header=None, skiprows=rows_to_skip, usecols=columns,
+                         dtype=np.float64, chunksize=chunk_size, engine="c")
+
+    blocks = []
+    rows_read = 0
+    remainder = None  # rows of an incomplete block, when the data are aggregated
+    with reader:
+        for chunk in reader:
+            # usecols does not keep the order of the columns
+            values = (chunk if columns is None else chunk[columns]).to_numpy(dtype=np.float64)
+            if aggregate:
+                if remainder is not None:
+                    values = np.concatenate([remainder, values])
+                num_blocks = len(values) // decimation
+                blocks.append(values[:num_blocks * decimation].reshape(num_blocks, decimation, -1).mean(axis=1))
+                remainder = values[num_blocks * decimation:]
+            else:
+                # the first kept row of the chunk depends on the rows read so far
+                blocks.append(values[(-rows_read) % decimation::decimation])
+                rows_read += len(values)
+
+    if remainder is not None and len(remainder) > 0:
+        blocks.append(remainder.mean(axis=0, keepdims=True))
+    if len(blocks) == 0:
+        raise NameError("The file does not contain any data")
+    # the blocks are joined directly in a column-major matrix
+    data = np.empty((sum(len(block) for block in blocks), blocks[0].shape[1]), order="F")
+    return np.concatenate(blocks, out=data)
+
+
+def read_new_rows(
+        path_to_data: str,
+        offset: int = 0,
+        rows_to_skip: int = 0
+) -> [np.ndarray, int]:
+
+    """
+    Parameters
+    ----------
+    path_to_data (str): path to a .txt or .csv datafile
+    offset (int): position in bytes from which the file is read, 0 to read it from the beginning
+    rows_to_skip (int): number of rows to skip, used only when <offset> is 0
+
+    Returns
+    -------
+    rows (np.ndarray): matrix with the complete rows written after <offset> (it has no rows if there are none)
+    new_offset (int): position in bytes from which the file has to be read at the next call
+
+    Notes
+    -----
+    This function parses only the part of a file that follows <offset>, so that a file that is being appended
+    can be read incrementally. The last row is parsed only when it is complete (ended by a new line), otherwise
+    it is read again at the next call. An error is raised if the file has been truncated.
+    """
+
+    if not path_to_data.endswith((".txt", ".csv")):
+        raise NameError("Only .txt and .csv files can be read incrementally")
+    if os.path.getsize(path_to_data) < offset:
+        raise NameError("The file has been truncated")
+
+    with open(path_to_data, "rb") as file:
+        file.seek(offset)
+        if offset == 0:
+            for _ in range(rows_to_skip):
+                # the rows to skip have not been written yet
+                if not file.readline().endswith(b"\n"):
+                    return np.empty((0, 0)), 0
+        start = file.tell()
+        text = file.read()
+
+    # only the complete rows are parsed, the separators of .csv files are replaced by spaces
+    end = text.rfind(b"\n") + 1
+    lines = [line for line in text[:end].decode().replace(";", " ").splitlines() if line.strip()]
+    if len(lines) == 0:
+        return np.empty((0, 0)), start + end
+
+    num_columns = len(lines[0].split())
+    values = np.array(" ".join(lines).split(), dtype=np.float64)
+    if len(values) != num_columns * len(lines):
+        raise NameError("All the rows must have the same number of columns")
+    return values.reshape(len(lines), num_columns), start + end
+
+
+def _append_rows(
+        buffer: np.ndarray,  # matrix where the rows are stored, None if no rows have been stored yet
+        num_rows: int,  # number of rows of <buffer> already used
+        new_rows: np.ndarray  # rows to append
+) -> [np.ndarray, int]:
+
+    """
+    Notes
+    -----
+    This function appends <new_rows> to the used part of <buffer>. The buffer is reallocated with twice its
+    size only when it is full, so that appending costs on average as much as the new rows.
+    It returns the buffer and the new number of used rows.
+    """
+
+    if buffer is None:
+        buffer = np.empty((max(len(new_rows), 1024), new_rows.shape[1]))
+    if new_rows.shape[1] != buffer.shape[1]:
+        raise NameError("All the rows must have the same number of columns")
+    if num_rows + len(new_rows) > len(buffer):
+        new_buffer = np.empty((max(2 * len(buffer), num_rows + len(new_rows)), buffer.shape[1]))
+        new_buffer[:num_rows] = buffer[:num_rows]
+        buffer = new_buffer
+
+    buffer[num_rows:num_rows + len(new_rows)] = new_rows
+    return buffer, num_rows + len(new_rows)
+
+
+def _watch_data(
+        path_to_data: str,  # path to a .txt or .csv datafile
+        rows_to_skip: int,  # number of rows to skip
+        interval: float,  # seconds between two checks of the file
+        max_polls: int,  # maximum number of checks of the file, None for no limit
+        fig: matplotlib.figure.Figure  # figure that is updated, None if there is no figure
+):
+
+    """
+    Notes
+    -----
+    This generator checks <path_to_data> every <interval> seconds and, when new rows have been appended,
+    yields the matrix with all the rows read so far. Only the new rows are parsed (see read_new_rows()).
+    It stops when <fig> is closed or after <max_polls> checks. While waiting, the events of <fig> are processed.
+    """
+
+    import time
+
+    buffer, num_rows, offset, polls = None, 0, 0, 0
+    while max_polls is None or polls < max_polls:
+        if fig is not None:
+            import matplotlib.pyplot as plt
+            if not plt.fignum_exists(fig.number):
+                return
+
+        new_rows, offset = read_new_rows(path_to_data, offset, rows_to_skip)
+        if len(new_rows) > 0:
+            buffer, num_rows = _append_rows(buffer, num_rows, new_rows)
+            yield buffer[:num_rows]
+
+        polls += 1
+        if fig is not None:
+            # plt.pause(0) would wait forever
+            plt.pause(max(interval, 1e-3))
+        else:
+            time.sleep(interval)
+
+
 def plot_data(
         data: np.ndarray,
         x_label: str = " ",
-        y_label: str = " "
+        y_label: str = " ",
+        show_plot: bool = True,
+        save_plot: str = None
 ) -> matplotlib.figure.Figure:
 
     """
@@ -62,125 +693,1363 @@ def plot_data(
     data (np.ndarray): matrix with the data
     x_label (str): label for the x-axis of the plot
     y_label (str): label for the y-axis of the plot
+    show_plot (bool): if False, the plot is not shown
+    save_plot (str): path where the plot is saved, if None the plot is not saved
 
     Returns
     -------
-    fig (matplotlib.figure.Figure): figure containing the plot
+    fig (matplotlib.figure.Figure): figure containing the plot, None if the plot is neither shown nor saved
 
     Notes
     -----
     This function plot <data>.
     The chart x-axis and y-axis labels are set as <x_label> and <y_label>.
+    If the plot is only saved, it is rendered in background (see wait_for_plots()).
     """
 
-    fig, axs = plt.subplots(1)
+    if not show_plot and save_plot is None:
+        return None
+
+    fig, axs = _new_figure(show_plot)
     axs.tick_params(axis='both', labelsize=15)
 
     # The x values are given by the first column of <data>, all the other columns are plot as function of x
+    # the columns with too many points are decimated
     x_values = data.T[0]
+    decimated_lines = []
     for idx, y_values in enumerate(data.T[1:]):
-        axs.plot(x_values, y_values, ".", markersize=10, label="column {}".format(idx+1))
+        _plot_decimated(axs, decimated_lines, x_values, y_values, ".", markersize=10,
+                        label="column {}".format(idx+1))
 
     axs.set_xlabel(x_label, fontsize=15)
     axs.set_ylabel(y_label, fontsize=15)
     axs.legend(fontsize=15)
     fig.tight_layout()
+    if show_plot:
+        _enable_redecimation(axs, decimated_lines)
 
-    plt.show()
+    _output_figure(fig, show_plot, save_plot)
     return fig
 
 
-def plot_data_verbose(
+# maximum number of points of every line sent to matplotlib, the longer lines are decimated
+MAX_PLOT_POINTS = 10000
 
-) -> matplotlib.figure.Figure:
+
+def decimate_minmax(
+        x_values: np.ndarray,
+        y_values: np.ndarray,
+        max_points: int = MAX_PLOT_POINTS
+) -> [np.ndarray, np.ndarray]:
 
     """
+    Parameters
+    ----------
+    x_values (np.ndarray): x values of the line
+    y_values (np.ndarray): y values of the line
+    max_points (int): maximum number of points of the decimated line
+
     Returns
     -------
-    fig (matplotlib.figure.Figure): figure containing the plot
+    x_decimated (np.ndarray): x values of the decimated line
+    y_decimated (np.ndarray): y values of the decimated line
 
     Notes
     -----
-    This function plot some data whose path is requested to the user.
-    Other parameters are requested: number of rows to skip, index of x values,
-    index of y values and labels of the chart axis.
+    The points are divided in max_points/2 consecutive buckets, and only the minimum and the maximum of every
+    bucket are kept, in their original order. The decimated line has the same visual envelope of the original one.
     """
 
-    path = input("Path to data to plot: ")
-    # raise an error if the file does not exist
-    if not os.path.exists(path):
-        raise NameError("The file does not exist")
-    rows_to_skip = int(input("Number of rows to skip: "))
-    data = read_data(path, rows_to_skip)
-    x_index = int(input("Index of x data: "))
-    # selecting the columns to plot
-    y_indexes = list(map(int, input("Indexes of y data: ").strip().split()))
-    x_title = input("X axis title: ")
-    y_title = input("Y axis title: ")
-
-    # creating a np.ndarray with only the data to plot
-    data_indexes = [x_index] + y_indexes
-    data_to_plot = data.T[data_indexes].T
+    num_points = len(y_values)
+    if num_points <= max_points:
+        return x_values, y_values
 
-    return plot_data(data_to_plot, x_title, y_title)
+    bucket_size = -(-num_points // (max_points // 2))  # ceil division
+    num_full_buckets = num_points // bucket_size
+    buckets = y_values[:num_full_buckets * bucket_size].reshape(num_full_buckets, bucket_size)
+    offsets = np.arange(num_full_buckets) * bucket_size
+    indexes = [offsets + np.argmin(buckets, axis=1), offsets + np.argmax(buckets, axis=1)]
 
+    # last incomplete bucket
+    if num_full_buckets * bucket_size < num_points:
+        last_bucket = y_values[num_full_buckets * bucket_size:]
+        offset = num_full_buckets * bucket_size
+        indexes.append(np.array([offset + np.argmin(last_bucket), offset + np.argmax(last_bucket)]))
 
-def fit_data(
-        data: np.ndarray,
-        fitting_function: types.FunctionType,
-        x_index: int = 0,
-        y_index: int = 1,
-        x_label: str = " ",
-        y_label: str = " "
-) -> [np.ndarray, np.ndarray, matplotlib.figure.Figure]:
+    indexes = np.unique(np.concatenate(indexes))
+    return x_values[indexes], y_values[indexes]
 
-    """
-    Parameters
-    ----------
-    data (np.ndarray): matrix with all the data
-    fitting_function (types.FunctionType): function to be used for the fit
-    x_index (int): index of x values
-    y_index (int): index of y values
-    x_label (str): label for the x-axis of the plot
-    y_label (str): label for the y-axis of the plot
 
-    Returns
-    -------
-    popt (np.ndarray): values of the fitting parameters
-    perr (np.ndarray): standard deviations of the fitting parameters
-    fig (matplotlib.figure.Figure): figure containing the plot
+def _plot_decimated(
+        axs: matplotlib.axes.Axes,  # axis where the line is plotted
+        decimated_lines: list,  # list where the decimated lines are appended
+        x_values: np.ndarray,  # x values of the line
+        y_values: np.ndarray,  # y values of the line
+        *args,  # format and keyword arguments of axs.plot()
+        **kwargs
+) -> matplotlib.lines.Line2D:
 
+    """
     Notes
     -----
-    This function fit a set of values in <data>, using <fitting_function> as fitting function and plot both of them.
-    The values are selected using <x_index> and <y_index>.
+    This function plots a line decimated with decimate_minmax(). If the line has been decimated, it is appended
+    to <decimated_lines> with its full data, so that it can be decimated again when the plot is zoomed.
+    """
+
+    line, = axs.plot(*decimate_minmax(x_values, y_values), *args, **kwargs)
+    if len(y_values) > MAX_PLOT_POINTS:
+        decimated_lines.append((line, x_values, y_values))
+    return line
+
+
+def _enable_redecimation(
+        axs: matplotlib.axes.Axes,  # axis of the plot
+        decimated_lines: list  # list of (line, x values, y values) of the decimated lines
+):
+
+    """
+    Notes
+    -----
+    This function decimates again the lines of an interactive plot every time the x limits change,
+    using only the visible points, so that zooming in shows the full resolution of the data.
+    """
+
+    def redecimate(axs):
+        x_min, x_max = axs.get_xlim()
+        for line, x_values, y_values in decimated_lines:
+            visible = (x_values >= x_min) & (x_values <= x_max)
+            line.set_data(*decimate_minmax(x_values[visible], y_values[visible]))
+        axs.figure.canvas.draw_idle()
+
+    if len(decimated_lines) > 0:
+        axs.callbacks.connect("xlim_changed", redecimate)
+
+
+def _new_figure(
+        show_plot: bool  # if True, the figure is created with pyplot so that it can be shown
+) -> [matplotlib.figure.Figure, matplotlib.axes.Axes]:
+
+    """
+    Notes
+    -----
+    This function creates a figure with a single axis. The figures that are only saved are created
+    without pyplot, so that no GUI backend is used and they can be rendered in another thread.
+    """
+
+    if show_plot:
+        import matplotlib.pyplot as plt
+        return plt.subplots(1)
+
+    from matplotlib.figure import Figure
+    fig = Figure()
+    return fig, fig.add_subplot()
+
+
+def _output_figure(
+        fig: matplotlib.figure.Figure,  # figure to show or save
+        show_plot: bool,  # if True, the figure is shown
+        save_plot: str  # path where the figure is saved, None if it is not saved
+):
+
+    """
+    Notes
+    -----
+    This function shows and/or saves <fig>. When the figure is only saved, it is rendered by a
+    background thread, so that the caller can go on without waiting for the rendering.
+    """
+
+    if show_plot:
+        import matplotlib.pyplot as plt
+        if save_plot is not None:
+            fig.savefig(save_plot)
+        plt.show()
+    elif save_plot is not None:
+        if _plot_renderer["executor"] is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _plot_renderer["executor"] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="plafi-render")
+        _plot_renderer["futures"].append(_plot_renderer["executor"].submit(fig.savefig, save_plot))
+
+
+# background thread that renders the saved figures, and the renderings not yet waited by wait_for_plots()
+_plot_renderer = {"executor": None, "futures": []}
+
+
+def wait_for_plots(
+
+):
+
+    """
+    Notes
+    -----
+    This function waits until all the figures saved in background are written.
+    The first error raised while saving a figure, if any, is raised again.
+    """
+
+    futures, _plot_renderer["futures"] = _plot_renderer["futures"], []
+    errors = [future.exception() for future in futures]
+    for error in errors:
+        if error is not None:
+            raise error
+
+
+def plot_data_verbose(
+        show_plot: bool = True,
+        save_plot: str = None
+) -> matplotlib.figure.Figure:
+
+    """
+    Parameters
+    ----------
+    show_plot (bool): if False, the plot is not shown
+    save_plot (str): path where the plot is saved, if None the plot is not saved
+
+    Returns
+    -------
+    fig (matplotlib.figure.Figure): figure containing the plot, None if the plot is neither shown nor saved
+
+    Notes
+    -----
+    This function plot some data whose path is requested to the user.
+    Other parameters are requested: number of rows to skip, index of x values,
+    index of y values and labels of the chart axis.
+    """
+
+    path = input("Path to data to plot: ")
+    # raise an error if the file does not exist
+    if not os.path.exists(path):
+        raise NameError("The file does not exist")
+    rows_to_skip = int(input("Number of rows to skip: "))
+    x_index = int(input("Index of x data: "))
+    # selecting the columns to plot
+    y_indexes = list(map(int, input("Indexes of y data: ").strip().split()))
+    x_title = input("X axis title: ")
+    y_title = input("Y axis title: ")
+
+    # reading only the data to plot
+    data_to_plot = read_data(path, rows_to_skip, [x_index] + y_indexes)
+
+    return plot_data(data_to_plot, x_title, y_title, show_plot, save_plot)
+
+
+def watch_plot(
+        path_to_data: str,
+        rows_to_skip: int = 0,
+        x_label: str = " ",
+        y_label: str = " ",
+        interval: float = 1.0,
+        max_polls: int = None
+) -> matplotlib.figure.Figure:
+
+    """
+    Parameters
+    ----------
+    path_to_data (str): path to a .txt or .csv datafile
+    rows_to_skip (int): number of rows to skip
+    x_label (str): label for the x-axis of the plot
+    y_label (str): label for the y-axis of the plot
+    interval (float): seconds between two checks of the file
+    max_polls (int): maximum number of checks of the file, None to watch it until the figure is closed
+
+    Returns
+    -------
+    fig (matplotlib.figure.Figure): figure containing the plot
+
+    Notes
+    -----
+    This function plots a file that is being written (i.e. during a data taking) and updates the figure in place
+    every time new rows are appended. Only the new rows are parsed at every update.
+    As in plot_data(), every column is plotted as function of the first one.
+    """
+
+    import matplotlib.pyplot as plt
+
+    fig, axs = plt.subplots(1)
+    axs.tick_params(axis='both', labelsize=15)
+    axs.set_xlabel(x_label, fontsize=15)
+    axs.set_ylabel(y_label, fontsize=15)
+
+    lines = []
+    for data in _watch_data(path_to_data, rows_to_skip, interval, max_polls, fig):
+        # the lines are created when the first rows are read
+        if len(lines) == 0:
+            lines = [axs.plot([], [], ".", markersize=10, label="column {}".format(idx + 1))[0]
+                     for idx in range(data.shape[1] - 1)]
+            axs.legend(fontsize=15)
+        for idx, line in enumerate(lines):
+            line.set_data(*decimate_minmax(data[:, 0], data[:, idx + 1]))
+        axs.relim()
+        axs.autoscale_view()
+        fig.canvas.draw_idle()
+
+    return fig
+
+
+def _parameter_line(
+        prefix: str,  # prefix of the line, i.e. the y column of the fit
+        idx: int,  # index of the fitting parameter
+        value: float,  # value of the fitting parameter
+        error: float,  # standard deviation of the fitting parameter
+        interval: str = ""  # bootstrap interval printed after the value, if computed
+) -> str:
+
+    """
+    Notes
+    -----
+    This function returns the line printed for a fitting parameter by fit_data(), also used for the results of
+    the fit server (see plafi.server), so that the local and the remote fits print the same lines.
+    """
+
+    from uncertainties import ufloat
+
+    return "{}parameter {}:  {}{}".format(prefix, idx + 1, ufloat(value, error), interval)
+
+
+def _statistics_line(
+        prefix: str,  # prefix of the line, i.e. the y column of the fit
+        statistics: dict  # statistics returned by fit_statistics()
+) -> str:
+
+    """
+    Notes
+    -----
+    This function returns the line with the chi square of a fit printed by fit_data(), see _parameter_line().
+    """
+
+    return "{}chi2: {:.6g}, reduced chi2: {:.6g}".format(prefix, statistics["chi2"], statistics["reduced chi2"])
+
+
+def fit_data(
+        data: np.ndarray,
+        fitting_function: types.FunctionType,
+        x_index: int = 0,
+        y_index: int = 1,
+        x_label: str = " ",
+        y_label: str = " ",
+        show_plot: bool = True,
+        jobs: int = 1,
+        save_plot: str = None,
+        p0: np.ndarray = None,
+        bounds: tuple = None,
+        sigma_index: int = None,
+        engine: str = "curve_fit",
+        loss: str = "linear",
+        starts: int = 10,
+        bootstrap: int = 0,
+        bootstrap_method: str = "residuals"
+) -> [np.ndarray, np.ndarray, matplotlib.figure.Figure]:
+
+    """
+    Parameters
+    ----------
+    data (np.ndarray): matrix with all the data
+    fitting_function (types.FunctionType): function to be used for the fit
+    x_index (int): index of x values
+    y_index (int | list | str): index of y values, a list of indexes or "all" to fit every column against x
+    x_label (str): label for the x-axis of the plot
+    y_label (str): label for the y-axis of the plot
+    show_plot (bool): if False, the plot is not shown
+    jobs (int): number of worker processes used when more y columns are fitted (or by the multistart engine)
+    save_plot (str): path where the plot is saved, if None the plot is not saved
+    p0 (np.ndarray): initial values of the fitting parameters, if None all the parameters start from 1 (or from the
+                     initial guess of the built-in models)
+    bounds (tuple): (lower bounds, upper bounds) of the fitting parameters, if None they are not bounded
+    sigma_index (int | list): index of the uncertainties of the y values (or a list with one index for every
+                              y column), if None the fit is not weighted
+    engine (str): optimizer used for the fit, "curve_fit", "lm", "trf" or "multistart", see run_fit()
+    loss (str): loss function of the trf and multistart engines, i.e. "soft_l1" to reduce the weight of the outliers
+    starts (int): number of starting points of the multistart engine
+    bootstrap (int): number of bootstrap samples used to compute the 95% intervals of the parameters, 0 to not
+                     compute them
+    bootstrap_method (str): "residuals" or "points", see bootstrap_fit()
+
+    Returns
+    -------
+    popt (np.ndarray): values of the fitting parameters
+    perr (np.ndarray): standard deviations of the fitting parameters
+    fig (matplotlib.figure.Figure): figure containing the plot, None if the plot is neither shown nor saved
+
+    Notes
+    -----
+    This function fit a set of values in <data>, using <fitting_function> as fitting function and plot both of them.
+    The values are selected using <x_index> and <y_index>.
     <x_label> and <y_label> are the labels of the chart axis.
+    If more y columns are selected, the same x values and fitting function are used for all of them, and
+    popt and perr are matrices with a row for every column (channels x parameters). The parameters of a
+    column that could not be fitted are nan.
+    If the uncertainties are given, the fit is weighted and they are used as absolute errors, so that perr
+    does not depend on the chi square. The chi square and the reduced chi square of every fit are printed.
+    If <bootstrap> is positive, the 95% percentile intervals of the parameters are printed next to them.
+    If the plot is only saved, it is rendered in background (see wait_for_plots()).
     """
 
     # extracting the value for the fit
     x_values = data.T[x_index]
-    y_values = data.T[y_index]
+    y_indexes = _y_indexes(data, x_index, y_index, sigma_index)
+    sigmas = _sigma_columns(data, sigma_index, len(y_indexes))
+    single_column = isinstance(y_index, (int, np.integer))
+
+    # fitting procedure
+    popts, perrs, statuses = _fit_columns(fitting_function, data, x_index, y_index, sigma_index, p0, bounds, engine,
+                                          loss, starts, jobs)
+
+    # printing the fitting parameters and the quality of the fit
+    for y_idx, popt, perr, status, sigma in zip(y_indexes, popts, perrs, statuses, sigmas):
+        prefix = "" if single_column else "column {} ".format(y_idx)
+        if status != "ok":
+            print("{}fit failed: {}".format(prefix, status))
+            continue
+        if bootstrap > 0:
+            intervals = bootstrap_fit(fitting_function, x_values, data.T[y_idx], popt, bootstrap, bootstrap_method,
+                                      sigma=sigma, bounds=bounds, engine=engine, loss=loss, jobs=jobs)
+        for idx, par in enumerate(popt):
+            interval = ""
+            if bootstrap > 0:
+                interval = "  (95% interval: [{:.6g}, {:.6g}])".format(intervals["lower"][idx],
+                                                                       intervals["upper"][idx])
+            print(_parameter_line(prefix, idx, par, perr[idx], interval))
+        if bootstrap > 0 and intervals["failed"] > 0:
+            print("{}{} bootstrap fits failed".format(prefix, intervals["failed"]))
+        statistics = fit_statistics(fitting_function, x_values, data.T[y_idx], popt, sigma)
+        print(_statistics_line(prefix, statistics))
+
+    # plotting the data and the fitting curve
+    curves = [(x_values, data.T[y_idx], popt, "data (col {})".format(y_idx),
+               "fit" if single_column else "fit (col {})".format(y_idx)) for y_idx, popt in zip(y_indexes, popts)]
+    fig = _plot_fits(fitting_function, curves, x_label, y_label, show_plot, save_plot)
+
+    if single_column:
+        return popts[0], perrs[0], fig
+    return popts, perrs, fig
+
+
+def _fit_columns(
+        fitting_function: types.FunctionType,  # function used for the fit
+        data: np.ndarray,  # matrix with the data
+        x_index: int,  # index of the x values
+        y_index,  # index, list of indexes or "all", see fit_data()
+        sigma_index,  # index or list of indexes of the uncertainties, None for an unweighted fit
+        p0: np.ndarray,  # initial values of the fitting parameters
+        bounds: tuple,  # lower and upper bounds of the fitting parameters
+        engine: str,  # optimizer used for the fit
+        loss: str,  # loss function of the trf and multistart engines
+        starts: int,  # number of starting points of the multistart engine
+        jobs: int  # number of worker processes
+) -> [np.ndarray, np.ndarray, list]:
+
+    """
+    Notes
+    -----
+    This function performs the fits of fit_data(), and returns popt and perr as matrices with a row for every
+    fitted y column, and the status of every fit ("ok" or the error, see fit_many()).
+    If <y_index> is an integer an error is raised if the fit fails, otherwise the failed fits have nan
+    parameters.
+    """
+
+    x_values = data.T[x_index]
+    y_indexes = _y_indexes(data, x_index, y_index, sigma_index)
+    sigmas = _sigma_columns(data, sigma_index, len(y_indexes))
+    if isinstance(y_index, (int, np.integer)):
+        result = run_fit(fitting_function, x_values, data.T[y_index], p0, bounds, sigmas[0], engine, loss, starts,
+                         jobs)
+        return np.array([result.popt]), np.array([result.perr]), ["ok"]
+    datasets = [(x_values, data.T[idx], sigma) for idx, sigma in zip(y_indexes, sigmas)]
+    results = fit_many(fitting_function, datasets, jobs, p0, bounds, engine, loss, starts)
+    popts = np.array([popt for popt, _, _ in results])
+    perrs = np.array([perr for _, perr, _ in results])
+    return popts, perrs, [status for _, _, status in results]
+
+
+def _plot_fits(
+        fitting_function: types.FunctionType,  # function used for the fits
+        curves: list,  # list of (x values, y values, popt, label of the data, label of the fit)
+        x_label: str,  # label for the x-axis of the plot
+        y_label: str,  # label for the y-axis of the plot
+        show_plot: bool,  # if True, the plot is shown
+        save_plot: str  # path where the plot is saved, None if it is not saved
+) -> matplotlib.figure.Figure:
+
+    """
+    Notes
+    -----
+    This function plots every set of data in <curves> together with its fitting curve, drawn with the same
+    color. The figure is created only if it is shown or saved, otherwise None is returned.
+    """
+
+    if not show_plot and save_plot is None:
+        return None
+
+    fig, axs = _new_figure(show_plot)
+    axs.tick_params(axis='both', labelsize=15)
+    decimated_lines = []
+    for x_values, y_values, popt, data_label, fit_label in curves:
+        data_line = _plot_decimated(axs, decimated_lines, x_values, y_values, ".", markersize=10, label=data_label)
+        fit_values = np.broadcast_to(fitting_function(x_values, *popt), x_values.shape)
+        _plot_decimated(axs, decimated_lines, x_values, fit_values, "--", linewidth=2.1, label=fit_label,
+                        color=data_line.get_color())
+    axs.set_xlabel(x_label, fontsize=15)
+    axs.set_ylabel(y_label, fontsize=15)
+    axs.legend(fontsize=15)
+    fig.tight_layout()
+    if show_plot:
+        _enable_redecimation(axs, decimated_lines)
+    _output_figure(fig, show_plot, save_plot)
+    return fig
+
+
+def _y_indexes(
+        data: np.ndarray,  # matrix with all the data
+        x_index: int,  # index of x values
+        y_index,  # index of y values, list of indexes or "all"
+        sigma_index=None  # index of the uncertainties of y values, list of indexes or None
+) -> list:
+
+    """
+    Notes
+    -----
+    This function returns the list of the indexes of the y columns selected by <y_index>.
+    "all" selects every column of <data> except the x one and the uncertainties.
+    """
+
+    if isinstance(y_index, str):
+        if y_index.strip() != "all":
+            raise NameError("The y data index must be an integer, a list of integers or 'all'")
+        excluded = [x_index] + _y_indexes(data, x_index, [] if sigma_index is None else sigma_index)
+        return [idx for idx in range(data.shape[1]) if idx not in excluded]
+    if isinstance(y_index, (int, np.integer)):
+        return [int(y_index)]
+    return [int(idx) for idx in y_index]
+
+
+def _sigma_columns(
+        data: np.ndarray,  # matrix with all the data
+        sigma_index,  # index of the uncertainties, list with an index for every y column or None
+        num_columns: int  # number of fitted y columns
+) -> list:
+
+    """
+    Notes
+    -----
+    This function returns the uncertainties of every fitted y column, None for the unweighted fits.
+    A single index is used for all the y columns.
+    """
+
+    if sigma_index is None:
+        return [None] * num_columns
+    if isinstance(sigma_index, (int, np.integer)):
+        return [data.T[sigma_index]] * num_columns
+    if len(sigma_index) != num_columns:
+        raise NameError("The sigma data indexes must be as many as the y data indexes")
+    return [data.T[idx] for idx in sigma_index]
+
+
+def fit_statistics(
+        fitting_function: types.FunctionType,
+        x_values: np.ndarray,
+        y_values: np.ndarray,
+        popt: np.ndarray,
+        sigma: np.ndarray = None
+) -> dict:
+
+    """
+    Parameters
+    ----------
+    fitting_function (types.FunctionType): function used for the fit
+    x_values (np.ndarray): x values
+    y_values (np.ndarray): y values
+    popt (np.ndarray): values of the fitting parameters
+    sigma (np.ndarray): uncertainties of the y values, if None all the points have unit weight
+
+    Returns
+    -------
+    statistics (dict): dictionary with the residuals (y - fitting function), the chi square, the degrees of
+                       freedom and the reduced chi square of the fit
+
+    Notes
+    -----
+    The fitting function is evaluated once, and the chi square is the dot product of the normalized residuals
+    with themselves, without building the array of their squares.
+    The reduced chi square is nan if there are no degrees of freedom.
+    """
+
+    residuals = np.subtract(y_values, fitting_function(x_values, *popt))
+    normalized_residuals = residuals if sigma is None else residuals / sigma
+    chi2 = float(np.dot(normalized_residuals, normalized_residuals))
+    degrees_of_freedom = len(residuals) - len(popt)
+    reduced_chi2 = chi2 / degrees_of_freedom if degrees_of_freedom > 0 else np.nan
+
+    return {"residuals": residuals, "chi2": chi2, "degrees of freedom": degrees_of_freedom,
+            "reduced chi2": reduced_chi2}
+
+
+def _curve_fit(
+        fitting_function: types.FunctionType,
+        x_values: np.ndarray,
+        y_values: np.ndarray,
+        p0: np.ndarray = None,
+        bounds: tuple = None,
+        sigma: np.ndarray = None,
+        full_output: bool = False
+) -> [np.ndarray, np.ndarray]:
+
+    """
+    Notes
+    -----
+    This function fits <y_values> as function of <x_values> with curve_fit, using the analytic
+    jacobian of <fitting_function> if it exists. The fit starts from <p0> and the parameters are
+    constrained within <bounds> = (lower bounds, upper bounds), if given.
+    If <sigma> is given, the points are weighted with the absolute uncertainties <sigma>.
+    It returns the parameters and their covariance matrix (and the other outputs of curve_fit if
+    <full_output> is True).
+    """
+
+    from scipy.optimize import curve_fit
+
+    p0 = _initial_values(fitting_function, x_values, y_values, p0, bounds)
+    if bounds is None:
+        bounds = (-np.inf, np.inf)
+    return curve_fit(fitting_function, x_values, y_values, p0=p0, sigma=sigma, absolute_sigma=sigma is not None,
+                     bounds=bounds, jac=getattr(fitting_function, "jacobian", None), full_output=full_output)
+
+
+def _initial_values(
+        fitting_function: types.FunctionType,  # function used for the fit
+        x_values: np.ndarray,  # x values
+        y_values: np.ndarray,  # y values
+        p0: np.ndarray,  # initial values given by the user, None if they are not given
+        bounds: tuple  # (lower bounds, upper bounds) of the fitting parameters, None if they are not bounded
+) -> np.ndarray:
+
+    """
+    Notes
+    -----
+    This function returns <p0> if it is given. Otherwise, for the built-in models it returns the initial guess
+    computed from the data (within the bounds), and for the other fitting functions None, so that the fit
+    starts from 1. None is also returned if the initial guess can not be computed.
+    """
+
+    initial_guess = getattr(fitting_function, "initial_guess", None)
+    if p0 is not None or initial_guess is None:
+        return p0
+    try:
+        with np.errstate(all="ignore"):
+            guess = np.asarray(initial_guess(x_values, y_values), dtype=np.float64)
+    except (ValueError, np.linalg.LinAlgError):
+        return None
+    if guess.shape != (fitting_function.num_var,) or not np.all(np.isfinite(guess)):
+        return None
+    return guess if bounds is None else np.clip(guess, *bounds)
+
+
+# optimizers that can be used for a fit, see run_fit()
+ENGINES = ["curve_fit", "lm", "trf", "multistart"]
+
+
+class FitResult:
+
+    """
+    Notes
+    -----
+    This class contains the result of a fit, whatever the engine used (see run_fit()):
+    popt (np.ndarray): values of the fitting parameters
+    perr (np.ndarray): standard deviations of the fitting parameters
+    pcov (np.ndarray): covariance matrix of the fitting parameters
+    chi2 (float): chi square of the fit, weighted with the uncertainties if they are given
+    cost (float): value of the minimized cost function (chi2 / 2 if the loss is linear)
+    nfev (int): number of evaluations of the fitting function
+    engine (str): engine used for the fit
+    status (str): "ok" for a successful fit, otherwise the description of the error
+    residuals (np.ndarray): residuals of the fit (y - fitting function), not weighted with the uncertainties
+    time (float): wall time of the fit in seconds, set by run_fit()
+    The attributes are stored in __slots__, so that the results are small and fast to send between processes.
+    """
+
+    __slots__ = ("popt", "perr", "pcov", "chi2", "cost", "nfev", "engine", "status", "residuals", "time")
+
+    def __init__(self, popt, perr, pcov, chi2, cost, nfev, engine, status="ok", residuals=None, time=None):
+        self.popt = popt
+        self.perr = perr
+        self.pcov = pcov
+        self.chi2 = chi2
+        self.cost = cost
+        self.nfev = nfev
+        self.engine = engine
+        self.status = status
+        self.residuals = residuals
+        self.time = time
+
+    def __repr__(self):
+        return "FitResult(engine={!r}, status={!r}, popt={}, perr={}, chi2={:.6g}, nfev={}, time={:.3g} s)".format(
+            self.engine, self.status, self.popt, self.perr, self.chi2, self.nfev,
+            np.nan if self.time is None else self.time)
+
+
+def fit(
+        x_values: np.ndarray,
+        y_values: np.ndarray,
+        str_funct: str,
+        p0: np.ndarray = None,
+        bounds: tuple = None,
+        sigma: np.ndarray = None,
+        engine: str = "curve_fit",
+        loss: str = "linear",
+        starts: int = 10,
+        jobs: int = 1,
+        num_var: int = None
+) -> FitResult:
+
+    """
+    Parameters
+    ----------
+    x_values (np.ndarray): x values
+    y_values (np.ndarray): y values
+    str_funct (str): fitting function written as string, as in the configuration files (i.e. "var1*sin(x)+var2")
+    p0 (np.ndarray): initial values of the fitting parameters, if None all the parameters start from 1 (or from the
+                     initial guess of the built-in models)
+    bounds (tuple): (lower bounds, upper bounds) of the fitting parameters, if None they are not bounded
+    sigma (np.ndarray): uncertainties of the y values, if None the fit is not weighted
+    engine (str): optimizer used for the fit, see run_fit()
+    loss (str): loss function of the trf and multistart engines
+    starts (int): number of starting points of the multistart engine
+    jobs (int): number of worker processes used by the multistart engine
+    num_var (int): number of fitting parameters, if None it is the highest N of the parameters varN
+
+    Returns
+    -------
+    result (FitResult): result of the fit, with the parameters, their covariance, the residuals,
+                        the number of function evaluations and the time of the fit
+
+    Notes
+    -----
+    This function is the python interface of plafi: it performs the fit without printing anything and without
+    creating any figure, and it can be imported as plafi.fit. The checked and compiled fitting function is
+    cached, so repeated fits of the same model do not check and compile it again.
+    An error is raised if <str_funct> can not be used or if the fit does not converge.
+    """
+
+    fitting_function = _checked_fitting_function(str_funct, num_var, _constants_version())
+    x_values = np.asarray(x_values, dtype=np.float64)
+    y_values = np.asarray(y_values, dtype=np.float64)
+    sigma = None if sigma is None else np.asarray(sigma, dtype=np.float64)
+    return run_fit(fitting_function, x_values, y_values, p0, bounds, sigma, engine, loss, starts, jobs)
+
+
+def run_fit(
+        fitting_function: types.FunctionType,
+        x_values: np.ndarray,
+        y_values: np.ndarray,
+        p0: np.ndarray = None,
+        bounds: tuple = None,
+        sigma: np.ndarray = None,
+        engine: str = "curve_fit",
+        loss: str = "linear",
+        starts: int = 10,
+        jobs: int = 1
+) -> FitResult:
+
+    """
+    Parameters
+    ----------
+    fitting_function (types.FunctionType): function generated by generate_fitting_function()
+    x_values (np.ndarray): x values
+    y_values (np.ndarray): y values
+    p0 (np.ndarray): initial values of the fitting parameters, if None all the parameters start from 1 (or from the
+                     initial guess of the built-in models)
+    bounds (tuple): (lower bounds, upper bounds) of the fitting parameters, if None they are not bounded
+    sigma (np.ndarray): uncertainties of the y values, if None the fit is not weighted
+    engine (str): "curve_fit", "lm" (Levenberg-Marquardt), "trf" (Trust Region Reflective, it supports the
+                  robust losses) or "multistart" (trf started from <starts> different points)
+    loss (str): loss function of the trf and multistart engines: "linear", "soft_l1", "huber", "cauchy"
+                or "arctan", see scipy.optimize.least_squares
+    starts (int): number of starting points of the multistart engine
+    jobs (int): number of worker processes used by the multistart engine
+
+    Returns
+    -------
+    result (FitResult): result of the fit
+
+    Notes
+    -----
+    This function fits <y_values> as function of <x_values> with the selected engine. The robust losses reduce the
+    weight of the outliers, that are the points whose residual is much larger than their uncertainty (or than 1
+    if the uncertainties are not given). The multistart engine is a global search: the first starting point is
+    <p0>, the others are drawn at random within the bounds (or around <p0> for the unbounded parameters), the fits
+    are performed in parallel and the one with the lowest cost is returned.
+    An error is raised if the fit does not converge.
+    """
+
+    import time
+
+    start_time = time.perf_counter()
+    if engine == "curve_fit":
+        if loss != "linear":
+            raise NameError("The curve_fit engine supports only the linear loss, use trf or multistart")
+        popt, pcov, infodict, _, _ = _curve_fit(fitting_function, x_values, y_values, p0, bounds, sigma,
+                                                full_output=True)
+        chi2 = float(np.dot(infodict["fvec"], infodict["fvec"]))
+        result = FitResult(popt, np.sqrt(np.diag(pcov)), pcov, chi2, chi2 / 2, infodict["nfev"], engine,
+                           residuals=_unweighted_residuals(infodict["fvec"], sigma))
+    elif engine in ["lm", "trf"]:
+        result = _least_squares(fitting_function, x_values, y_values, p0, bounds, sigma, engine, loss)
+    elif engine == "multistart":
+        p0 = _initial_values(fitting_function, x_values, y_values, p0, bounds)
+        tasks = [(_task_function(fitting_function), _num_var(fitting_function), np.asarray(x_values),
+                  np.asarray(y_values), sigma, start, bounds, loss)
+                 for start in _starting_points(_num_var(fitting_function), p0, bounds, starts)]
+        results = _map_jobs(_multistart_worker, tasks, _task_jobs(fitting_function, jobs))
+        successful = [result for result in results if result.status == "ok"]
+        if len(successful) == 0:
+            raise RuntimeError("Optimal parameters not found from any starting point: " + results[0].status)
+        best = min(successful, key=lambda result: result.cost)
+        best.nfev, best.engine = sum(result.nfev for result in results), engine
+        result = best
+    else:
+        raise NameError("The engine must be one of: " + ", ".join(ENGINES))
+    result.time = time.perf_counter() - start_time
+    return result
+
+
+@functools.lru_cache(maxsize=64)
+def _checked_fitting_function(
+        str_funct: str,  # fitting function written as string
+        num_var: int,  # number of fitting parameters, None to count them
+        constants_version: tuple  # version of the constants file, see _constants_version()
+) -> types.FunctionType:
+
+    """
+    Notes
+    -----
+    This function returns the fitting function generated (and checked) by generate_fitting_function(), cached so
+    that repeated fits of the same model do not generate it again. An error is raised if <str_funct> can not
+    be used.
+    """
+
+    return generate_fitting_function(str_funct, num_var)
+
+
+def _unweighted_residuals(
+        fvec: np.ndarray,  # residuals returned by the optimizer: (fitting function - y) / sigma
+        sigma: np.ndarray  # uncertainties of the y values, None for an unweighted fit
+) -> np.ndarray:
+
+    """
+    Notes
+    -----
+    This function converts the residuals minimized by the optimizers to the residuals y - fitting function,
+    so that they are given without evaluating the fitting function again.
+    """
+
+    return np.negative(fvec) if sigma is None else np.negative(fvec) * sigma
+
+
+def _least_squares(
+        fitting_function: types.FunctionType,  # function used for the fit
+        x_values: np.ndarray,  # x values
+        y_values: np.ndarray,  # y values
+        p0: np.ndarray,  # initial values of the fitting parameters, None to start from 1
+        bounds: tuple,  # (lower bounds, upper bounds) of the fitting parameters, None if they are not bounded
+        sigma: np.ndarray,  # uncertainties of the y values, None for an unweighted fit
+        method: str,  # "lm" or "trf"
+        loss: str = "linear"  # loss function, see scipy.optimize.least_squares
+) -> FitResult:
+
+    """
+    Notes
+    -----
+    This function fits <y_values> as function of <x_values> with scipy.optimize.least_squares, using the analytic
+    jacobian of <fitting_function> if it exists. The errors of the parameters are computed as in curve_fit.
+    """
+
+    from scipy.optimize import least_squares
+
+    num_var = _num_var(fitting_function)
+    lower, upper = (-np.inf, np.inf) if bounds is None else bounds
+    lower, upper = np.broadcast_to(lower, num_var), np.broadcast_to(upper, num_var)
+    p0 = _initial_values(fitting_function, x_values, y_values, p0, bounds)
+    p0 = np.clip(np.ones(num_var) if p0 is None else p0, lower, upper)
+    weight = None if sigma is None else 1 / np.asarray(sigma, dtype=np.float64)
+
+    def residuals(parameters):
+        res = np.subtract(fitting_function(x_values, *parameters), y_values)
+        if weight is not None:
+            res *= weight
+        return res
+
+    jacobian = getattr(fitting_function, "jacobian", None)
+
+    def weighted_jacobian(parameters):
+        jac = jacobian(x_values, *parameters)
+        if weight is not None:
+            jac *= weight[:, None]
+        return jac
+
+    result = least_squares(residuals, p0, jac="2-point" if jacobian is None else weighted_jacobian,
+                           bounds=(lower, upper), method=method, loss=loss)
+    if not result.success:
+        raise RuntimeError("Optimal parameters not found: " + result.message)
+
+    chi2 = float(np.dot(result.fun, result.fun))
+    pcov = _covariance(result.jac, chi2, len(result.fun) - num_var, sigma is not None)
+    return FitResult(result.x, np.sqrt(np.diag(pcov)), pcov, chi2, float(result.cost), result.nfev, method,
+                     residuals=_unweighted_residuals(result.fun, sigma))
+
+
+def _covariance(
+        jac: np.ndarray,  # jacobian of the (weighted) residuals at the solution
+        chi2: float,  # chi square at the solution
+        degrees_of_freedom: int,  # number of points minus number of fitting parameters
+        absolute_sigma: bool  # if True, the covariance is not scaled with the reduced chi square
+) -> np.ndarray:
+
+    """
+    Notes
+    -----
+    This function returns the covariance matrix of the fitting parameters as curve_fit does: the pseudo-inverse
+    of J^T J, computed with the singular value decomposition of the jacobian J. If the uncertainties are not
+    absolute, the covariance is scaled with the reduced chi square.
+    """
+
+    _, singular_values, vt = np.linalg.svd(jac, full_matrices=False)
+    keep = singular_values > np.finfo(float).eps * max(jac.shape) * singular_values[0]
+    pcov = (vt[keep].T / singular_values[keep] ** 2) @ vt[keep]
+    if not absolute_sigma:
+        pcov = pcov * (chi2 / degrees_of_freedom if degrees_of_freedom > 0 else np.nan)
+    return pcov
+
+
+def _starting_points(
+        num_var: int,  # number of fitting parameters
+        p0: np.ndarray,  # initial values of the fitting parameters, None to use 1
+        bounds: tuple,  # (lower bounds, upper bounds) of the fitting parameters, None if they are not bounded
+        starts: int  # number of starting points
+) -> list:
+
+    """
+    Notes
+    -----
+    This function returns the starting points of the multistart engine. The first one is <p0>, the others are
+    drawn uniformly within the bounds for the parameters with both bounds, and around <p0> for the other
+    parameters (multiplying it by a factor between 0.1 and 10 in logarithmic scale, with a random sign).
+    The points are drawn with a fixed seed, so that the fits are reproducible.
+    """
+
+    rng = np.random.default_rng(0)
+    lower, upper = (-np.inf, np.inf) if bounds is None else bounds
+    lower, upper = np.broadcast_to(lower, num_var), np.broadcast_to(upper, num_var)
+    center = np.ones(num_var) if p0 is None else np.asarray(p0, dtype=np.float64)
+    bounded = np.isfinite(lower) & np.isfinite(upper)
+
+    points = [np.clip(center, lower, upper)]
+    for _ in range(starts - 1):
+        scale = 10 ** rng.uniform(-1, 1, num_var) * rng.choice([-1, 1], num_var)
+        point = np.where(bounded, rng.uniform(np.where(bounded, lower, 0), np.where(bounded, upper, 1)),
+                         np.where(center == 0, 1, center) * scale)
+        points.append(np.clip(point, lower, upper))
+    return points
+
+
+def _multistart_worker(
+        task: tuple  # (fitting function, see _task_function(), number of parameters, x values, y values, sigma,
+                     # start, bounds, loss)
+) -> FitResult:
+
+    """
+    Notes
+    -----
+    This function performs the fit from a single starting point of the multistart engine, and it is executed
+    by the worker processes. A failed fit returns a result with nan parameters and infinite cost.
+    """
+
+    function, num_var, x_values, y_values, sigma, start, bounds, loss = task
+    try:
+        fitting_function = _task_fitting_function(function, num_var)
+        return _least_squares(fitting_function, x_values, y_values, start, bounds, sigma, "trf", loss)
+    except Exception as error:
+        nan_values = np.full(num_var, np.nan)
+        return FitResult(nan_values, nan_values, np.full((num_var, num_var), np.nan), np.nan, np.inf, 0, "trf",
+                         "{}: {}".format(type(error).__name__, error))
+
+
+def bootstrap_fit(
+        fitting_function: types.FunctionType,
+        x_values: np.ndarray,
+        y_values: np.ndarray,
+        popt: np.ndarray,
+        samples: int = 1000,
+        method: str = "residuals",
+        confidence: float = 0.95,
+        sigma: np.ndarray = None,
+        bounds: tuple = None,
+        engine: str = "curve_fit",
+        loss: str = "linear",
+        jobs: int = 1,
+        seed: int = 0
+) -> dict:
+
+    """
+    Parameters
+    ----------
+    fitting_function (types.FunctionType): function generated by generate_fitting_function()
+    x_values (np.ndarray): x values
+    y_values (np.ndarray): y values
+    popt (np.ndarray): values of the fitting parameters of the fit of the original data
+    samples (int): number of bootstrap samples
+    method (str): "residuals" to resample the residuals of the fit, "points" to resample the (x, y) points
+    confidence (float): confidence level of the intervals
+    sigma (np.ndarray): uncertainties of the y values, if None the fits are not weighted
+    bounds (tuple): (lower bounds, upper bounds) of the fitting parameters, if None they are not bounded
+    engine (str): optimizer used for the fits, see run_fit() (the multistart engine is replaced by trf)
+    loss (str): loss function of the trf engine
+    jobs (int): number of worker processes, if 1 the fits are performed in the current process
+    seed (int): seed of the random resampling
+
+    Returns
+    -------
+    bootstrap (dict): dictionary with the fitting parameters of every successful bootstrap fit ("samples",
+                      a matrix samples x parameters), the lower and upper limits of the percentile intervals
+                      ("lower", "upper") and the number of failed fits ("failed")
+
+    Notes
+    -----
+    Every bootstrap sample is a new set of data, obtained resampling with replacement the residuals of the fit
+    (added to the fitting curve) or the points. With the uncertainties, the residuals are resampled divided by
+    them. Every sample is fitted starting from <popt>, and the intervals are the percentiles of the results.
+    The samples are generated and fitted in batches: the indexes of a whole batch are drawn at once, and the
+    batches are spread across <jobs> worker processes, where the fitting function is compiled only once.
+    The batches do not depend on <jobs>, so the results are the same for any number of processes.
+    """
+
+    if method not in ["residuals", "points"]:
+        raise NameError("The bootstrap method must be 'residuals' or 'points'")
+
+    x_values, y_values = np.asarray(x_values, dtype=np.float64), np.asarray(y_values, dtype=np.float64)
+    sigma = None if sigma is None else np.asarray(sigma, dtype=np.float64)
+    engine_options = {"engine": "trf" if engine == "multistart" else engine, "loss": loss}
+
+    # a batch contains at most _BOOTSTRAP_BATCH_SAMPLES samples, and at most _BOOTSTRAP_BATCH_VALUES resampled values
+    batch_size = max(1, min(samples, _BOOTSTRAP_BATCH_SAMPLES, _BOOTSTRAP_BATCH_VALUES // len(y_values)))
+    sizes = [min(batch_size, samples - start) for start in range(0, samples, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(_task_function(fitting_function), _num_var(fitting_function), x_values, y_values, sigma,
+              np.asarray(popt), bounds, method, size, batch_seed, engine_options)
+             for size, batch_seed in zip(sizes, seeds)]
+    estimates = np.concatenate(_map_jobs(_bootstrap_worker, tasks, _task_jobs(fitting_function, jobs)))
+
+    successful = estimates[np.all(np.isfinite(estimates), axis=1)]
+    if len(successful) == 0:
+        raise RuntimeError("All the bootstrap fits failed")
+    tail = (1 - confidence) / 2 * 100
+    lower, upper = np.percentile(successful, [tail, 100 - tail], axis=0)
+
+    return {"samples": successful, "lower": lower, "upper": upper, "failed": samples - len(successful)}
+
+
+# maximum number of samples and of resampled values generated at once by a bootstrap batch
+_BOOTSTRAP_BATCH_SAMPLES = 100
+_BOOTSTRAP_BATCH_VALUES = 2 ** 22
+
+
+def _bootstrap_worker(
+        task: tuple  # (fitting function, see _task_function(), number of parameters, x values, y values, sigma,
+                     # popt, bounds, method, number of samples, seed, engine options)
+) -> np.ndarray:
+
+    """
+    Notes
+    -----
+    This function generates and fits a batch of bootstrap samples of bootstrap_fit(), and it is executed by the
+    worker processes. It returns a matrix with the fitting parameters of every sample, nan for the failed fits.
+    """
+
+    function, num_var, x_values, y_values, sigma, popt, bounds, method, size, seed, engine_options = task
+    fitting_function = _task_fitting_function(function, num_var)
+    rng = np.random.default_rng(seed)
+    indexes = rng.integers(0, len(y_values), size=(size, len(y_values)))
+
+    if method == "residuals":
+        model = np.broadcast_to(fitting_function(x_values, *popt), y_values.shape)
+        if sigma is None:
+            resampled_y = model + (y_values - model)[indexes]
+        else:
+            resampled_y = model + sigma * ((y_values - model) / sigma)[indexes]
+        resampled_x, resampled_sigma = None, None
+    else:
+        resampled_y, resampled_x = y_values[indexes], x_values[indexes]
+        resampled_sigma = None if sigma is None else sigma[indexes]
+
+    estimates = np.full((size, num_var), np.nan)
+    for idx in range(size):
+        x_sample = x_values if resampled_x is None else resampled_x[idx]
+        sigma_sample = sigma if resampled_sigma is None else resampled_sigma[idx]
+        try:
+            estimates[idx] = run_fit(fitting_function, x_sample, resampled_y[idx], popt, bounds, sigma_sample,
+                                     **engine_options).popt
+        except Exception:
+            pass  # the failed fits are left as nan
+    return estimates
+
+
+def fit_many(
+        fitting_function: types.FunctionType,
+        datasets: list,
+        jobs: int = 1,
+        p0: np.ndarray = None,
+        bounds: tuple = None,
+        engine: str = "curve_fit",
+        loss: str = "linear",
+        starts: int = 10
+) -> list:
+
+    """
+    Parameters
+    ----------
+    fitting_function (types.FunctionType): function generated by generate_fitting_function()
+    datasets (list): list of (x values, y values) pairs to fit, or (x values, y values, uncertainties of y)
+                     for the weighted fits
+    jobs (int): number of worker processes, if 1 the fits are performed in the current process
+    p0 (np.ndarray): initial values of the fitting parameters, the same for every dataset
+    bounds (tuple): (lower bounds, upper bounds) of the fitting parameters, the same for every dataset
+    engine (str): optimizer used for the fits, see run_fit()
+    loss (str): loss function of the trf and multistart engines
+    starts (int): number of starting points of the multistart engine
+
+    Returns
+    -------
+    results (list): list of (popt, perr, status) tuples, in the same order of <datasets>
+
+    Notes
+    -----
+    This function fits every dataset in <datasets> with <fitting_function>, spreading the fits across <jobs>
+    worker processes. The workers rebuild the fitting function from its string form, since the generated
+    functions can not be pickled; the other python functions are fitted in the current process (see _task_jobs()).
+    A failed fit does not stop the others: its popt and perr are filled with nan and the error is written in its
+    status, that is "ok" for the successful fits.
+    """
+
+    tasks = [(_task_function(fitting_function), _num_var(fitting_function), np.asarray(x_values),
+              np.asarray(y_values), None if len(sigma) == 0 or sigma[0] is None else np.asarray(sigma[0]), p0,
+              bounds, {"engine": engine, "loss": loss, "starts": starts}) for x_values, y_values, *sigma in datasets]
+    return _map_jobs(_fit_worker, tasks, _task_jobs(fitting_function, jobs))
+
+
+def _fit_worker(
+        task: tuple  # (fitting function, see _task_function(), number of parameters, x values, y values, sigma, p0,
+                     # bounds, engine options)
+) -> tuple:
+
+    """
+    Notes
+    -----
+    This function performs a single fit of fit_many(), and it is executed by the worker processes.
+    """
+
+    function, num_var, x_values, y_values, sigma, p0, bounds, engine_options = task
+    try:
+        fitting_function = _task_fitting_function(function, num_var)
+        result = run_fit(fitting_function, x_values, y_values, p0, bounds, sigma, **engine_options)
+        return result.popt, result.perr, "ok"
+    except Exception as error:
+        return np.full(num_var, np.nan), np.full(num_var, np.nan), "{}: {}".format(type(error).__name__, error)
+
+
+def global_fit(
+        fitting_function: types.FunctionType,
+        datasets: list,
+        shared: list,
+        p0: np.ndarray = None,
+        bounds: tuple = None
+) -> [np.ndarray, np.ndarray, dict]:
+
+    """
+    Parameters
+    ----------
+    fitting_function (types.FunctionType): function generated by generate_fitting_function()
+    datasets (list): list of (x values, y values) pairs to fit, or (x values, y values, uncertainties of y)
+                     for the weighted fits
+    shared (list): numbers of the parameters shared by all the datasets (i.e. [2] if var2 is shared)
+    p0 (np.ndarray): initial values of the fitting parameters, the same for every dataset
+    bounds (tuple): (lower bounds, upper bounds) of the fitting parameters, the same for every dataset
+
+    Returns
+    -------
+    popt (np.ndarray): values of the fitting parameters, with a row for every dataset (datasets x parameters)
+    perr (np.ndarray): standard deviations of the fitting parameters, with the same shape of popt
+    statistics (dict): chi square, degrees of freedom and reduced chi square of the global fit
+
+    Notes
+    -----
+    All the datasets are fitted at once, as a single least squares problem whose residuals are the residuals
+    of every dataset stacked in one vector. The shared parameters are the same for all the datasets, the
+    others are fitted separately for every dataset. At every iteration the compiled fitting function (and
+    its analytic jacobian, if it exists) is evaluated once on every dataset.
+    If the uncertainties are given, the residuals are weighted and perr are absolute errors, otherwise perr
+    are scaled with the reduced chi square, as in curve_fit. An error is raised if the fit does not converge.
+    """
+
+    from scipy.optimize import least_squares
+
+    num_var = _num_var(fitting_function)
+    shared_indexes = sorted({int(number) - 1 for number in shared})
+    if any(idx < 0 or idx >= num_var for idx in shared_indexes):
+        raise NameError("The shared parameters must range from 1 to {}".format(num_var))
+    if len(datasets) == 0:
+        raise NameError("There are no datasets to fit")
+
+    # position of the parameters of every dataset in the vector of all the parameters of the global fit:
+    # the shared parameters come first, then the parameters of every dataset
+    own_indexes = [idx for idx in range(num_var) if idx not in shared_indexes]
+    num_global = len(shared_indexes) + len(datasets) * len(own_indexes)
+    parameter_map = np.empty((len(datasets), num_var), dtype=int)
+    parameter_map[:, shared_indexes] = np.arange(len(shared_indexes))
+    parameter_map[:, own_indexes] = len(shared_indexes) + np.arange(len(datasets) * len(own_indexes)).reshape(
+        len(datasets), len(own_indexes))
+
+    # blocks of the stacked residuals, the uncertainties are converted to weights
+    blocks = []
+    for x_values, y_values, *sigma in datasets:
+        weight = None if len(sigma) == 0 or sigma[0] is None else 1 / np.asarray(sigma[0], dtype=np.float64)
+        blocks.append((np.asarray(x_values, dtype=np.float64), np.asarray(y_values, dtype=np.float64), weight))
+    edges = np.cumsum([0] + [len(y_values) for _, y_values, _ in blocks])
+
+    def stacked_residuals(parameters):
+        residuals = np.empty(edges[-1])
+        for idx, (x_values, y_values, weight) in enumerate(blocks):
+            block = residuals[edges[idx]:edges[idx + 1]]
+            block[:] = fitting_function(x_values, *parameters[parameter_map[idx]])
+            block -= y_values
+            if weight is not None:
+                block *= weight
+        return residuals
+
+    jacobian = getattr(fitting_function, "jacobian", None)
+
+    def stacked_jacobian(parameters):
+        # every block of rows depends only on the parameters of its dataset
+        jac = np.zeros((edges[-1], num_global))
+        for idx, (x_values, _, weight) in enumerate(blocks):
+            block_jac = jacobian(x_values, *parameters[parameter_map[idx]])
+            if weight is not None:
+                block_jac *= weight[:, None]
+            jac[edges[idx]:edges[idx + 1], parameter_map[idx]] = block_jac
+        return jac
+
+    # initial values and bounds of all the parameters
+    initial_values = np.empty(num_global)
+    lower, upper = np.full(num_global, -np.inf), np.full(num_global, np.inf)
+    for (x_values, y_values, _), indexes in zip(blocks, parameter_map):
+        start = _initial_values(fitting_function, x_values, y_values, p0, bounds)
+        initial_values[indexes] = np.ones(num_var) if start is None else start
+        if bounds is not None:
+            lower[indexes], upper[indexes] = bounds
+    bounded = np.any(np.isfinite(lower)) or np.any(np.isfinite(upper))
+    if bounded:
+        # the starting point must be within the bounds, also when it is given by the user
+        initial_values = np.clip(initial_values, lower, upper)
+
+    result = least_squares(stacked_residuals, initial_values, jac="2-point" if jacobian is None else stacked_jacobian,
+                           bounds=(lower, upper), method="trf" if bounded else "lm")
+    if not result.success:
+        raise RuntimeError("Optimal parameters not found: " + result.message)
+
+    chi2 = float(np.dot(result.fun, result.fun))
+    degrees_of_freedom = edges[-1] - num_global
+    reduced_chi2 = chi2 / degrees_of_freedom if degrees_of_freedom > 0 else np.nan
+    pcov = _covariance(result.jac, chi2, degrees_of_freedom, any(weight is not None for _, _, weight in blocks))
+    perr = np.sqrt(np.diag(pcov))
+
+    statistics = {"chi2": chi2, "degrees of freedom": degrees_of_freedom, "reduced chi2": reduced_chi2}
+    return result.x[parameter_map], perr[parameter_map], statistics
+
+
+def _num_var(
+        fitting_function: types.FunctionType  # function used for the fit
+) -> int:
+
+    """
+    Notes
+    -----
+    This function returns the number of fitting parameters of <fitting_function>: the attribute <num_var> of the
+    functions generated by generate_fitting_function(), otherwise the number of arguments after x of the python
+    function. An error is raised if they can not be counted (i.e. f(x, *parameters)).
+    """
+
+    num_var = getattr(fitting_function, "num_var", None)
+    if num_var is not None:
+        return num_var
+    parameters = list(inspect.signature(fitting_function).parameters.values())[1:]
+    if any(parameter.kind in [inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.VAR_KEYWORD]
+           for parameter in parameters):
+        raise TypeError("The number of parameters of the fitting function can not be counted, use a function "
+                        "with an argument for every parameter or generate_fitting_function()")
+    return len(parameters)
+
+
+def _task_function(
+        fitting_function: types.FunctionType  # function used for the fit
+):
+
+    """
+    Notes
+    -----
+    This function returns the form of <fitting_function> sent to the workers of _map_jobs(): the string of the
+    functions generated by generate_fitting_function(), from which they are rebuilt, or the python function
+    itself, that is then used in the current process (see _task_jobs()).
+    """
+
+    return getattr(fitting_function, "expression", fitting_function)
+
+
+def _task_fitting_function(
+        function,  # fitting function returned by _task_function()
+        num_var: int  # number of fitting parameters
+) -> types.FunctionType:
+
+    """
+    Notes
+    -----
+    This function returns the fitting function of a task created with _task_function().
+    """
+
+    return generate_fitting_function(function, num_var) if isinstance(function, str) else function
+
+
+def _task_jobs(
+        fitting_function: types.FunctionType,  # function used for the fit
+        jobs: int  # number of worker processes requested
+) -> int:
+
+    """
+    Notes
+    -----
+    This function returns the number of worker processes used for the tasks of <fitting_function>: the python
+    functions that are not generated by generate_fitting_function() can not be sent to other processes, so they
+    are fitted in the current process.
+    """
+
+    return jobs if hasattr(fitting_function, "expression") else 1
+
 
-    # fitting procedure
-    popt, pcov = curve_fit(fitting_function, x_values, y_values)
-    perr = np.sqrt(np.diag(pcov))
+def _map_jobs(
+        function: types.FunctionType,  # function to apply, it must be defined at module level
+        iterable: list,  # arguments of <function>
+        jobs: int = 1  # number of worker processes
+) -> list:
 
-    # printing the fitting parameters
-    for idx, par in enumerate(popt):
-        print("parameter {}: ".format(idx + 1), ufloat(par, perr[idx]))
+    """
+    Notes
+    -----
+    This function applies <function> to every element of <iterable> and returns the results in the same order.
+    If <jobs> is 1 the calls are made in the current process, otherwise they are spread across a
+    pool of <jobs> worker processes (None uses all the available CPUs).
+    """
 
-    # plotting the data and the fitting curve
-    fig, axs = plt.subplots(1)
-    axs.tick_params(axis='both', labelsize=15)
-    axs.plot(x_values, y_values, ".", markersize=10, label="data (col {})".format(y_index))
-    axs.plot(x_values, fitting_function(x_values, *popt), "--", linewidth=2.1, label="fit")
-    axs.set_xlabel(x_label, fontsize=15)
-    axs.set_ylabel(y_label, fontsize=15)
-    axs.legend(fontsize=15)
-    fig.tight_layout()
+    from concurrent.futures import ProcessPoolExecutor
 
-    plt.show()
-    return popt, perr, fig
+    if jobs is not None and jobs < 1:
+        raise NameError("The number of jobs must be a positive integer")
+    if jobs == 1 or len(iterable) <= 1:
+        return list(map(function, iterable))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(function, iterable))
 
 
 def valid_function(
@@ -199,42 +2068,35 @@ def valid_function(
     Notes
     -----
     This function check if <str_funct> can be used as fitting function.
-    The function is valid if contains mathematical operation that are included in the numpy module.
-    Moreover, it can contain x as variable, and some parameter (var1 -> var5).
+    The function is valid if it contains numbers, constants, the operators + - * / ** and the functions listed
+    in expression.FUNCTIONS. Moreover, it can contain x as variable, and any number of parameters (var1, var2, ...).
+    If the function is not valid, the error is printed with the position of the token that can not be used.
+    The names of the built-in models (see models.get_model()) are valid fitting functions.
     """
 
-    # creating a dictionary with all the constants
-    constants = read_constants().to_numpy()
-    dic = dict(zip(constants.T[0], constants.T[1]))
-
-    # dictionary with all the allowed simbols/operations
-    numpy_names = {k: v for k, v in np.__dict__.items() if not k.startswith("__")}
-    variables_names = {"x": "x", "var1": "var1", "var2": "var2", "var3": "var3", "var4": "var4", "var5": "var5"}
-    ALLOWED_NAMES = {**numpy_names, **variables_names, **dic}
-    # Compile the expression
-    code = compile(str_funct, "<string>", "eval")
+    if models.get_model(str_funct) is not None:
+        return True
+    try:
+        variables = ["x"] + ["var{}".format(idx + 1) for idx in range(count_parameters(str_funct))]
+        ex.parse_expression(str_funct, variables, get_constants())
+    except NameError as error:
+        print(error)
+        return False
 
-    valid = True
-
-    # Check for not allowed names
-    for name in code.co_names:
-        if name not in ALLOWED_NAMES and valid:
-            print("{} can not be used".format(name))
-            valid = False
-
-    return valid
+    return True
 
 
 def generate_fitting_function(
         str_funct: str,  # fitting function written as string
-        num_var: int  # number of fitting parameters
+        num_var: int = None  # number of fitting parameters
 ) -> types.FunctionType:
 
     """
     Parameters
     ----------
     str_funct (str): fitting function written as string
-    num_var (int): number of fitting parameters
+    num_var (int): number of fitting parameters, if None it is the highest index N of the parameters varN
+                   used in <str_funct>
 
     Returns
     -------
@@ -243,69 +2105,152 @@ def generate_fitting_function(
     Notes
     -----
     Given a string with written the fitting function,this function returns a usable fitting function.
+    The fitting function takes x and the parameters var1 ... varN as positional arguments, and its signature
+    lists them so that curve_fit can count the parameters. An error is raised if <str_funct> uses a parameter
+    with index higher than <num_var>, or if it can not be used (see valid_function()).
+    The expression is compiled only once for every combination of <str_funct>, <num_var> and
+    constants file version, so repeated fits of the same model skip the compilation.
+    The analytic jacobian of the function is stored in the attribute <jacobian> of the returned function,
+    <str_funct> and <num_var> in the attributes <expression> and <num_var>.
+    <str_funct> can also be the name of a built-in model (i.e. "gaussian", see models.get_model()): in this case
+    the function and its jacobian are the hand-written ones of the model, and the attribute <initial_guess>
+    is the function that computes the initial values of the parameters from the data (None for the other
+    fitting functions).
     """
 
-    # creating a dictionary with all the constants
-    constants = read_constants().to_numpy()
-    dic = dict(zip(constants.T[0], constants.T[1]))
-
-    # creating the fitting function depending on the number of fitting parameters
-    if num_var == 1:
-        def fitting_function(x, var1):
-            # creating dictionary with all constants and parameters that is passed to ne.evaluate()
-            variables_names = {"x": x, "var1": var1}
-            param_and_const = {**variables_names, **dic}
-            return ne.evaluate(str_funct, local_dict=param_and_const)
-
-    elif num_var == 2:
-        def fitting_function(x, var1, var2):
-            # creating dictionary with all constants and parameters that is passed to ne.evaluate()
-            variables_names = {"x": x, "var1": var1, "var2": var2}
-            param_and_const = {**variables_names, **dic}
-            return ne.evaluate(str_funct, local_dict=param_and_const)
-
-    elif num_var == 3:
-        def fitting_function(x, var1, var2, var3):
-            # creating dictionary with all constants and parameters that is passed to ne.evaluate()
-            variables_names = {"x": x, "var1": var1, "var2": var2, "var3": var3}
-            param_and_const = {**variables_names, **dic}
-            return ne.evaluate(str_funct, local_dict=param_and_const)
-
-    elif num_var == 4:
-        def fitting_function(x, var1, var2, var3, var4):
-            # creating dictionary with all constants and parameters that is passed to ne.evaluate()
-            variables_names = {"x": x, "var1": var1, "var2": var2, "var3": var3, "var4": var4}
-            param_and_const = {**variables_names, **dic}
-            return ne.evaluate(str_funct, local_dict=param_and_const)
-
-    elif num_var == 5:
-        def fitting_function(x, var1, var2, var3, var4, var5):
-            # creating dictionary with all constants and parameters that is passed to ne.evaluate()
-            variables_names = {"x": x, "var1": var1, "var2": var2, "var3": var3, "var4": var4, "var5": var5}
-            param_and_const = {**variables_names, **dic}
-            return ne.evaluate(str_funct, local_dict=param_and_const)
-
+    model = models.get_model(str_funct)
+    used_num_var = count_parameters(str_funct)
+    if num_var is None:
+        num_var = used_num_var
+    if num_var < 1:
+        raise NameError("The fitting function must have at least one fitting parameter")
+    if used_num_var > num_var:
+        raise NameError("var{} is used, but the number of fitting parameters is {}".format(used_num_var, num_var))
+    if model is not None and num_var != used_num_var:
+        raise NameError("The model {} has {} fitting parameters".format(str_funct.strip(), used_num_var))
+
+    if model is not None:
+        evaluate, jacobian = model.function, model.jacobian
     else:
-        raise NameError("The number of parameters must range from 1 to 5")
+        # the expression and its derivatives are compiled once, the compiled evaluators are cached
+        constants_version = _constants_version()
+        evaluate = _compiled_expression(str_funct, num_var, constants_version)
+        # analytic jacobian used by curve_fit, None if the expression can not be differentiated
+        jacobian = _compiled_jacobian(str_funct, num_var, constants_version)
+
+    # the same function is used for any number of parameters, they are passed unchanged to the evaluator
+    def fitting_function(x, *parameters):
+        return evaluate(x, *parameters)
+
+    fitting_function.__signature__ = inspect.Signature(
+        [inspect.Parameter(name, inspect.Parameter.POSITIONAL_ONLY)
+         for name in ["x"] + ["var{}".format(i + 1) for i in range(num_var)]])
+
+    fitting_function.jacobian = jacobian
+    fitting_function.initial_guess = None if model is None else model.initial_guess
+    # string form of the function, used to rebuild it in other processes
+    fitting_function.expression = str_funct
+    fitting_function.num_var = num_var
 
     return fitting_function
 
 
-def fitting_procedure(
+# names of the fitting parameters: var1, var2, ...
+_PARAMETER_NAME = re.compile(r"var[1-9][0-9]*")
+
+
+def count_parameters(
+        str_funct: str
+) -> int:
+
+    """
+    Parameters
+    ----------
+    str_funct (str): fitting function written as string
+
+    Returns
+    -------
+    num_var (int): highest index N of the fitting parameters varN used in <str_funct>, 0 if there are none.
+                   For the built-in models, it is the number of parameters of the model
+    """
+
+    model = models.get_model(str_funct)
+    if model is not None:
+        return len(model.parameters)
+    indexes = [int(node.id[3:]) for node in ast.walk(ex.parse_tree(str_funct))
+               if isinstance(node, ast.Name) and _PARAMETER_NAME.fullmatch(node.id)]
+    return max(indexes, default=0)
+
+
+@functools.lru_cache(maxsize=64)
+def _compiled_expression(
+        str_funct: str,  # fitting function written as string
+        num_var: int,  # number of fitting parameters
+        constants_version: tuple  # version of the constants file, see _constants_version()
+) -> callable:
+
+    """
+    Notes
+    -----
+    This function compiles <str_funct> into a reusable evaluator, with the constants folded in as literals.
+    The results are kept in a LRU cache, <constants_version> is part of the key so that a modified
+    constants file invalidates the compiled expressions.
+    """
+
+    # creating a dictionary with all the constants
+    dic = get_constants()
+
+    variables = ["x"] + ["var{}".format(i + 1) for i in range(num_var)]
+    return ex.compile_expression(str_funct, variables, dic)
+
+
+@functools.lru_cache(maxsize=64)
+def _compiled_jacobian(
+        str_funct: str,  # fitting function written as string
+        num_var: int,  # number of fitting parameters
+        constants_version: tuple  # version of the constants file, see _constants_version()
+) -> callable:
 
+    """
+    Notes
+    -----
+    This function differentiates <str_funct> with respect to the fitting parameters and compiles the result.
+    None is returned if the expression contains an operation that can not be differentiated, in this case
+    curve_fit will estimate the jacobian with finite differences.
+    """
+
+    # creating a dictionary with all the constants
+    dic = get_constants()
+
+    variables = ["x"] + ["var{}".format(i + 1) for i in range(num_var)]
+    try:
+        return ex.compile_jacobian(str_funct, variables, dic)
+    except NameError:
+        return None
+
+
+def fitting_procedure(
+        show_plot: bool = True,
+        save_plot: str = None
 ) -> [np.ndarray, np.ndarray, matplotlib.figure.Figure]:
 
     """
+    Parameters
+    ----------
+    show_plot (bool): if False, the plot is not shown
+    save_plot (str): path where the plot is saved, if None the plot is not saved
+
     Returns
     -------
     popt (np.ndarray): values of the fitting parameters
     perr (np.ndarray): standard deviations of the fitting parameters
-    fig (matplotlib.figure.Figure): figure containing the plot
+    fig (matplotlib.figure.Figure): figure containing the plot, None if the plot is neither shown nor saved
 
     Notes
     -----
     This function will ask the user some parameters in order to perform a fit: path, number of rows to
-    skip, indexes of x-values and y-values, number of parameter, fitting function and labels of chart axis.
+    skip, indexes of x-values, y-values and their uncertainties, number of parameter, fitting function
+    and labels of chart axis.
     """
 
     # asking the user for all the parameters
@@ -314,10 +2259,15 @@ def fitting_procedure(
     if not os.path.exists(path):
         raise NameError("The file does not exist")
     rows_to_skip = int(input("Number of rows to skip: "))
-    data = read_data(path, rows_to_skip)
     x_index = int(input("Index of x data: "))
     y_index = int(input("Index of y data: "))
-    num_var = int(input("Number of fitting parameters (max 5): "))
+    sigma_index = input("Index of the uncertainties of y data (empty for an unweighted fit): ").strip()
+    sigma_index = int(sigma_index) if sigma_index != "" else None
+
+    # reading only the x, y and sigma columns
+    columns = [x_index, y_index] + ([] if sigma_index is None else [sigma_index])
+    data = read_data(path, rows_to_skip, columns)
+    num_var = int(input("Number of fitting parameters: "))
 
     colored_variables = ""
     for i in range(num_var):
@@ -334,7 +2284,8 @@ def fitting_procedure(
         fitting_function = generate_fitting_function(str_fitting_function, num_var)
         x_title = input("X axis title: ")
         y_title = input("Y axis title: ")
-        return fit_data(data, fitting_function, x_index, y_index, x_title, y_title)
+        return fit_data(data, fitting_function, 0, 1, x_title, y_title, show_plot, save_plot=save_plot,
+                        sigma_index=None if sigma_index is None else 2)
 
 
 def initialize_conf_file(
@@ -359,47 +2310,609 @@ def initialize_conf_file(
 
 def fitting_from_conf(
         path_to_conf_file: str,  # path to configuration file
+        show_plot: bool = True,  # if False, the plot is not shown
+        jobs: int = 1,  # number of worker processes used when more y columns are fitted
+        save_plot: str = None,  # path where the plot is saved
+        engine: str = None,  # optimizer used for the fit
+        loss: str = None,  # loss function of the trf and multistart engines
+        starts: int = None,  # number of starting points of the multistart engine
+        bootstrap: int = 0,  # number of bootstrap samples
+        bootstrap_method: str = "residuals"  # "residuals" or "points"
 ) -> [np.ndarray, np.ndarray, matplotlib.figure.Figure]:
     """
     Parameters
     ----------
     path_to_conf_file (str): path to configuration file
+    show_plot (bool): if False, the plot is not shown
+    jobs (int): number of worker processes used when more y columns are fitted (or by the multistart engine)
+    save_plot (str): path where the plot is saved, if None the plot is not saved
+    engine (str): optimizer used for the fit (see run_fit()), if None the one of the configuration file is used
+    loss (str): loss function of the trf and multistart engines, if None the one of the configuration file is used
+    starts (int): number of starting points of the multistart engine, if None the one of the configuration file
+                  is used
+    bootstrap (int): number of bootstrap samples used to compute the 95% intervals of the parameters, 0 to not
+                     compute them
+    bootstrap_method (str): "residuals" or "points", see bootstrap_fit()
 
     Returns
     -------
     popt (np.ndarray): values of the fitting parameters
     perr (np.ndarray): standard deviations of fitting parameters
-    fig (matplotlib.figure.Figure): figure containing the plot
+    fig (matplotlib.figure.Figure): figure containing the plot, None if the plot is neither shown nor saved
 
     Notes
     -----
     Given a valid configuration file, the function performs a fit.
     The parameters for the fitting procedure are: path (str), rows to skip (int),
-    x data index (int), y data index (int), number fitting parameters (int),
-    fitting function (str), x-axis title (str), y-axis title (str).
+    x data index (int), y data index (int, list of int separated by spaces or "all"),
+    number fitting parameters (int, optional: by default it is the highest N of the parameters varN),
+    fitting function (str, an expression or the name of a built-in model, see models.MODELS), x-axis title (str),
+    y-axis title (str).
+    Big .txt and .csv files can be read in chunks with the optional parameters chunk size (int),
+    decimation (int) and aggregate (bool), see read_data().
+    The optional parameters initial values, lower bounds and upper bounds (one number for every fitting
+    parameter, separated by spaces, inf can be used as bound) set the starting point and the bounds of the fit.
+    The optional parameter sigma data index (int, or list of int with one index for every y column) selects
+    the uncertainties of the y values, used to weight the fit.
+    The optional parameters engine (str, default curve_fit), loss (str, default linear) and starts (int,
+    default 10) select the optimizer, see run_fit().
+    An error is raised if the fitting function can not be used.
+    """
+
+    parameters = read_conf_file(path_to_conf_file)
+    data, x_index, y_index, sigma_index, _ = _read_conf_data(parameters)
+
+    # fitting procedure if the fitting function is valid
+    if not valid_function(parameters["fitting function"]):
+        raise NameError("The fitting function can not be used")
+    fitting_function = generate_fitting_function(parameters["fitting function"],
+                                                 parameters["number fitting parameters"])
+    return fit_data(data, fitting_function, x_index, y_index,
+                    parameters["x-axis title"], parameters["y-axis title"], show_plot, jobs, save_plot,
+                    parameters["initial values"], _conf_bounds(parameters), sigma_index,
+                    parameters["engine"] if engine is None else engine,
+                    parameters["loss"] if loss is None else loss,
+                    parameters["starts"] if starts is None else starts, bootstrap, bootstrap_method)
+
+
+def watch_fit(
+        path_to_conf_file: str,
+        show_plot: bool = True,
+        interval: float = 1.0,
+        max_polls: int = None,
+        engine: str = None,
+        loss: str = None,
+        starts: int = None
+) -> [np.ndarray, np.ndarray, matplotlib.figure.Figure]:
+
+    """
+    Parameters
+    ----------
+    path_to_conf_file (str): path to configuration file
+    show_plot (bool): if False, the plot is not shown and the parameters are only printed
+    interval (float): seconds between two checks of the data file
+    max_polls (int): maximum number of checks of the data file, None to watch it until the figure is closed
+                     (or forever if the plot is not shown)
+    engine (str): optimizer used for the fit (see run_fit()), if None the one of the configuration file is used
+    loss (str): loss function of the trf and multistart engines, if None the one of the configuration file is used
+    starts (int): number of starting points of the multistart engine, if None the one of the configuration file
+                  is used
+
+    Returns
+    -------
+    popt (np.ndarray): values of the fitting parameters of the last fit
+    perr (np.ndarray): standard deviations of the fitting parameters of the last fit
+    fig (matplotlib.figure.Figure): figure containing the plot, None if the plot is not shown
+
+    Notes
+    -----
+    Given a valid configuration file whose data file is being written (.txt or .csv), the fit is performed
+    again every time new rows are appended, and the figure is updated in place.
+    Only the new rows are parsed, and every fit starts from the parameters of the previous one.
+    Only one y column can be fitted. An error is raised if the fitting function can not be used.
+    """
+
+    parameters = read_conf_file(path_to_conf_file)
+    x_index, y_index, sigma_index = parameters["x data index"], parameters["y data index"], \
+        parameters["sigma data index"]
+    if not isinstance(y_index, int) or isinstance(sigma_index, list):
+        raise NameError("Only one y column can be fitted in watch mode")
+    if not valid_function(parameters["fitting function"]):
+        raise NameError("The fitting function can not be used")
+    num_var = parameters["number fitting parameters"]
+    fitting_function = generate_fitting_function(parameters["fitting function"], num_var)
+
+    from uncertainties import ufloat
+
+    fig = None
+    if show_plot:
+        import matplotlib.pyplot as plt
+        fig, axs = plt.subplots(1)
+        axs.tick_params(axis='both', labelsize=15)
+        axs.set_xlabel(parameters["x-axis title"], fontsize=15)
+        axs.set_ylabel(parameters["y-axis title"], fontsize=15)
+        data_line, = axs.plot([], [], ".", markersize=10, label="data")
+        fit_line, = axs.plot([], [], "--", linewidth=2.1, label="fit", color=data_line.get_color())
+        axs.legend(fontsize=15)
+
+    engine = parameters["engine"] if engine is None else engine
+    loss = parameters["loss"] if loss is None else loss
+    starts = parameters["starts"] if starts is None else starts
+
+    popt, perr = parameters["initial values"], None
+    for data in _watch_data(parameters["path"], parameters["rows to skip"], interval, max_polls, fig):
+        x_values, y_values = data[:, x_index], data[:, y_index]
+        sigma = None if sigma_index is None else data[:, sigma_index]
+        if len(x_values) < num_var:
+            continue
+
+        # the fit starts from the parameters of the previous one
+        try:
+            fit = run_fit(fitting_function, x_values, y_values, popt, _conf_bounds(parameters), sigma, engine, loss,
+                          starts)
+        except (RuntimeError, ValueError) as error:
+            print("{} rows: fit failed: {}".format(len(x_values), error))
+            continue
+        popt, perr = fit.popt, fit.perr
+        print("{} rows:".format(len(x_values)),
+              ", ".join("parameter {}: {}".format(idx + 1, ufloat(par, perr[idx])) for idx, par in enumerate(popt)))
+
+        if fig is not None:
+            data_line.set_data(*decimate_minmax(x_values, y_values))
+            fit_values = np.broadcast_to(fitting_function(x_values, *popt), x_values.shape)
+            fit_line.set_data(*decimate_minmax(x_values, fit_values))
+            axs.relim()
+            axs.autoscale_view()
+            fig.canvas.draw_idle()
+
+    return popt, perr, fig
+
+
+def global_fitting_from_conf(
+        pattern: str,
+        shared: list,
+        show_plot: bool = True,
+        save_plot: str = None
+) -> [np.ndarray, np.ndarray, matplotlib.figure.Figure]:
+
+    """
+    Parameters
+    ----------
+    pattern (str): glob pattern matching the configuration files, i.e. 'runs/*.cfg'
+    shared (list): numbers of the parameters shared by all the datasets (i.e. [2] if var2 is shared)
+    show_plot (bool): if False, the plot is not shown
+    save_plot (str): path where the plot is saved, if None the plot is not saved
+
+    Returns
+    -------
+    popt (np.ndarray): values of the fitting parameters, with a row for every dataset (datasets x parameters)
+    perr (np.ndarray): standard deviations of the fitting parameters, with the same shape of popt
+    fig (matplotlib.figure.Figure): figure containing the plot, None if the plot is neither shown nor saved
+
+    Notes
+    -----
+    This function fits at once the datasets described by all the configuration files matching <pattern>
+    (in the order of the file names), with some parameters shared among them, see global_fit().
+    Every selected y column of every configuration file is a dataset. All the configuration files must have the
+    same fitting function, the initial values, the bounds and the axis titles are taken from the first one.
+    """
+
+    from uncertainties import ufloat
+
+    paths_to_conf_files = sorted(glob.glob(pattern))
+    if len(paths_to_conf_files) == 0:
+        raise NameError("No configuration file matches {}".format(pattern))
+
+    all_parameters = [read_conf_file(path_to_conf_file) for path_to_conf_file in paths_to_conf_files]
+    first = all_parameters[0]
+    for parameters in all_parameters:
+        if (parameters["fitting function"], parameters["number fitting parameters"]) != \
+                (first["fitting function"], first["number fitting parameters"]):
+            raise NameError("All the configuration files must have the same fitting function")
+    if not valid_function(first["fitting function"]):
+        raise NameError("The fitting function can not be used")
+    fitting_function = generate_fitting_function(first["fitting function"], first["number fitting parameters"])
+
+    # every y column of every configuration file is a dataset
+    datasets, labels = [], []
+    for path_to_conf_file, parameters in zip(paths_to_conf_files, all_parameters):
+        data, x_index, y_index, sigma_index, columns = _read_conf_data(parameters)
+        y_indexes = _y_indexes(data, x_index, y_index, sigma_index)
+        for y_idx, sigma in zip(y_indexes, _sigma_columns(data, sigma_index, len(y_indexes))):
+            datasets.append((data.T[x_index], data.T[y_idx], sigma))
+            label = os.path.splitext(os.path.basename(path_to_conf_file))[0]
+            labels.append(label if len(y_indexes) == 1 else "{} (col {})".format(label, columns[y_idx]))
+
+    popt, perr, statistics = global_fit(fitting_function, datasets, shared, first["initial values"],
+                                        _conf_bounds(first))
+
+    # printing the fitting parameters, the shared ones only once
+    shared_indexes = {int(number) - 1 for number in shared}
+    for idx in sorted(shared_indexes):
+        print("parameter {} (shared): ".format(idx + 1), ufloat(popt[0, idx], perr[0, idx]))
+    for label, popt_dataset, perr_dataset in zip(labels, popt, perr):
+        for idx in range(fitting_function.num_var):
+            if idx not in shared_indexes:
+                print("{} parameter {}: ".format(label, idx + 1), ufloat(popt_dataset[idx], perr_dataset[idx]))
+    print("chi2: {:.6g}, reduced chi2: {:.6g}".format(statistics["chi2"], statistics["reduced chi2"]))
+
+    curves = [(x_values, y_values, popt_dataset, label, "fit ({})".format(label))
+              for (x_values, y_values, _), popt_dataset, label in zip(datasets, popt, labels)]
+    fig = _plot_fits(fitting_function, curves, first["x-axis title"], first["y-axis title"], show_plot, save_plot)
+    return popt, perr, fig
+
+
+def read_conf_file(
+        path_to_conf_file: str,  # path to configuration file
+) -> dict:
+    """
+    Parameters
+    ----------
+    path_to_conf_file (str): path to configuration file
+
+    Returns
+    -------
+    parameters (dict): parameters of the fitting procedure, with the same names used in the configuration file
+
+    Notes
+    -----
+    This function reads the [fitting parameters] section of a configuration file and converts
+    every parameter to its type. An error is raised if the data file does not exist.
     """
 
     # reading configuration file
     config = configparser.ConfigParser()
     config.read(path_to_conf_file)
+    return _conf_parameters(config)
+
+
+def read_conf_string(
+        configuration: str,
+        directory: str = None,
+        check_path: types.FunctionType = None
+) -> dict:
+
+    """
+    Parameters
+    ----------
+    configuration (str): contents of a configuration file
+    directory (str): directory of the relative path of the data file, if None it is the current working directory
+    check_path (types.FunctionType): function called with the path of the data file before checking that it exists,
+                                     it returns the path to use or raises an error if the file can not be read
+
+    Returns
+    -------
+    parameters (dict): parameters of the fitting procedure, with the same names used in the configuration file
+
+    Notes
+    -----
+    This function is the same as read_conf_file(), for configurations that are not written in a file
+    (i.e. the ones sent to the fit server by another process, see plafi.server).
+    """
+
+    config = configparser.ConfigParser()
+    config.read_string(configuration)
+    return _conf_parameters(config, directory, check_path)
+
+
+def _conf_parameters(
+        config: configparser.ConfigParser,  # parsed configuration file
+        directory: str = None,  # directory of the relative path of the data file, None for the working directory
+        check_path: types.FunctionType = None  # function that checks the path of the data file, see read_conf_string()
+) -> dict:
+
+    """
+    Notes
+    -----
+    This function converts the parameters of the [fitting parameters] section of <config> to their types,
+    see read_conf_file().
+    """
+
+    section = config["fitting parameters"]
 
     # reading all the parameters
-    path = str(config["fitting parameters"]["path"])
-    if not os.path.exists(path):
+    parameters = {
+        "path": os.path.join(directory or "", str(section["path"])),
+        "rows to skip": int(section["rows to skip"]),
+        "x data index": int(section["x data index"]),
+        "y data index": _parse_y_index(section["y data index"]),
+        "sigma data index": _parse_sigma_index(section.get("sigma data index", fallback=None)),
+        "number fitting parameters": section.getint("number fitting parameters", fallback=None),
+        "fitting function": str(section["fitting function"]),
+        "x-axis title": str(section["x-axis title"]),
+        "y-axis title": str(section["y-axis title"]),
+        "sheet": _parse_sheet(section.get("sheet", fallback="0")),
+        # optional parameters used to read big files in chunks
+        "chunk size": section.getint("chunk size", fallback=None),
+        "decimation": section.getint("decimation", fallback=1),
+        "aggregate": section.getboolean("aggregate", fallback=False),
+        # optional starting point and bounds of the fit
+        "initial values": _parse_values(section.get("initial values", fallback=None)),
+        "lower bounds": _parse_values(section.get("lower bounds", fallback=None)),
+        "upper bounds": _parse_values(section.get("upper bounds", fallback=None)),
+        # optional optimizer settings, see run_fit()
+        "engine": section.get("engine", fallback="curve_fit").strip(),
+        "loss": section.get("loss", fallback="linear").strip(),
+        "starts": section.getint("starts", fallback=10),
+    }
+    if check_path is not None:
+        parameters["path"] = check_path(parameters["path"])
+    if not os.path.exists(parameters["path"]):
         raise NameError("The file does not exist")  # an error is raised if the file does not exist
-    rows_to_skip = int(config["fitting parameters"]["rows to skip"])
-    data = read_data(path, rows_to_skip)
-    x_index = int(config["fitting parameters"]["x data index"])
-    y_index = int(config["fitting parameters"]["y data index"])
-    num_var = int(config["fitting parameters"]["number fitting parameters"])
-    str_fitting_function = str(config["fitting parameters"]["fitting function"])
-    x_title = str(config["fitting parameters"]["x-axis title"])
-    y_title = str(config["fitting parameters"]["y-axis title"])
+    # the number of fitting parameters is optional, by default it is given by the fitting function
+    if parameters["number fitting parameters"] is None:
+        parameters["number fitting parameters"] = count_parameters(parameters["fitting function"])
+    for key in ["initial values", "lower bounds", "upper bounds"]:
+        if parameters[key] is not None and len(parameters[key]) != parameters["number fitting parameters"]:
+            raise NameError("The {} must be as many as the fitting parameters".format(key))
 
-    # fitting procedure if the fitting function is valid
-    if valid_function(str_fitting_function):
-        fitting_function = generate_fitting_function(str_fitting_function, num_var)
-        return fit_data(data, fitting_function, x_index, y_index, x_title, y_title)
+    return parameters
+
+
+def _read_conf_data(
+        parameters: dict  # parameters returned by read_conf_file()
+) -> [np.ndarray, int, object, object, list]:
+
+    """
+    Notes
+    -----
+    This function reads the data described by <parameters>. Unless all the columns are fitted, only the x, y and
+    sigma columns are read, and the returned x, y and sigma indexes refer to the columns of the returned matrix.
+    The last returned value is the list of the original indexes of the columns of the returned matrix.
+    """
+
+    x_index, y_index, sigma_index = parameters["x data index"], parameters["y data index"], \
+        parameters["sigma data index"]
+    if isinstance(y_index, str):
+        data = read_data(parameters["path"], parameters["rows to skip"], chunk_size=parameters["chunk size"],
+                         decimation=parameters["decimation"], aggregate=parameters["aggregate"],
+                         sheet=parameters["sheet"])
+        return data, x_index, y_index, sigma_index, list(range(data.shape[1]))
+
+    y_columns = [y_index] if isinstance(y_index, int) else list(y_index)
+    sigma_columns = [] if sigma_index is None else [sigma_index] if isinstance(sigma_index, int) else sigma_index
+    columns = [x_index] + y_columns + list(sigma_columns)
+    data = read_data(parameters["path"], parameters["rows to skip"], columns, parameters["chunk size"],
+                     parameters["decimation"], parameters["aggregate"], parameters["sheet"])
+
+    # indexes of the columns in the returned matrix
+    new_y_index = 1 if isinstance(y_index, int) else list(range(1, len(y_columns) + 1))
+    new_sigma_index = None
+    if sigma_index is not None:
+        new_sigma_index = list(range(len(y_columns) + 1, len(columns)))
+        new_sigma_index = new_sigma_index[0] if isinstance(sigma_index, int) else new_sigma_index
+    return data, 0, new_y_index, new_sigma_index, columns
+
+
+def _parse_sheet(
+        value: str  # value of "sheet" in the configuration file
+):
+
+    """
+    Notes
+    -----
+    This function converts the sheet of a configuration file: an index or the name of the sheet.
+    """
+
+    return int(value) if value.strip().isdigit() else value.strip()
+
+
+def _parse_y_index(
+        value: str  # value of "y data index" in the configuration file
+):
+
+    """
+    Notes
+    -----
+    This function converts the y data index of a configuration file: an integer, a list
+    of integers separated by spaces or "all".
+    """
+
+    if value.strip() == "all":
+        return "all"
+    indexes = list(map(int, value.split()))
+    return indexes[0] if len(indexes) == 1 else indexes
+
+
+def _parse_sigma_index(
+        value: str  # value of "sigma data index" in the configuration file, None if it is not given
+):
+
+    """
+    Notes
+    -----
+    This function converts the sigma data index of a configuration file: an integer or a list of integers
+    separated by spaces (one for every y column). It returns None if <value> is None or empty.
+    """
+
+    if value is None or value.strip() == "":
+        return None
+    indexes = list(map(int, value.split()))
+    return indexes[0] if len(indexes) == 1 else indexes
+
+
+def _parse_values(
+        values: str  # numbers separated by spaces, None if the parameter is not in the configuration file
+) -> np.ndarray:
+
+    """
+    Notes
+    -----
+    This function converts a list of numbers separated by spaces (i.e. "1 -inf 2.5") to an array.
+    It returns None if <values> is None or empty.
+    """
+
+    if values is None or values.strip() == "":
+        return None
+    return np.array([float(value) for value in values.split()])
+
+
+def _conf_bounds(
+        parameters: dict  # parameters returned by read_conf_file()
+) -> tuple:
+
+    """
+    Notes
+    -----
+    This function returns the (lower bounds, upper bounds) of the fit described by <parameters>,
+    or None if no bound is given. A missing lower (upper) bound is -inf (inf).
+    """
+
+    if parameters["lower bounds"] is None and parameters["upper bounds"] is None:
+        return None
+    lower = -np.inf if parameters["lower bounds"] is None else parameters["lower bounds"]
+    upper = np.inf if parameters["upper bounds"] is None else parameters["upper bounds"]
+    return lower, upper
+
+
+def batch_fitting(
+        pattern: str,  # glob pattern matching the configuration files
+        output_path: str = "plafi_results.csv",  # path of the results table
+        plot_dir: str = None,  # directory where the plots are saved
+        jobs: int = 1,  # number of worker processes
+        warm_start: bool = False  # if True, every fit starts from the parameters of the previous one
+) -> pd.DataFrame:
+    """
+    Parameters
+    ----------
+    pattern (str): glob pattern matching the configuration files, i.e. 'runs/*.cfg'
+    output_path (str): path of the results table, .csv (with ";" as separator) or .parquet
+    plot_dir (str): directory where the plot of every fit is saved, if None the plots are not saved
+    jobs (int): number of worker processes, if 1 the fits are performed in the current process
+    warm_start (bool): if True, the fits are performed in the order of the file names, and every fit without
+                       initial values starts from the parameters of the previous successful fit
+
+    Returns
+    -------
+    results (pd.DataFrame): table with a row for every fitted y column of every configuration file,
+                            in the order of the file names
+
+    Notes
+    -----
+    This function performs, in a single process and without showing any plot, the fit described by every
+    configuration file matching <pattern>. The results (parameters, errors, chi square and status of
+    every fit) are saved in a single table. A failed fit does not stop the others, its error is
+    written in the status column.
+    Warm starting is useful for sequential runs of the same measurement, whose parameters change slowly:
+    in this case the fits are performed one after the other in the current process, and <jobs> is ignored.
+    The .parquet tables require pyarrow (pip install plafi[parquet]), an error is raised before performing the
+    fits if it is not installed.
+    """
+
+    import pandas as pd
+
+    paths_to_conf_files = sorted(glob.glob(pattern))
+    if len(paths_to_conf_files) == 0:
+        raise NameError("No configuration file matches {}".format(pattern))
+    if output_path.endswith(".parquet"):
+        try:
+            import pyarrow
+        except ImportError:
+            raise NameError("pyarrow is needed to save the results as .parquet, it can be installed with "
+                            "pip install plafi[parquet]")
+    if plot_dir is not None:
+        os.makedirs(plot_dir, exist_ok=True)
+
+    if warm_start:
+        rows, p0 = [], None
+        for path_to_conf_file in paths_to_conf_files:
+            rows.append(_fit_conf_file(path_to_conf_file, plot_dir, p0=p0))
+            # the parameters of the last successful fit are used as starting point of the next one
+            p0 = next((_row_parameters(row) for row in reversed(rows[-1]) if row["status"] == "ok"), p0)
+    else:
+        fit_conf_file = functools.partial(_fit_conf_file, plot_dir=plot_dir, wait_plot=jobs != 1)
+        rows = _map_jobs(fit_conf_file, paths_to_conf_files, jobs)
+    wait_for_plots()
+    results = pd.DataFrame([row for conf_rows in rows for row in conf_rows])
+    if "y data index" in results:
+        # integer column that can contain missing values (failed configuration files)
+        results["y data index"] = results["y data index"].astype("Int64")
+
+    if output_path.endswith(".parquet"):
+        results.to_parquet(output_path, index=False, engine="pyarrow")
+    else:
+        results.to_csv(output_path, index=False, sep=";")
+    return results
+
+
+def _fit_conf_file(
+        path_to_conf_file: str,  # path to configuration file
+        plot_dir: str = None,  # directory where the plot is saved
+        wait_plot: bool = False,  # if True, the function returns after the plot is written
+        p0: np.ndarray = None  # initial values used if the configuration file does not contain them
+) -> list:
+
+    """
+    Notes
+    -----
+    This function performs the fit described by a configuration file without showing the plot (and without
+    printing the parameters), and returns the rows of the results table of batch_fitting(), one for every fitted
+    y column. The status of a row is "ok" or the error of its fit.
+    The plot is rendered in background, unless <wait_plot> is True (i.e. in the worker processes).
+    <p0> is ignored if its length is not the number of fitting parameters.
+    """
+
+    save_plot = None
+    if plot_dir is not None:
+        save_plot = os.path.join(plot_dir, os.path.splitext(os.path.basename(path_to_conf_file))[0] + ".png")
+
+    try:
+        parameters = read_conf_file(path_to_conf_file)
+        if not valid_function(parameters["fitting function"]):
+            raise NameError("The fitting function can not be used")
+        data, x_index, y_index, sigma_index, columns = _read_conf_data(parameters)
+        fitting_function = generate_fitting_function(parameters["fitting function"],
+                                                     parameters["number fitting parameters"])
+        bounds = _conf_bounds(parameters)
+        if parameters["initial values"] is not None or p0 is None or len(p0) != fitting_function.num_var:
+            p0 = parameters["initial values"]
+        elif bounds is not None:
+            # the parameters of a previous fit could be out of the bounds of this one
+            p0 = np.clip(p0, *bounds)
+        # the error of every failed column is written in its row, as the one of a failed configuration file
+        popts, perrs, statuses = _fit_columns(fitting_function, data, x_index, y_index, sigma_index, p0, bounds,
+                                              parameters["engine"], parameters["loss"], parameters["starts"], 1)
+        x_values = data.T[x_index]
+        y_indexes = _y_indexes(data, x_index, y_index, sigma_index)
+        single_column = isinstance(y_index, (int, np.integer))
+        curves = [(x_values, data.T[y_idx], popt, "data (col {})".format(y_idx),
+                   "fit" if single_column else "fit (col {})".format(y_idx))
+                  for y_idx, popt in zip(y_indexes, popts)]
+        _plot_fits(fitting_function, curves, parameters["x-axis title"], parameters["y-axis title"], False,
+                   save_plot)
+        if wait_plot:
+            wait_for_plots()
+    except Exception as error:
+        return [{"configuration file": path_to_conf_file, "status": "{}: {}".format(type(error).__name__, error)}]
+
+    rows = []
+    for y_idx, sigma, popt_column, perr_column, status in zip(y_indexes,
+                                                              _sigma_columns(data, sigma_index, len(y_indexes)),
+                                                              popts, perrs, statuses):
+        row = {"configuration file": path_to_conf_file, "y data index": columns[y_idx], "status": status}
+        # quality of the fit
+        statistics = fit_statistics(fitting_function, x_values, data.T[y_idx], popt_column, sigma)
+        row["chi2"], row["reduced chi2"] = statistics["chi2"], statistics["reduced chi2"]
+        for idx in range(len(popt_column)):
+            row["parameter {}".format(idx + 1)] = popt_column[idx]
+            row["error {}".format(idx + 1)] = perr_column[idx]
+        rows.append(row)
+
+    return rows
+
+
+def _row_parameters(
+        row: dict  # row of the results table of batch_fitting()
+) -> np.ndarray:
+
+    """
+    Notes
+    -----
+    This function returns the fitting parameters written in a row of the results table of batch_fitting().
+    """
+
+    num_var = sum(1 for key in row if key.startswith("parameter "))
+    return np.array([row["parameter {}".format(idx + 1)] for idx in range(num_var)])
 
 
 def initialize_constants(
@@ -412,12 +2925,75 @@ def initialize_constants(
     This function will initialize the file that contains the constants if it does not exist.
     """
 
-    constants_file_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "plafi_constants.csv")
-    if not os.path.exists(constants_file_path):
+    if not os.path.exists(_constants_file_path()):
         # "pi", "e" and "euler_gamma" are initialized in the constants file, they can be later modified by the user
         save_constants([["pi", np.pi], ["e", np.e], ["euler_gamma", np.euler_gamma]])
 
 
+def _constants_version(
+
+) -> tuple:
+
+    """
+    Returns
+    -------
+    version (tuple): modification time and size of the constants file
+    """
+
+    # a single stat when the file exists, the version is checked before every fit
+    try:
+        stat = os.stat(_constants_file_path())
+    except FileNotFoundError:
+        initialize_constants()
+        stat = os.stat(_constants_file_path())
+    return stat.st_mtime_ns, stat.st_size
+
+
+@functools.lru_cache(maxsize=None)
+def _constants_file_path(
+
+) -> str:
+
+    """
+    Returns
+    -------
+    path (str): path to the file that contains the constants, resolved only once per process
+    """
+
+    return os.path.join(os.path.dirname(os.path.realpath(__file__)), "plafi_constants.csv")
+
+
+# constants read from the constants file, the file is read again only if its version changes
+_constants_registry = {"version": None, "constants": {}}
+
+
+def get_constants(
+
+) -> dict:
+
+    """
+    Returns
+    -------
+    constants (dict): dictionary with the names of the constants and their values
+
+    Notes
+    -----
+    The constants file is read only once per process, and again only when it is modified
+    (see _constants_version()). The file is initialized if it does not exist.
+    """
+
+    version = _constants_version()
+    if _constants_registry["version"] != version:
+        with open(_constants_file_path(), newline="") as f:
+            reader = csv.reader(f, delimiter=";")
+            next(reader, None)  # header
+            constants = {row[0]: float(row[1]) for row in reader if len(row) == 2}
+        _constants_registry["constants"] = constants
+        _constants_registry["version"] = version
+
+    return dict(_constants_registry["constants"])
+
+
 def read_constants(
 
 ) -> pd.DataFrame:
@@ -429,13 +3005,12 @@ def read_constants(
 
     Notes
     -----
-    This function will read the file containing the constants and will return a DataFrame with them.
+    This function will return a DataFrame with the constants returned by get_constants().
     """
 
-    constants_file_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "plafi_constants.csv")
-    constants = pd.read_csv(constants_file_path, index_col=False, sep=";")
+    import pandas as pd
 
-    return constants
+    return pd.DataFrame(list(get_constants().items()), columns=["name", "value"])
 
 
 def print_constants(
@@ -453,11 +3028,10 @@ def print_constants(
     The table will be returned and printed.
     """
 
-    constants = read_constants()
+    from tabulate import tabulate
 
     # table creation
-    table = tabulate(constants, headers=[str(constants.columns[0]), str(constants.columns[1])],
-                     tablefmt="fancy_grid", showindex=False)
+    table = tabulate(list(get_constants().items()), headers=["name", "value"], tablefmt="fancy_grid")
 
     # printing the plan in the table
     print(table)
@@ -475,14 +3049,14 @@ def add_constant(
     If the constant name is not currently used, it will be saved in the constants file.
     """
 
-    constants = read_constants().to_numpy()
+    constants = get_constants()
     name = input("New constant name: ")
     value = float(input("New constant value: "))
-    if name in constants.T[0]:
+    if name in constants:
         raise NameError("This name is already used")
     else:
-        constants = np.vstack([constants, [name, value]])
-        save_constants(constants)
+        constants[name] = value
+        save_constants(list(constants.items()))
 
 
 def save_constants(
@@ -492,15 +3066,22 @@ def save_constants(
     """
     Parameters
     -------
-    constants (np.ndarray): np.ndarray containing all the constants
+    constants (np.ndarray): np.ndarray (or list) containing all the constants as [name, value] rows
 
     Notes
     -----
     Given <constants> it will save them in a .csv file.
+    The file is written in a temporary file and then renamed, so it is never read partially written.
     """
 
-    constants_file_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "plafi_constants.csv")
-    pd.DataFrame(constants, columns=["name", "value"]).to_csv(constants_file_path, index=False, sep=";")
+    constants_file_path = _constants_file_path()
+    temporary_path = "{}.{}.tmp".format(constants_file_path, os.getpid())
+    with open(temporary_path, "w", newline="") as f:
+        writer = csv.writer(f, delimiter=";", lineterminator="\n")
+        writer.writerow(["name", "value"])
+        for name, value in constants:
+            writer.writerow([str(name), repr(float(value))])
+    os.replace(temporary_path, constants_file_path)
 
 
 def delete_constant(
@@ -514,11 +3095,10 @@ def delete_constant(
     exist, it will be deleted from the constants file.
     """
 
-    constants = read_constants()
+    constants = get_constants()
     name = input("Constant name to delete: ")
-    if not np.any(constants["name"].str.contains(name)):
+    if name not in constants:
         raise NameError("This name does not exist")
     else:
-        constants = constants[constants["name"].str.contains(name) == False]
-        constants_file_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "plafi_constants.csv")
-        constants.to_csv(constants_file_path, index=False, sep=";")
+        del constants[name]
+        save_constants(list(constants.items()))
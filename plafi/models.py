@@ -0,0 +1,374 @@
+import collections
+import functools
+import re
+import numpy as np
+
+
+# built-in model: fitting function written as string (equivalent to the model), description of the fitting
+# parameters var1, var2, ..., evaluator, analytic jacobian and initial guess of the parameters from the data
+Model = collections.namedtuple("Model", ["expression", "parameters", "function", "jacobian", "initial_guess"])
+
+
+def _work_array(
+        x_values: np.ndarray  # x values
+) -> np.ndarray:
+    # copy of <x_values> used to compute a model in place, with the same shape of <x_values>
+    return np.array(x_values, dtype=np.float64)
+
+
+def _jacobian_array(
+        x_values: np.ndarray,  # x values
+        num_var: int  # number of fitting parameters
+) -> [np.ndarray, np.ndarray]:
+    # flat x values and empty jacobian, with a contiguous column for every fitting parameter
+    x_values = np.ravel(np.asarray(x_values, dtype=np.float64))
+    return x_values, np.empty((x_values.size, num_var), order="F")
+
+
+def _sorted_points(
+        x_values: np.ndarray,  # x values
+        y_values: np.ndarray  # y values
+) -> [np.ndarray, np.ndarray]:
+    # points sorted by x, without the not finite ones
+    x_values, y_values = np.ravel(np.asarray(x_values, np.float64)), np.ravel(np.asarray(y_values, np.float64))
+    finite = np.isfinite(x_values) & np.isfinite(y_values)
+    x_values, y_values = x_values[finite], y_values[finite]
+    if np.any(np.diff(x_values) < 0):
+        order = np.argsort(x_values, kind="stable")
+        x_values, y_values = x_values[order], y_values[order]
+    return x_values, y_values
+
+
+def gaussian(x, amplitude, center, width, offset):
+    values = _work_array(x)
+    values -= center
+    values /= width
+    np.square(values, out=values)
+    values *= -0.5
+    np.exp(values, out=values)
+    values *= amplitude
+    values += offset
+    return values
+
+
+def gaussian_jacobian(x, amplitude, center, width, offset):
+    x, jac = _jacobian_array(x, 4)
+    distance = (x - center) / width
+    jac[:, 0] = np.exp(-0.5 * distance ** 2)
+    jac[:, 1] = jac[:, 0] * distance * (amplitude / width)
+    jac[:, 2] = jac[:, 1] * distance
+    jac[:, 3] = 1
+    return jac
+
+
+def lorentzian(x, amplitude, center, width, offset):
+    values = _work_array(x)
+    values -= center
+    values /= width
+    np.square(values, out=values)
+    values += 1
+    np.reciprocal(values, out=values)
+    values *= amplitude
+    values += offset
+    return values
+
+
+def lorentzian_jacobian(x, amplitude, center, width, offset):
+    x, jac = _jacobian_array(x, 4)
+    distance = (x - center) / width
+    jac[:, 0] = 1 / (1 + distance ** 2)
+    jac[:, 1] = jac[:, 0] ** 2 * distance * (2 * amplitude / width)
+    jac[:, 2] = jac[:, 1] * distance
+    jac[:, 3] = 1
+    return jac
+
+
+def exponential(x, amplitude, decay_time, offset):
+    values = _work_array(x)
+    values /= -decay_time
+    np.exp(values, out=values)
+    values *= amplitude
+    values += offset
+    return values
+
+
+def exponential_jacobian(x, amplitude, decay_time, offset):
+    x, jac = _jacobian_array(x, 3)
+    jac[:, 0] = np.exp(x / -decay_time)
+    jac[:, 1] = jac[:, 0] * x * (amplitude / decay_time ** 2)
+    jac[:, 2] = 1
+    return jac
+
+
+def sine(x, amplitude, angular_frequency, phase, offset):
+    values = _work_array(x)
+    values *= angular_frequency
+    values += phase
+    np.sin(values, out=values)
+    values *= amplitude
+    values += offset
+    return values
+
+
+def sine_jacobian(x, amplitude, angular_frequency, phase, offset):
+    x, jac = _jacobian_array(x, 4)
+    argument = angular_frequency * x + phase
+    jac[:, 0] = np.sin(argument)
+    jac[:, 2] = np.cos(argument) * amplitude
+    jac[:, 1] = jac[:, 2] * x
+    jac[:, 3] = 1
+    return jac
+
+
+def damped_sine(x, amplitude, decay_time, angular_frequency, phase, offset):
+    values = _work_array(x)
+    envelope = np.exp(values / -decay_time)
+    values *= angular_frequency
+    values += phase
+    np.sin(values, out=values)
+    values *= envelope
+    values *= amplitude
+    values += offset
+    return values
+
+
+def damped_sine_jacobian(x, amplitude, decay_time, angular_frequency, phase, offset):
+    x, jac = _jacobian_array(x, 5)
+    envelope = np.exp(x / -decay_time)
+    argument = angular_frequency * x + phase
+    jac[:, 0] = envelope * np.sin(argument)
+    jac[:, 1] = jac[:, 0] * x * (amplitude / decay_time ** 2)
+    jac[:, 3] = envelope * np.cos(argument) * amplitude
+    jac[:, 2] = jac[:, 3] * x
+    jac[:, 4] = 1
+    return jac
+
+
+def polynomial(x, *coefficients):
+    # Horner scheme, the first coefficient is the constant term
+    values = np.full(np.shape(x), coefficients[-1], dtype=np.float64)
+    for coefficient in coefficients[-2::-1]:
+        values *= x
+        values += coefficient
+    return values
+
+
+def polynomial_jacobian(x, *coefficients):
+    x, jac = _jacobian_array(x, len(coefficients))
+    jac[:, 0] = 1
+    for idx in range(1, len(coefficients)):
+        np.multiply(jac[:, idx - 1], x, out=jac[:, idx])
+    return jac
+
+
+def _peak_guess(
+        x_values: np.ndarray,  # x values
+        y_values: np.ndarray  # y values
+) -> [float, float, float, float]:
+
+    """
+    Notes
+    -----
+    This function returns the amplitude, the center, the full width at half maximum and the offset of the
+    highest (or deepest) peak of the data. The offset is the median of the first and last tenth of the points,
+    the width is the one of the points around the peak that are higher than half of it.
+    """
+
+    x_values, y_values = _sorted_points(x_values, y_values)
+    tail = len(y_values) // 10 + 1
+    offset = float(np.median(np.concatenate([y_values[:tail], y_values[-tail:]])))
+    deviation = y_values - offset
+    peak = int(np.argmax(np.abs(deviation)))
+    amplitude = float(deviation[peak])
+
+    # the half maximum is crossed at the first points, on both the sides of the peak, below half of the peak
+    below = np.flatnonzero(deviation * np.sign(amplitude) < abs(amplitude) / 2)
+    left = below[below < peak]
+    right = below[below > peak]
+    left = x_values[left[-1]] if len(left) > 0 else x_values[0]
+    right = x_values[right[0]] if len(right) > 0 else x_values[-1]
+    fwhm = right - left
+    if not fwhm > 0:
+        fwhm = (x_values[-1] - x_values[0]) / max(len(x_values) - 1, 1)
+    return amplitude, float(x_values[peak]), float(fwhm), offset
+
+
+def gaussian_guess(x_values, y_values):
+    amplitude, center, fwhm, offset = _peak_guess(x_values, y_values)
+    return np.array([amplitude, center, fwhm / (2 * np.sqrt(2 * np.log(2))), offset])
+
+
+def lorentzian_guess(x_values, y_values):
+    amplitude, center, fwhm, offset = _peak_guess(x_values, y_values)
+    return np.array([amplitude, center, fwhm / 2, offset])
+
+
+def exponential_guess(x_values, y_values):
+
+    """
+    Notes
+    -----
+    The decay time is obtained without iterations from the integral of the data: for y = A*exp(-x/tau) + c,
+    y - y[0] = -1/tau * integral of y + c/tau * (x - x[0]), that is a linear regression. The amplitude is then
+    a linear fit of y - c.
+    """
+
+    x_values, y_values = _sorted_points(x_values, y_values)
+    integral = np.concatenate([[0], np.cumsum((y_values[1:] + y_values[:-1]) / 2 * np.diff(x_values))])
+    design = np.column_stack([integral, x_values - x_values[0], np.ones_like(x_values)])
+    (slope, drift, _), *_ = np.linalg.lstsq(design, y_values, rcond=None)
+    decay_time = -1 / slope if slope != 0 else np.inf
+    offset = -drift / slope if slope != 0 else float(np.mean(y_values))
+    if not np.isfinite(decay_time) or not np.isfinite(offset):
+        decay_time, offset = x_values[-1] - x_values[0], float(y_values[-1])
+
+    # the amplitude is computed at x[0] and then moved to x = 0, to avoid overflows
+    envelope = np.exp((x_values - x_values[0]) / -decay_time)
+    amplitude = np.dot(envelope, y_values - offset) / np.dot(envelope, envelope) * np.exp(x_values[0] / decay_time)
+    return np.array([amplitude, decay_time, offset])
+
+
+def _frequency_guess(
+        x_values: np.ndarray,  # x values, sorted
+        y_values: np.ndarray  # y values
+) -> float:
+
+    """
+    Notes
+    -----
+    This function returns the angular frequency of the highest peak of the spectrum of the data. The data are
+    interpolated on a uniform grid, and the position of the peak is refined with a parabola through the
+    three highest points of the spectrum.
+    """
+
+    uniform_x = np.linspace(x_values[0], x_values[-1], len(x_values))
+    uniform_y = np.interp(uniform_x, x_values, y_values)
+    spectrum = np.abs(np.fft.rfft(uniform_y - np.mean(uniform_y)))
+    spectrum[0] = 0
+    peak = int(np.argmax(spectrum))
+    shift = 0.
+    if 0 < peak < len(spectrum) - 1:
+        curvature = spectrum[peak - 1] - 2 * spectrum[peak] + spectrum[peak + 1]
+        if curvature != 0:
+            shift = 0.5 * (spectrum[peak - 1] - spectrum[peak + 1]) / curvature
+    step = (x_values[-1] - x_values[0]) / (len(x_values) - 1)
+    return 2 * np.pi * (peak + shift) / (len(x_values) * step)
+
+
+def _sine_components(
+        x_values: np.ndarray,  # x values
+        y_values: np.ndarray,  # y values
+        angular_frequency: float,  # angular frequency of the sine
+        envelope: np.ndarray = None  # envelope of the sine, None if it is constant
+) -> [float, float, float]:
+    # amplitude, phase and offset of the sine with the given frequency and envelope, from a linear fit
+    envelope = 1 if envelope is None else envelope
+    argument = angular_frequency * x_values
+    design = np.column_stack([envelope * np.sin(argument), envelope * np.cos(argument), np.ones_like(x_values)])
+    (sin_part, cos_part, offset), *_ = np.linalg.lstsq(design, y_values, rcond=None)
+    return np.hypot(sin_part, cos_part), np.arctan2(cos_part, sin_part), offset
+
+
+def sine_guess(x_values, y_values):
+
+    """
+    Notes
+    -----
+    The frequency is the peak of the spectrum of the data (FFT), the amplitude, the phase and the offset are
+    then obtained with a linear fit.
+    """
+
+    x_values, y_values = _sorted_points(x_values, y_values)
+    angular_frequency = _frequency_guess(x_values, y_values)
+    amplitude, phase, offset = _sine_components(x_values, y_values, angular_frequency)
+    return np.array([amplitude, angular_frequency, phase, offset])
+
+
+def damped_sine_guess(x_values, y_values):
+
+    """
+    Notes
+    -----
+    The frequency is the peak of the spectrum of the data (FFT). The decay time is given by the amplitudes of
+    the sine in the first and in the second half of the data, then the amplitude, the phase and the offset are
+    obtained with a linear fit.
+    """
+
+    x_values, y_values = _sorted_points(x_values, y_values)
+    angular_frequency = _frequency_guess(x_values, y_values)
+
+    half = len(x_values) // 2
+    first, *_ = _sine_components(x_values[:half], y_values[:half], angular_frequency)
+    second, *_ = _sine_components(x_values[half:], y_values[half:], angular_frequency)
+    decay_time = 10 * (x_values[-1] - x_values[0])
+    if first > second > 0:
+        decay_time = (np.mean(x_values[half:]) - np.mean(x_values[:half])) / np.log(first / second)
+
+    # the amplitude is computed at x[0] and then moved to x = 0, to avoid overflows
+    envelope = np.exp((x_values - x_values[0]) / -decay_time)
+    amplitude, phase, offset = _sine_components(x_values, y_values, angular_frequency, envelope)
+    return np.array([amplitude * np.exp(x_values[0] / decay_time), decay_time, angular_frequency, phase, offset])
+
+
+def polynomial_guess(degree, x_values, y_values):
+    # the polynomial is linear in its coefficients, the least squares solution is found directly
+    x_values, y_values = _sorted_points(x_values, y_values)
+    return np.polynomial.polynomial.polyfit(x_values, y_values, degree)
+
+
+# models that can be used as fitting function by name
+MODELS = {
+    "gaussian": Model("var1*exp(-(x-var2)**2/(2*var3**2))+var4",
+                      ["amplitude", "center", "standard deviation", "offset"],
+                      gaussian, gaussian_jacobian, gaussian_guess),
+    "lorentzian": Model("var1*var3**2/((x-var2)**2+var3**2)+var4",
+                        ["amplitude", "center", "half width at half maximum", "offset"],
+                        lorentzian, lorentzian_jacobian, lorentzian_guess),
+    "exponential": Model("var1*exp(-x/var2)+var3", ["amplitude", "decay time", "offset"],
+                         exponential, exponential_jacobian, exponential_guess),
+    "sine": Model("var1*sin(var2*x+var3)+var4", ["amplitude", "angular frequency", "phase", "offset"],
+                  sine, sine_jacobian, sine_guess),
+    "damped_sine": Model("var1*exp(-x/var2)*sin(var3*x+var4)+var5",
+                         ["amplitude", "decay time", "angular frequency", "phase", "offset"],
+                         damped_sine, damped_sine_jacobian, damped_sine_guess),
+}
+
+# polynomials of any degree: polynomial1, polynomial2, ...
+_POLYNOMIAL_NAME = re.compile(r"polynomial([1-9][0-9]*)")
+
+
+def get_model(
+        str_funct: str
+) -> Model:
+
+    """
+    Parameters
+    ----------
+    str_funct (str): fitting function written as string
+
+    Returns
+    -------
+    model (Model): built-in model called <str_funct>, None if <str_funct> is not the name of a model
+
+    Notes
+    -----
+    The models are the ones in MODELS, and the polynomials polynomialN of degree N, with the coefficients
+    var1 (constant term) ... var(N+1).
+    """
+
+    name = str_funct.strip()
+    if name in MODELS:
+        return MODELS[name]
+    match = _POLYNOMIAL_NAME.fullmatch(name)
+    if match is not None:
+        return _polynomial_model(int(match.group(1)))
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _polynomial_model(
+        degree: int  # degree of the polynomial
+) -> Model:
+    expression = "+".join(["var1"] + ["var{}*x**{}".format(power + 1, power) for power in range(1, degree + 1)])
+    return Model(expression, ["coefficient of x**{}".format(power) for power in range(degree + 1)],
+                 polynomial, polynomial_jacobian, functools.partial(polynomial_guess, degree))
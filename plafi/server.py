@@ -0,0 +1,638 @@
+import hmac
+import json
+import os
+import secrets
+import socket
+import tempfile
+import time
+import collections
+
+# numpy, asyncio and the fitting functions are imported by the server only, so that the client
+# connects and sends a request in a few milliseconds
+
+
+def default_socket_path(
+
+) -> str:
+
+    """
+    Returns
+    -------
+    path (str): path of the unix socket of the fit server, it can be set with the environment variable
+                PLAFI_SOCKET
+    """
+
+    return os.environ.get("PLAFI_SOCKET", os.path.join(tempfile.gettempdir(), "plafi-{}.sock".format(os.getuid())))
+
+
+def serve(
+        socket_path: str = None,
+        port: int = None,
+        jobs: int = None,
+        root: str = None
+):
+
+    """
+    Parameters
+    ----------
+    socket_path (str): path of the unix socket, if None default_socket_path() is used
+    port (int): if given, the requests are also accepted over HTTP on localhost:<port>
+    jobs (int): number of worker processes, if None all the available CPUs are used
+    root (str): directory that contains the files read and written by the requests, if None the current
+                working directory is used
+
+    Notes
+    -----
+    This function starts the fit server, and returns when it receives a shutdown request, SIGINT or SIGTERM.
+    On the unix socket every request is a JSON object written on a single line, and it is answered with a JSON
+    object on a single line. Over HTTP the request is the body of a POST, and the action can be given by the
+    path (i.e. POST /fit). The requests are described in handle_request().
+    An asyncio loop receives the requests and dispatches them to a pool of <jobs> worker processes. The workers
+    import the scientific modules when they start, and keep in memory the compiled fitting functions, the
+    constants and the data files already read, so a request is answered in a few milliseconds.
+    The requests can read and write only the files under <root>. The unix socket can be used only by the user
+    that started the server. The HTTP requests must have the Content-Type application/json and the header
+    "Authorization: Bearer <token>", with the token printed when the server starts (or set with the environment
+    variable PLAFI_TOKEN); the requests sent by web pages (with an Origin header) are rejected.
+    An error is raised if another server is already listening on <socket_path>.
+    """
+
+    import asyncio
+
+    socket_path = socket_path or default_socket_path()
+    _remove_stale_socket(socket_path)
+    asyncio.run(_serve(socket_path, port, jobs, os.path.realpath(root or os.getcwd())))
+
+
+# maximum size of a request, the data sent with the fit requests can be large
+_STREAM_LIMIT = 2 ** 28
+# maximum size of the request line and of the headers of the HTTP requests, and maximum number of headers
+_HTTP_LINE_LIMIT = 2 ** 16
+_HTTP_MAX_HEADERS = 100
+
+
+async def _serve(
+        socket_path: str,  # path of the unix socket
+        port: int,  # port of the HTTP server, None to not start it
+        jobs: int,  # number of worker processes, None to use all the available CPUs
+        root: str  # resolved directory that contains the files of the requests
+):
+
+    """
+    Notes
+    -----
+    This coroutine runs the fit server, see serve().
+    """
+
+    import asyncio
+    import functools
+    import signal
+    from concurrent.futures import ProcessPoolExecutor
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signal_number in [signal.SIGINT, signal.SIGTERM]:
+        loop.add_signal_handler(signal_number, stop.set)
+
+    jobs = jobs or os.cpu_count()
+    connections = {}
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_initialize_worker) as pool:
+
+        async def dispatch(request):
+            # the shutdown is handled by the loop, every other request by a worker process
+            if request.get("action") == "shutdown":
+                stop.set()
+                return {"status": "ok"}
+            return await loop.run_in_executor(pool, handle_request, request, root)
+
+        # the workers are started before accepting the first request
+        await asyncio.gather(*[loop.run_in_executor(pool, handle_request, {"action": "ping"}) for _ in range(jobs)])
+
+        # the socket is created readable and writable only by the user, so that other users can never connect
+        umask = os.umask(0o177)
+        try:
+            servers = [await asyncio.start_unix_server(functools.partial(_serve_lines, dispatch, connections),
+                                                       socket_path, limit=_STREAM_LIMIT)]
+        finally:
+            os.umask(umask)
+        addresses = [socket_path]
+        if port is not None:
+            token = os.environ.get("PLAFI_TOKEN") or secrets.token_urlsafe(24)
+            servers.append(await asyncio.start_server(functools.partial(_serve_http, dispatch, connections, token),
+                                                      "127.0.0.1", port, limit=_HTTP_LINE_LIMIT))
+            addresses.append("http://127.0.0.1:{}".format(port))
+        print("plafi server listening on {} with {} workers, files under {}".format(
+            " and ".join(addresses), jobs, root), flush=True)
+        if port is not None:
+            print("HTTP token: {}".format(token), flush=True)
+
+        await stop.wait()
+        for server in servers:
+            server.close()
+        # the open connections are closed, and their handlers are left to finish
+        handlers = list(connections.values())
+        for writer in list(connections):
+            writer.close()
+        await asyncio.gather(*handlers, return_exceptions=True)
+        for server in servers:
+            await server.wait_closed()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+
+async def _serve_lines(
+        dispatch,  # coroutine that answers a request
+        connections: dict,  # open connections (writer: handler task), closed when the server stops
+        reader,  # asyncio.StreamReader of the connection
+        writer  # asyncio.StreamWriter of the connection
+):
+
+    """
+    Notes
+    -----
+    This coroutine answers the requests received on a unix socket connection, one JSON object per line.
+    The requests of a connection are answered in order, the ones of different connections concurrently.
+    """
+
+    import asyncio
+
+    connections[writer] = asyncio.current_task()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            response = await _respond(dispatch, line)
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        connections.pop(writer, None)
+        writer.close()
+
+
+async def _serve_http(
+        dispatch,  # coroutine that answers a request
+        connections: dict,  # open connections (writer: handler task), closed when the server stops
+        token: str,  # token that authorizes the requests
+        reader,  # asyncio.StreamReader of the connection
+        writer  # asyncio.StreamWriter of the connection
+):
+
+    """
+    Notes
+    -----
+    This coroutine answers the HTTP requests received on a connection. The connection is kept alive
+    unless the client asks to close it. The headers are checked before reading the body: the requests without
+    the Content-Type application/json and the <token>, with an Origin header (sent by the browsers) or with a
+    body larger than _STREAM_LIMIT are answered with an error, without reading their body, and the connection
+    is closed.
+    """
+
+    import asyncio
+
+    connections[writer] = asyncio.current_task()
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+            _, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while len(headers) <= _HTTP_MAX_HEADERS:
+                line = await reader.readline()
+                if line.strip() == b"":
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            content_length = int(headers.get("content-length", 0))
+
+            accepted = False
+            if len(headers) > _HTTP_MAX_HEADERS:
+                response, status = {"status": "Too many headers"}, "431 Request Header Fields Too Large"
+            elif headers.get("content-type", "").split(";")[0].strip().lower() != "application/json":
+                response, status = {"status": "The Content-Type must be application/json"}, "415 Unsupported Media Type"
+            elif "origin" in headers or not hmac.compare_digest(headers.get("authorization", "").encode(),
+                                                                ("Bearer " + token).encode()):
+                response, status = {"status": "The request is not authorized"}, "403 Forbidden"
+            elif not 0 <= content_length <= _STREAM_LIMIT:
+                response, status = {"status": "The request is too large"}, "413 Payload Too Large"
+            else:
+                accepted = True
+                body = await reader.readexactly(content_length)
+                response = await _respond(dispatch, body, target.split("?")[0].strip("/") or None)
+                status = "200 OK" if response["status"] == "ok" else "400 Bad Request"
+            content = json.dumps(response).encode()
+            writer.write("HTTP/1.1 {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n{}\r\n".format(
+                status, len(content), "" if accepted else "Connection: close\r\n").encode("latin-1") + content)
+            await writer.drain()
+            # the body of a rejected request is not read, so the connection can not be used again
+            if not accepted or headers.get("connection", "").lower() == "close":
+                break
+    except (ConnectionError, ValueError, EOFError):
+        pass
+    finally:
+        connections.pop(writer, None)
+        writer.close()
+
+
+async def _respond(
+        dispatch,  # coroutine that answers a request
+        message: bytes,  # request encoded as JSON
+        action: str = None  # action used if the request does not contain one
+) -> dict:
+
+    """
+    Notes
+    -----
+    This coroutine decodes a request and returns its response. Any error is written in the status of the response.
+    """
+
+    try:
+        request = json.loads(message) if message.strip() else {}
+        if action is not None:
+            request.setdefault("action", action)
+        return await dispatch(request)
+    except Exception as error:
+        return {"status": "{}: {}".format(type(error).__name__, error)}
+
+
+def _remove_stale_socket(
+        socket_path: str  # path of the unix socket
+):
+
+    """
+    Notes
+    -----
+    This function removes the socket file left by a server that was not stopped. An error is raised if a
+    server is still listening on it.
+    """
+
+    if not os.path.exists(socket_path):
+        return
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.remove(socket_path)
+        return
+    finally:
+        connection.close()
+    raise NameError("A fit server is already listening on {}".format(socket_path))
+
+
+def _initialize_worker(
+
+):
+
+    """
+    Notes
+    -----
+    This function is executed by every worker process when it starts: it imports the modules used by the fits
+    and reads the constants, so that the first request does not pay their cost. SIGINT is ignored by the
+    workers, the server stops them when it is closed.
+    """
+
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    import matplotlib
+    matplotlib.use("Agg")
+    import scipy.optimize
+    import numexpr
+    from . import functions as fc
+    fc.get_constants()
+
+
+def handle_request(
+        request: dict,
+        root: str = None
+) -> dict:
+
+    """
+    Parameters
+    ----------
+    request (dict): request sent to the server
+    root (str): resolved directory that contains the files that the request can read and write, if None
+                the files are not checked
+
+    Returns
+    -------
+    response (dict): response to the request, its "status" is "ok" or the description of the error, and
+                     "time" is the time in seconds spent by the worker on the request
+
+    Notes
+    -----
+    The "action" of the request can be:
+    - "ping": the response contains the "pid" of the worker;
+    - "fit" (default): the request contains the "configuration" (contents of a configuration file, with the
+      relative path of the data file referred to "directory"), or the arrays "x", "y" (one column or a list of
+      columns) and optionally "sigma", with the "fitting function" and optionally the "number fitting parameters".
+      The optional keys "initial values", "lower bounds", "upper bounds", "engine", "loss" and "starts" have the
+      meaning of the keys of the configuration files, and replace them. If "save plot" is given, the plot is
+      saved in that file. The response contains "results", a list with a dictionary for every fitted y column with
+      "y data index", "status", "popt", "perr", "chi2", "reduced chi2", "nfev" and "lines" (the lines printed
+      by functions.fit_data() for the fit, also for a failed one);
+    - "plot": the data file "path" (relative to "directory") is plotted and saved in "save plot", the optional
+      keys are "rows to skip", "x-axis title" and "y-axis title".
+    The request is handled by the calling process, the server calls this function in its worker processes.
+    An error is written in the status of the response if a file of the request is outside <root>.
+    """
+
+    start = time.perf_counter()
+    try:
+        action = request.get("action", "fit")
+        if action == "ping":
+            response = {"pid": os.getpid()}
+        elif action == "fit":
+            response = _fit_request(request, root)
+        elif action == "plot":
+            response = _plot_request(request, root)
+        else:
+            raise NameError("The action must be one of: ping, fit, plot, shutdown")
+        response["status"] = "ok"
+    except Exception as error:
+        response = {"status": "{}: {}".format(type(error).__name__, error)}
+    response["time"] = time.perf_counter() - start
+    return response
+
+
+def _fit_request(
+        request: dict,  # fit request, see handle_request()
+        root: str  # resolved directory that contains the files of the request, None to not check them
+) -> dict:
+
+    """
+    Notes
+    -----
+    This function performs the fits of a "fit" request. A failed fit does not stop the others, its error is
+    written in its status.
+    """
+
+    import numpy as np
+    from . import functions as fc
+
+    if "configuration" in request:
+        # the path is confined to the root before checking that the file exists, so that the errors do not
+        # tell which files exist outside the root
+        parameters = fc.read_conf_string(request["configuration"], request.get("directory"),
+                                         lambda path: _request_path(root, None, path))
+        data, x_index, y_index, sigma_index, columns = _conf_data(parameters)
+        x_values = data.T[x_index]
+        y_indexes = fc._y_indexes(data, x_index, y_index, sigma_index)
+        datasets = [(columns[idx], data.T[idx], sigma)
+                    for idx, sigma in zip(y_indexes, fc._sigma_columns(data, sigma_index, len(y_indexes)))]
+    else:
+        parameters = {"fitting function": request["fitting function"],
+                      "number fitting parameters": request.get("number fitting parameters"),
+                      "x-axis title": " ", "y-axis title": " ", "initial values": None, "lower bounds": None,
+                      "upper bounds": None, "engine": "curve_fit", "loss": "linear", "starts": 10}
+        x_values = np.asarray(request["x"], dtype=float)
+        y_columns = np.atleast_2d(np.asarray(request["y"], dtype=float))
+        sigmas = [None] * len(y_columns)
+        if request.get("sigma") is not None:
+            sigmas = list(np.broadcast_to(np.asarray(request["sigma"], dtype=float), y_columns.shape))
+        datasets = [(idx, y_values, sigma) for idx, (y_values, sigma) in enumerate(zip(y_columns, sigmas))]
+
+    # the lines printed for more y columns start with the column, as in functions.fit_data()
+    single_column = isinstance(parameters.get("y data index"), int) if "configuration" in request else \
+        np.ndim(request["y"]) == 1
+
+    def prefix(y_idx):
+        return "" if single_column else "column {} ".format(y_idx)
+
+    for key in ["initial values", "lower bounds", "upper bounds"]:
+        if request.get(key) is not None:
+            parameters[key] = _request_values(request[key])
+    for key in ["engine", "loss", "starts"]:
+        if request.get(key) is not None:
+            parameters[key] = request[key]
+
+    if not fc.valid_function(parameters["fitting function"]):
+        raise NameError("The fitting function can not be used")
+    fitting_function = fc.generate_fitting_function(parameters["fitting function"],
+                                                    parameters["number fitting parameters"])
+    bounds = fc._conf_bounds(parameters)
+
+    results, curves = [], []
+    for y_idx, y_values, sigma in datasets:
+        try:
+            fit = fc.run_fit(fitting_function, x_values, y_values, parameters["initial values"], bounds, sigma,
+                             parameters["engine"], parameters["loss"], parameters["starts"])
+            statistics = fc.fit_statistics(fitting_function, x_values, y_values, fit.popt, sigma)
+            lines = [fc._parameter_line(prefix(y_idx), idx, par, err)
+                     for idx, (par, err) in enumerate(zip(fit.popt, fit.perr))]
+            results.append({"y data index": y_idx, "status": "ok", "popt": fit.popt.tolist(),
+                            "perr": fit.perr.tolist(), "chi2": statistics["chi2"],
+                            "reduced chi2": statistics["reduced chi2"], "nfev": int(fit.nfev),
+                            "lines": lines + [fc._statistics_line(prefix(y_idx), statistics)]})
+            curves.append((x_values, y_values, fit.popt, "data (col {})".format(y_idx), "fit (col {})".format(y_idx)))
+        except Exception as error:
+            status = "{}: {}".format(type(error).__name__, error)
+            results.append({"y data index": y_idx, "status": status,
+                            "lines": ["{}fit failed: {}".format(prefix(y_idx), status)]})
+
+    if request.get("save plot") is not None:
+        fc._plot_fits(fitting_function, curves, parameters["x-axis title"], parameters["y-axis title"], False,
+                      _request_path(root, request.get("directory"), request["save plot"]))
+        fc.wait_for_plots()
+
+    return {"results": results}
+
+
+def _plot_request(
+        request: dict,  # plot request, see handle_request()
+        root: str  # resolved directory that contains the files of the request, None to not check them
+) -> dict:
+
+    """
+    Notes
+    -----
+    This function saves the plot of a "plot" request.
+    """
+
+    from . import functions as fc
+
+    directory = request.get("directory")
+    data = fc.read_data(_request_path(root, directory, request["path"]), request.get("rows to skip", 0))
+    fc.plot_data(data, request.get("x-axis title", " "), request.get("y-axis title", " "), show_plot=False,
+                 save_plot=_request_path(root, directory, request["save plot"]))
+    fc.wait_for_plots()
+    return {}
+
+
+def _request_path(
+        root: str,  # resolved directory that contains the files of the requests, None to not check the path
+        directory: str,  # directory of the relative paths, None for the working directory of the server
+        path: str  # path of a file of a request
+) -> str:
+
+    """
+    Notes
+    -----
+    This function returns <path> referred to <directory>. An error is raised if the path, resolved following
+    the symbolic links and "..", is outside <root>: the clients can read and write only the files under the
+    root directory of the server.
+    """
+
+    path = os.path.join(directory or "", path)
+    if root is not None and os.path.commonpath([root, os.path.realpath(path)]) != root:
+        raise NameError("{} is outside the directory of the server {}".format(path, root))
+    return path
+
+
+def _request_values(
+        values  # list of numbers, or numbers separated by spaces as in the configuration files
+):
+
+    """
+    Notes
+    -----
+    This function converts the initial values or the bounds of a request to an array.
+    """
+
+    import numpy as np
+    from . import functions as fc
+
+    if isinstance(values, str):
+        return fc._parse_values(values)
+    return np.asarray(values, dtype=float)
+
+
+# data files read by the worker process, with the key built by _conf_data()
+_data_cache = collections.OrderedDict()
+_DATA_CACHE_ENTRIES = 16
+
+
+def _conf_data(
+        parameters: dict  # parameters returned by read_conf_string()
+) -> tuple:
+
+    """
+    Notes
+    -----
+    This function returns the same values of functions._read_conf_data(), keeping the last data read in memory.
+    The data file is read again only when it is modified.
+    """
+
+    from . import functions as fc
+
+    stat = os.stat(parameters["path"])
+    key = (os.path.realpath(parameters["path"]), stat.st_mtime_ns, stat.st_size) + tuple(
+        repr(parameters[name]) for name in ["rows to skip", "x data index", "y data index", "sigma data index",
+                                            "sheet", "chunk size", "decimation", "aggregate"])
+    if key in _data_cache:
+        _data_cache.move_to_end(key)
+    else:
+        _data_cache[key] = fc._read_conf_data(parameters)
+        if len(_data_cache) > _DATA_CACHE_ENTRIES:
+            _data_cache.popitem(last=False)
+    return _data_cache[key]
+
+
+class Client:
+
+    """
+    Notes
+    -----
+    This class is a connection to the fit server (see serve()). The connection is kept open, so consecutive
+    requests do not pay its cost, and it can be used as context manager:
+        with Client() as client:
+            response = client.request({"action": "fit", "fitting function": "var1*x", "x": x, "y": y})
+    The numpy arrays in the requests are sent as lists. An error is raised if no server is listening.
+    """
+
+    def __init__(self, socket_path: str = None, timeout: float = None):
+        socket_path = socket_path or default_socket_path()
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        try:
+            self._socket.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            self._socket.close()
+            raise NameError("No fit server is listening on {}, it can be started with 'plafi serve'".format(
+                socket_path))
+        self._file = self._socket.makefile("rwb")
+
+    def request(self, request: dict) -> dict:
+        self._file.write(json.dumps(request, default=_to_json).encode() + b"\n")
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise NameError("The fit server closed the connection")
+        return json.loads(line)
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _to_json(
+        value  # object that the json module can not encode
+):
+
+    """
+    Notes
+    -----
+    This function converts the numpy arrays and numbers to python lists and numbers.
+    """
+
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError("{} can not be sent to the fit server".format(type(value).__name__))
+
+
+def remote_fitting_from_conf(
+        path_to_conf_file: str,
+        socket_path: str = None,
+        save_plot: str = None,
+        engine: str = None,
+        loss: str = None,
+        starts: int = None
+) -> dict:
+
+    """
+    Parameters
+    ----------
+    path_to_conf_file (str): path to configuration file
+    socket_path (str): path of the unix socket of the server, if None default_socket_path() is used
+    save_plot (str): path where the plot is saved, if None the plot is not saved
+    engine (str): optimizer used for the fit, if None the one of the configuration file is used
+    loss (str): loss function of the trf and multistart engines, if None the one of the configuration file is used
+    starts (int): number of starting points of the multistart engine, if None the one of the configuration file
+                  is used
+
+    Returns
+    -------
+    response (dict): response of the server, see handle_request()
+
+    Notes
+    -----
+    This function sends the configuration file to the fit server and prints the fitting parameters, as
+    functions.fitting_from_conf() does. The relative paths are referred to the current working directory.
+    An error is raised if the request fails.
+    """
+
+    with open(path_to_conf_file) as f:
+        request = {"action": "fit", "configuration": f.read(), "directory": os.getcwd(), "save plot": save_plot,
+                   "engine": engine, "loss": loss, "starts": starts}
+    with Client(socket_path) as client:
+        response = client.request(request)
+    if response["status"] != "ok":
+        raise NameError(response["status"])
+
+    # the lines are formatted by the server as functions.fit_data() prints them, the client does not import numpy
+    for result in response["results"]:
+        for line in result["lines"]:
+            print(line)
+
+    return response
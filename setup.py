@@ -5,6 +5,7 @@ setup(
     version='0.1.0',
     packages=['plafi'],
     install_requires=["numpy", "pandas", "scipy", "matplotlib", "numexpr", "uncertainties", "tabulate", "openpyxl"],
+    extras_require={"parquet": ["pyarrow"]},
     entry_points={
         'console_scripts': [
             'plafi = plafi.__main__:main',
@@ -3,12 +3,23 @@ import numpy as np
 import sys
 import os
 import types
+import inspect
+import ast
+import subprocess
+import shutil
+import socket
+import json
+import http.client
 import pytest
 from hypothesis import given
 import hypothesis.extra.numpy as hen
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import plafi
 from plafi import functions as fc
+from plafi import server
+from plafi import expression as ex
+from plafi import models
 
 """
 These are the testing functions, which are focused on plafi/functions.py.
@@ -19,6 +30,24 @@ create a window that will freeze the testing procedure, unless it is closed manu
 """
 
 
+@pytest.fixture(autouse=True)
+def constants_file():
+    """
+    The constants file is created on first use, not when plafi is imported: it is initialized before every test,
+    so that the tests that delete it find it also on a clean checkout.
+    """
+    fc.initialize_constants()
+
+
+@pytest.fixture(autouse=True)
+def cache_directory(monkeypatch, tmp_path):
+    """
+    The on-disk cache of fc.read_data() is written in the temporary directory of every test, not in the home
+    directory of the user running the tests.
+    """
+    monkeypatch.setenv("PLAFI_CACHE_DIR", str(tmp_path / "plafi_cache"))
+
+
 def test_read_data():
     """
     data1.txt, data1.csv and data1.xlsx are three handwritten file containing the same data.
@@ -111,6 +140,25 @@ def test_read_constants():
     assert np.any(constants["name"].str.contains(name2))
 
 
+def test_get_constants():
+    """
+    This function tests the correct behaviour of fc.get_constants().
+    The test is passed if the constants are read from the file, and read again when the file is modified.
+    """
+    constants_file_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "plafi",
+                                       "plafi_constants.csv")
+    os.remove(constants_file_path)
+    fc.save_constants([["a", 1.], ["b", 2.5]])
+    assert fc.get_constants() == {"a": 1., "b": 2.5}
+
+    with open(constants_file_path, "a") as f:
+        f.write("c;-3\n")
+    assert fc.get_constants() == {"a": 1., "b": 2.5, "c": -3.}
+
+    os.remove(constants_file_path)
+    fc.initialize_constants()
+
+
 def test_add_constant(monkeypatch):
     """
     This function tests the correct behaviour of fc.add_constant().
@@ -256,21 +304,94 @@ def test_generate_fitting_function_correct_values(array):
     assert np.isclose(func5(*array).item(0), (array[1]*np.sin(array[0])+array[5]).item(0), equal_nan=True)
 
 
+def test_generate_fitting_function_cache():
+    """
+    This function tests that fc.generate_fitting_function() compiles an expression only once.
+    The test is passed if the second generation of the same model is a cache hit, and if
+    a modification of the constants file invalidates the compiled expression.
+    """
+    constants_file_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "plafi",
+                                       "plafi_constants.csv")
+    os.remove(constants_file_path)
+    fc.save_constants(np.array([["k", 2.]]))
+
+    func1 = fc.generate_fitting_function("k*var1*x+var2", 2)
+    hits = fc._compiled_expression.cache_info().hits
+    func2 = fc.generate_fitting_function("k*var1*x+var2", 2)
+    assert fc._compiled_expression.cache_info().hits == hits + 1
+    assert np.allclose(func1(np.arange(3.), 1., 1.), func2(np.arange(3.), 1., 1.))
+    assert np.allclose(func1(np.arange(3.), 1., 1.), [1., 3., 5.])
+
+    # a new value of the constant must be used by the new fitting functions
+    os.remove(constants_file_path)
+    fc.save_constants(np.array([["k", 30.]]))
+    func3 = fc.generate_fitting_function("k*var1*x+var2", 2)
+    assert np.allclose(func3(np.arange(3.), 1., 1.), [1., 31., 61.])
+
+    os.remove(constants_file_path)
+    fc.initialize_constants()
+
+
+def test_generate_fitting_function_jacobian():
+    """
+    This function tests the analytic jacobian generated by fc.generate_fitting_function().
+    The test is passed if it is equal to the one estimated with finite differences, and if the
+    jacobian is not generated for a function that can not be differentiated.
+    """
+    func = fc.generate_fitting_function("var1*exp(-x/var2)+sqrt(var3)*cos(x)", 3)
+    x, popt = np.linspace(0.1, 3, 7), np.array([1.5, 0.7, 2.])
+
+    step = 1e-6
+    numerical_jac = np.empty((x.size, popt.size))
+    for idx in range(popt.size):
+        delta = np.zeros(popt.size)
+        delta[idx] = step
+        numerical_jac[:, idx] = (func(x, *(popt + delta)) - func(x, *(popt - delta))) / (2 * step)
+
+    assert func.jacobian(x, *popt).shape == (x.size, popt.size)
+    assert np.allclose(func.jacobian(x, *popt), numerical_jac, atol=1e-6)
+    assert fc.generate_fitting_function("where(x > 0, var1, x)", 1).jacobian is None
+
+
 def test_generate_fitting_function_error_raised():
     """
     This function tests the correct behaviour of fc.generate_fitting_function() when a wrong input is given.
-    The test is passed if an error is raised.
+    The test is passed if an error is raised when the expression uses more parameters than the given
+    number, or when it has no parameters.
     """
     with pytest.raises(NameError):
-        fc.generate_fitting_function("var1*sin(x)", 6)
+        fc.generate_fitting_function("var1*sin(x)+var6", 5)
+    with pytest.raises(NameError):
+        fc.generate_fitting_function("sin(x)")
+
+
+def test_generate_fitting_function_many_parameters():
+    """
+    This function tests fc.generate_fitting_function() with more than five parameters.
+    The test is passed if the number of parameters is detected from the expression, if the signature
+    lists all of them and if a polynomial of degree 11 is fitted correctly.
+    """
+    str_funct = "+".join("var{}*x**{}".format(idx + 1, idx) for idx in range(12))
+    func = fc.generate_fitting_function(str_funct)
+    assert func.num_var == 12
+    assert list(inspect.signature(func).parameters) == ["x"] + ["var{}".format(idx + 1) for idx in range(12)]
+    assert fc.count_parameters("var2*x+var10") == 10
+    assert fc.valid_function(str_funct)
 
+    x = np.linspace(-1, 1, 50)
+    coefficients = np.arange(12) / 10
+    data = np.column_stack([x, np.polyval(coefficients[::-1], x)])
+    popt, perr, fig = fc.fit_data(data, func, show_plot=False)
+    assert np.allclose(popt, coefficients, atol=1e-6)
 
-def test_fit_data(monkeypatch):
+
+def test_fit_data(monkeypatch, capsys):
     """
     This function tests the correct behaviour of fc.fit_data().
     Monkeypatch is used to not show the plot window and so not freezing the testing procedure and simulate the inputs.
     It will try to fit data2.xlsx, where there are simple data.
-    The test is passed if the fit returns the correct fitting value and the plot titles are correct
+    The test is passed if the fit returns the correct fitting value and the plot titles are correct, and if the
+    printed parameters lines end with the value (or with the bootstrap interval, if it is computed).
     """
     # setting monkeypatch
     monkeypatch.setattr(plt, 'show', lambda: None)
@@ -285,6 +406,166 @@ def test_fit_data(monkeypatch):
     assert fig.axes[0].xaxis.label._text == x_title
     assert fig.axes[0].yaxis.label._text == y_title
 
+    capsys.readouterr()
+    for bootstrap in [0, 20]:
+        fc.fit_data(data, fit_func, show_plot=False, bootstrap=bootstrap)
+        lines = [line for line in capsys.readouterr().out.splitlines() if line.startswith("parameter")]
+        assert len(lines) == 1 and lines[0] == lines[0].rstrip()
+        assert lines[0].endswith("])") == (bootstrap > 0)
+
+
+def test_fit_data_sigma():
+    """
+    This function tests the correct behaviour of fc.fit_data() when the uncertainties of y are given.
+    The test is passed if the errors of the parameters are the absolute ones, if the uncertainty column is
+    not fitted when all the columns are selected and if fc.fit_statistics() returns the weighted chi square.
+    """
+    x = np.linspace(0, 1, 200)
+    sigma = 0.01 + 0.1 * x
+    y = 3 * x + 2 + sigma * np.random.default_rng(0).standard_normal(x.size)
+    data = np.column_stack([x, y, sigma])
+    fit_func = fc.generate_fitting_function("var1*x+var2")
+
+    popt, perr, fig = fc.fit_data(data, fit_func, sigma_index=2, show_plot=False)
+    weights = 1 / sigma ** 2
+    design = np.column_stack([x, np.ones_like(x)])
+    expected_perr = np.sqrt(np.diag(np.linalg.inv(design.T @ (weights[:, None] * design))))
+    assert np.allclose(perr, expected_perr, rtol=1e-4)
+    assert np.allclose(popt, [3, 2], atol=5 * expected_perr)
+
+    popts, perrs, fig = fc.fit_data(data, fit_func, y_index="all", sigma_index=2, show_plot=False)
+    assert popts.shape == (1, 2)
+
+    statistics = fc.fit_statistics(fit_func, x, y, popt, sigma)
+    assert np.allclose(statistics["residuals"], y - (popt[0] * x + popt[1]))
+    assert np.isclose(statistics["chi2"], np.sum((statistics["residuals"] / sigma) ** 2))
+    assert statistics["degrees of freedom"] == x.size - 2
+    assert np.isclose(statistics["reduced chi2"], statistics["chi2"] / (x.size - 2))
+
+
+def test_global_fit():
+    """
+    This function tests the correct behaviour of fc.global_fit().
+    Three exponential decays with the same time constant and different amplitudes are fitted at once,
+    the test is passed if the shared parameter is the same for all the datasets, if all the parameters
+    are correct and if the result does not depend on the analytic jacobian or on initial values outside the bounds.
+    """
+    rng = np.random.default_rng(1)
+    x = np.linspace(0, 5, 100)
+    amplitudes = [1., 2., 3.]
+    datasets = [(x, amplitude * np.exp(-x / 1.5) + 0.01 * rng.standard_normal(x.size), np.full(x.size, 0.01))
+                for amplitude in amplitudes]
+    fit_func = fc.generate_fitting_function("var1*exp(-x/var2)")
+
+    popt, perr, statistics = fc.global_fit(fit_func, datasets, shared=[2])
+    assert popt.shape == perr.shape == (3, 2)
+    assert np.all(popt[:, 1] == popt[0, 1])
+    assert np.allclose(popt[:, 0], amplitudes, atol=0.01)
+    assert np.isclose(popt[0, 1], 1.5, atol=0.01)
+    assert statistics["degrees of freedom"] == 3 * x.size - 4
+    assert 0.5 < statistics["reduced chi2"] < 1.5
+
+    fit_func.jacobian = None
+    popt_numerical, perr_numerical, _ = fc.global_fit(fit_func, datasets, shared=[2])
+    assert np.allclose(popt, popt_numerical, rtol=1e-5)
+    assert np.allclose(perr, perr_numerical, rtol=1e-3)
+
+    # the initial values outside the bounds are moved within them
+    popt_bounded, _, _ = fc.global_fit(fit_func, datasets, shared=[2], p0=[1., 10.], bounds=([0, 0.1], [10, 5]))
+    assert np.allclose(popt_bounded, popt, rtol=1e-4)
+
+    with pytest.raises(NameError):
+        fc.global_fit(fit_func, datasets, shared=[3])
+
+
+def test_global_fitting_from_conf(tmp_path):
+    """
+    This function tests the correct behaviour of fc.global_fitting_from_conf().
+    Two configuration files with the same model and frequency are fitted at once, the test is passed
+    if the parameters of every file are correct.
+    """
+    x = np.linspace(0, 10, 200)
+    for run, amplitude in enumerate([1, 3]):
+        np.savetxt(tmp_path / "run{}.txt".format(run), np.column_stack([x, amplitude * np.sin(2 * x)]))
+        (tmp_path / "run{}.cfg".format(run)).write_text(
+            "[fitting parameters]\npath = {}\nrows to skip = 0\nx data index = 0\ny data index = 1\n"
+            "fitting function = var1*sin(var2*x)\ninitial values = 1 1.9\nx-axis title = x\n"
+            "y-axis title = y\n".format(tmp_path / "run{}.txt".format(run)))
+
+    popt, perr, fig = fc.global_fitting_from_conf(str(tmp_path / "run*.cfg"), [2], show_plot=False)
+    assert np.allclose(popt, [[1, 2], [3, 2]])
+    assert fig is None
+
+
+def test_run_fit_engines():
+    """
+    This function tests the engines of fc.run_fit().
+    The test is passed if all the engines give the same result on clean data, if the robust loss is not
+    affected by outliers, and if the multistart engine (also in parallel) finds the global minimum of a model
+    for which the fit from the default starting point fails.
+    """
+    rng = np.random.default_rng(2)
+    x = np.linspace(0, 10, 300)
+    y = 2 * np.exp(-x / 3) + 0.01 * rng.standard_normal(x.size)
+    fit_func = fc.generate_fitting_function("var1*exp(-x/var2)")
+
+    results = [fc.run_fit(fit_func, x, y, engine=engine) for engine in ["curve_fit", "lm", "trf"]]
+    for result in results:
+        assert isinstance(result, fc.FitResult)
+        assert result.status == "ok"
+        assert np.allclose(result.popt, results[0].popt, rtol=1e-6)
+        assert np.allclose(result.perr, results[0].perr, rtol=1e-3)
+        assert np.isclose(result.chi2, results[0].chi2)
+
+    y_outliers = y.copy()
+    y_outliers[::25] += 5
+    sigma = np.full(x.size, 0.01)
+    linear = fc.run_fit(fit_func, x, y_outliers, sigma=sigma, engine="trf")
+    robust = fc.run_fit(fit_func, x, y_outliers, sigma=sigma, engine="trf", loss="soft_l1")
+    assert np.allclose(robust.popt, [2, 3], rtol=0.02)
+    assert not np.allclose(linear.popt, [2, 3], rtol=0.02)
+    with pytest.raises(NameError):
+        fc.run_fit(fit_func, x, y, engine="curve_fit", loss="soft_l1")
+    with pytest.raises(NameError):
+        fc.run_fit(fit_func, x, y, engine="not_an_engine")
+
+    sine = fc.generate_fitting_function("sin(var1*x)")
+    y_sine = np.sin(7 * x)
+    bounds = ([0], [10])
+    assert not np.isclose(fc.run_fit(sine, x, y_sine, bounds=bounds, engine="trf").popt[0], 7)
+    multistart = fc.run_fit(sine, x, y_sine, bounds=bounds, engine="multistart", starts=20)
+    assert np.isclose(multistart.popt[0], 7)
+    assert multistart.engine == "multistart"
+    parallel = fc.run_fit(sine, x, y_sine, bounds=bounds, engine="multistart", starts=20, jobs=2)
+    assert np.allclose(parallel.popt, multistart.popt)
+
+
+def test_bootstrap_fit():
+    """
+    This function tests the correct behaviour of fc.bootstrap_fit().
+    The test is passed if the intervals obtained resampling the residuals and the points are close to the
+    ones given by the covariance matrix of a linear fit, and if they do not depend on the number of processes.
+    """
+    rng = np.random.default_rng(3)
+    x = np.linspace(0, 1, 100)
+    y = 3 * x + 2 + 0.1 * rng.standard_normal(x.size)
+    fit_func = fc.generate_fitting_function("var1*x+var2")
+    result = fc.run_fit(fit_func, x, y)
+
+    for method in ["residuals", "points"]:
+        intervals = fc.bootstrap_fit(fit_func, x, y, result.popt, samples=400, method=method)
+        assert intervals["samples"].shape == (400, 2)
+        assert intervals["failed"] == 0
+        assert np.all(intervals["lower"] < result.popt) and np.all(result.popt < intervals["upper"])
+        assert np.allclose(intervals["upper"] - intervals["lower"], 2 * 1.96 * result.perr, rtol=0.25)
+
+    parallel = fc.bootstrap_fit(fit_func, x, y, result.popt, samples=400, method="points", jobs=2)
+    assert np.allclose(parallel["lower"], intervals["lower"])
+    assert np.allclose(parallel["upper"], intervals["upper"])
+
+    with pytest.raises(NameError):
+        fc.bootstrap_fit(fit_func, x, y, result.popt, method="not_a_method")
+
 
 def test_fitting_procedure(monkeypatch):
     """
@@ -299,7 +580,7 @@ def test_fitting_procedure(monkeypatch):
     path, rows_to_skip, x_index, y_index = "data2.xlsx", str(0), str(0), str(1)
     num_par, fit_func = str(2), "var1*cos(x+var2)"
     x_title, y_title = "a random title", "a second random title"
-    answers = iter([path, rows_to_skip, x_index, y_index, num_par, fit_func, x_title, y_title])
+    answers = iter([path, rows_to_skip, x_index, y_index, "", num_par, fit_func, x_title, y_title])
     monkeypatch.setattr('builtins.input', lambda _: next(answers))
 
     popt, perr, fig = fc.fitting_procedure()
@@ -357,6 +638,30 @@ def test_plot_data_verbose_error_raised(monkeypatch):
         fc.plot_data_verbose()
 
 
+def test_verbose_headless(monkeypatch, tmp_path):
+    """
+    This function tests fc.plot_data_verbose() and fc.fitting_procedure() when the plot is not shown.
+    Monkeypatch is used to simulate the inputs and to fail if a plot window is shown.
+    The test is passed if no figure is created when the plot is neither shown nor saved, and if the plot
+    is saved when requested.
+    """
+    def show():
+        raise AssertionError("the plot must not be shown")
+
+    monkeypatch.setattr(plt, 'show', show)
+
+    answers = iter(["data1.csv", "0", "0", "1", "x title", "y title"])
+    monkeypatch.setattr('builtins.input', lambda _: next(answers))
+    assert fc.plot_data_verbose(show_plot=False) is None
+
+    save_plot = str(tmp_path / "fit.png")
+    answers = iter(["data2.xlsx", "0", "0", "1", "", "2", "var1*cos(x+var2)", "x title", "y title"])
+    popt, perr, fig = fc.fitting_procedure(show_plot=False, save_plot=save_plot)
+    fc.wait_for_plots()
+    assert abs(abs(popt[0]) - 1) < 0.001
+    assert os.path.exists(save_plot)
+
+
 def test_print_constants():
     """
     This function tests the correct behaviour of fc.print_constants().
@@ -421,3 +726,691 @@ def test_fitting_from_conf_error_raised():
 
     with pytest.raises(NameError):
         fc.fitting_from_conf("test_conf_file_error.cfg")
+
+
+def test_fitting_from_conf_initial_values(tmp_path, monkeypatch):
+    """
+    This function tests the correct behaviour of fc.fitting_from_conf() with initial values and bounds.
+    The test is passed if the fit converges to the solution within the bounds, and if an error
+    is raised when the number of initial values is not the number of fitting parameters.
+    """
+    monkeypatch.setattr(plt, 'show', lambda: None)
+    conf_path = tmp_path / "bounded.cfg"
+    conf = ("[fitting parameters]\npath = {}\nrows to skip = 0\nx data index = 0\ny data index = 1\n"
+            "number fitting parameters = 2\nfitting function = var1*cos(x+var2)\nx-axis title = x\n"
+            "y-axis title = y\nlower bounds = 0 -3\nupper bounds = inf 0\n".format(os.path.abspath("data2.xlsx")))
+
+    conf_path.write_text(conf + "initial values = 0.5 -1\n")
+    popt, perr, fig = fc.fitting_from_conf(str(conf_path), show_plot=False)
+    assert np.allclose(popt, [1, -np.pi / 2], atol=1e-3)
+
+    conf_path.write_text(conf + "initial values = 0.5\n")
+    with pytest.raises(NameError):
+        fc.fitting_from_conf(str(conf_path), show_plot=False)
+
+
+def test_batch_fitting_warm_start(tmp_path):
+    """
+    This function tests the correct behaviour of fc.batch_fitting() when the fits are warm started.
+    Two runs of the same measurement are fitted (without giving the number of fitting parameters), the test
+    is passed if the results are the same of the independent fits.
+    """
+    x = np.linspace(0, 10, 100)
+    for run, slope in enumerate([2, 2.1]):
+        np.savetxt(tmp_path / "run{}.txt".format(run), np.column_stack([x, np.exp(-x / slope)]))
+        (tmp_path / "run{}.cfg".format(run)).write_text(
+            "[fitting parameters]\npath = {}\nrows to skip = 0\nx data index = 0\ny data index = 1\n"
+            "fitting function = exp(-x/var1)\nx-axis title = x\n"
+            "y-axis title = y\n".format(tmp_path / "run{}.txt".format(run)))
+
+    pattern = str(tmp_path / "run*.cfg")
+    warm_results = fc.batch_fitting(pattern, str(tmp_path / "warm.csv"), warm_start=True)
+    results = fc.batch_fitting(pattern, str(tmp_path / "cold.csv"))
+
+    assert list(warm_results["status"]) == ["ok", "ok"]
+    assert np.allclose(warm_results["parameter 1"], [2, 2.1])
+    assert np.allclose(warm_results["parameter 1"], results["parameter 1"])
+
+
+def test_batch_fitting(tmp_path):
+    """
+    This function tests the correct behaviour of fc.batch_fitting().
+    The test configuration files are fitted in batch, the test is passed if the results table
+    contains the correct parameters, if the failed fits are reported with their error (also when only
+    one of more y columns fails) and if the plot is saved.
+    """
+    output_path = str(tmp_path / "results.csv")
+    plot_dir = str(tmp_path / "plots")
+
+    results = fc.batch_fitting("test_conf_file*.cfg", output_path, plot_dir)
+
+    assert os.path.exists(output_path)
+    assert os.path.exists(os.path.join(plot_dir, "test_conf_file.png"))
+    assert list(results["status"] == "ok") == [True, False]
+    assert abs(abs(results["parameter 1"][0]) - 1) < 0.001
+    assert abs(abs(results["parameter 2"][0]) - np.pi / 2) < 0.001
+    assert results["chi2"][0] < 1e-6
+
+    x = np.linspace(0, 1, 10)
+    np.savetxt(tmp_path / "columns.txt", np.column_stack([x, 2 * x + 1, np.full(10, np.nan)]))
+    (tmp_path / "columns.cfg").write_text(
+        "[fitting parameters]\npath = {}\nrows to skip = 0\nx data index = 0\ny data index = 1 2\n"
+        "fitting function = var1*x+var2\nx-axis title = x\ny-axis title = y\n".format(tmp_path / "columns.txt"))
+    results = fc.batch_fitting(str(tmp_path / "columns.cfg"), str(tmp_path / "columns.csv"))
+    assert results["status"][0] == "ok"
+    assert results["status"][1] == "ValueError: array must not contain infs or NaNs"
+
+
+def test_batch_fitting_parquet_error_raised(monkeypatch, tmp_path):
+    """
+    This function tests the error raised by fc.batch_fitting() when the results are saved as .parquet without
+    pyarrow. The test is passed if the error is raised before performing the fits.
+    """
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    plot_dir = str(tmp_path / "plots")
+    with pytest.raises(NameError):
+        fc.batch_fitting("test_conf_file*.cfg", str(tmp_path / "results.parquet"), plot_dir)
+    assert not os.path.exists(plot_dir)
+
+
+def test_fit_many():
+    """
+    This function tests the correct behaviour of fc.fit_many() with two worker processes.
+    The test is passed if the results are returned in the order of the datasets, if a
+    failed fit does not stop the others and if a number of processes less than 1 is rejected,
+    also by the command line.
+    """
+    fit_func = fc.generate_fitting_function("var1*x+var2", 2)
+    x = np.linspace(0, 1, 10)
+    datasets = [(x, 2 * x + 1), (x, np.full(10, np.nan)), (x, -x + 3)]
+
+    results = fc.fit_many(fit_func, datasets, jobs=2)
+
+    assert [status == "ok" for _, _, status in results] == [True, False, True]
+    assert np.allclose(results[0][0], [2, 1])
+    assert np.all(np.isnan(results[1][0]))
+    assert np.allclose(results[2][0], [-1, 3])
+    for result, serial_result in zip(results, fc.fit_many(fit_func, datasets, jobs=1)):
+        assert np.allclose(result[0], serial_result[0], equal_nan=True)
+
+    with pytest.raises(NameError):
+        fc.fit_many(fit_func, datasets, jobs=0)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for arguments in [["fit", "test_conf_file.cfg", "--no-plot", "-j", "0"], ["serve", "-j", "-1"]]:
+        result = subprocess.run([sys.executable, "-m", "plafi"] + arguments, env={**os.environ, "PYTHONPATH": root},
+                                capture_output=True, text=True)
+        assert result.returncode == 2
+        assert "positive integer" in result.stderr
+
+
+def test_fit_python_function(monkeypatch):
+    """
+    This function tests the fits of a python function that is not generated by fc.generate_fitting_function().
+    Monkeypatch is used to not show the plot window.
+    The test is passed if the parameters are counted from the arguments of the function, if the fits asking for
+    more processes are done in the current process, and if a function whose parameters can not be counted
+    raises an error.
+    """
+    monkeypatch.setattr(plt, 'show', lambda: None)
+
+    def line(x, a, b):
+        return a * x + b
+
+    x = np.linspace(0, 1, 20)
+    data = np.column_stack([x, 2 * x + 1, -x + 3])
+    popt, perr, fig = fc.fit_data(data, line, y_index=[1, 2], jobs=2)
+    assert np.allclose(popt, [[2, 1], [-1, 3]])
+
+    for engine in ["lm", "trf", "multistart"]:
+        result = fc.run_fit(line, x, 2 * x + 1, engine=engine, starts=4, jobs=2)
+        assert result.status == "ok"
+        assert np.allclose(result.popt, [2, 1])
+    intervals = fc.bootstrap_fit(line, x, 2 * x + 1, [2, 1], samples=10, jobs=2)
+    assert intervals["samples"].shape == (10, 2)
+
+    with pytest.raises(TypeError):
+        fc.fit_many(lambda x, *parameters: parameters[0] * x, [(x, 2 * x)])
+
+
+def test_fit_data_more_columns(monkeypatch):
+    """
+    This function tests the correct behaviour of fc.fit_data() when more y columns are fitted.
+    Monkeypatch is used to not show the plot window.
+    The test is passed if popt is a (channels x parameters) matrix with the correct values, both
+    selecting the columns with a list and with "all".
+    """
+    monkeypatch.setattr(plt, 'show', lambda: None)
+
+    x = np.linspace(0, 3, 20)
+    data = np.column_stack([x, np.sin(x), 2 * np.sin(x), -np.sin(x)])
+    fit_func = fc.generate_fitting_function("var1*sin(x)", 1)
+
+    popt, perr, fig = fc.fit_data(data, fit_func, y_index="all")
+    assert popt.shape == (3, 1) and perr.shape == (3, 1)
+    assert np.allclose(popt.ravel(), [1, 2, -1])
+
+    popt, perr, fig = fc.fit_data(data, fit_func, y_index=[3, 1], jobs=2)
+    assert np.allclose(popt.ravel(), [-1, 1])
+    assert len(fig.axes[0].lines) == 4
+
+
+def test_read_data_chunks():
+    """
+    This function tests the correct behaviour of fc.read_data() when the file is read in chunks.
+    The test is passed if the selected columns are read in the given order and if the decimated
+    and aggregated data are correct, also when the chunks are not multiple of the decimation.
+    """
+    assert np.all(fc.read_data("data1.csv", chunk_size=2) == fc.read_data("data1.txt"))
+    assert np.all(fc.read_data("data1.txt", columns=[1, 0], chunk_size=2) == fc.read_data("data1.txt")[:, [1, 0]])
+    assert np.all(fc.read_data("data1.txt", columns=[1], chunk_size=2, decimation=2) == [[0.], [3.], [120.]])
+
+    aggregated = fc.read_data("data1.csv", chunk_size=3, decimation=2, aggregate=True)
+    assert np.allclose(aggregated, [[-2.5, 0.5], [2.55, 3.75], [4., 120.]])
+
+    with pytest.raises(NameError):
+        fc.read_data("data1.xlsx", chunk_size=2)
+
+
+def test_read_new_rows(tmp_path):
+    """
+    This function tests the correct behaviour of fc.read_new_rows() on a file that is being appended.
+    The test is passed if the rows to skip are skipped, if only the new complete rows are returned
+    and if the incomplete last row is read at the next call.
+    """
+    path = str(tmp_path / "data.csv")
+    with open(path, "w") as file:
+        file.write("x;y\n1;2\n3;")
+
+    rows, offset = fc.read_new_rows(path, rows_to_skip=1)
+    assert np.all(rows == [[1., 2.]])
+
+    with open(path, "a") as file:
+        file.write("4\n5;6\n")
+    rows, offset = fc.read_new_rows(path, offset)
+    assert np.all(rows == [[3., 4.], [5., 6.]])
+    assert fc.read_new_rows(path, offset)[0].size == 0
+
+    with pytest.raises(NameError):
+        fc.read_new_rows(path, offset + 1)
+
+
+def test_watch_plot():
+    """
+    This function tests the correct behaviour of fc.watch_plot().
+    The test is passed if the figure contains a line for every y column of the watched file,
+    without the last row of data1.txt that is not ended by a new line (it could be still being written),
+    and without the skipped rows.
+    """
+    fig = fc.watch_plot("data1.txt", interval=0, max_polls=2)
+    assert len(fig.axes[0].lines) == fc.read_data("data1.txt").shape[1] - 1
+    assert np.all(fig.axes[0].lines[0].get_xydata() == fc.read_data("data1.txt")[:-1])
+    plt.close(fig)
+
+    fig = fc.watch_plot("data1.txt", rows_to_skip=1, interval=0, max_polls=2)
+    assert np.all(fig.axes[0].lines[0].get_xydata() == fc.read_data("data1.txt")[1:-1])
+    plt.close(fig)
+
+
+def test_watch_fit(tmp_path):
+    """
+    This function tests the correct behaviour of fc.watch_fit() without the plot.
+    The data file is written before the watch starts, the test is passed if the fitting parameters are correct,
+    also with the engine and the loss given as arguments.
+    """
+    x = np.linspace(0, 10, 50)
+    data_path = tmp_path / "data.txt"
+    np.savetxt(data_path, np.column_stack([x, 2 * x + 1]))
+    conf_path = tmp_path / "watch.cfg"
+    conf_path.write_text("[fitting parameters]\npath = {}\nrows to skip = 0\nx data index = 0\n"
+                         "y data index = 1\nnumber fitting parameters = 2\nfitting function = var1*x+var2\n"
+                         "x-axis title = x\ny-axis title = y\n".format(data_path))
+
+    popt, perr, fig = fc.watch_fit(str(conf_path), show_plot=False, interval=0, max_polls=2)
+    assert np.allclose(popt, [2, 1])
+    assert fig is None
+
+    popt, perr, fig = fc.watch_fit(str(conf_path), show_plot=False, interval=0, max_polls=2, engine="trf",
+                                   loss="soft_l1")
+    assert np.allclose(popt, [2, 1])
+    with pytest.raises(NameError):
+        fc.watch_fit(str(conf_path), show_plot=False, interval=0, max_polls=2, loss="soft_l1")
+
+
+def test_read_data_columns(monkeypatch, tmp_path):
+    """
+    This function tests the correct behaviour of fc.read_data() when only some columns are read.
+    The test is passed if the columns are returned in the given order with contiguous columns, for every
+    file type (also with negative indexes), if only the selected columns are parsed and cached, and if the cache
+    entry of the whole file is used when it exists.
+    """
+    monkeypatch.setenv("PLAFI_CACHE_DIR", str(tmp_path / "cache"))
+    for path in ["data1.txt", "data1.csv", "data1.xlsx", "data2.xlsx"]:
+        data = fc.read_data(path, columns=[1, 0])
+        assert np.all(data == fc.read_data(path)[:, [1, 0]])
+        assert data.T[0].flags["C_CONTIGUOUS"] and data.T[1].flags["C_CONTIGUOUS"]
+        # the negative indexes count from the last column, as data.T[idx]
+        assert np.all(fc.read_data(path, columns=[0, -1]) == fc.read_data(path)[:, [0, -1]])
+    assert np.all(fc.read_data("data1.csv", columns=[0, -1], chunk_size=2) == fc.read_data("data1.csv")[:, [0, -1]])
+
+    # only the selected columns of a wide file are parsed
+    wide_path = str(tmp_path / "wide.txt")
+    np.savetxt(wide_path, np.arange(2000.).reshape(10, 200))
+    fc.clear_cache()
+    parsed_columns = []
+    parse_data = fc._parse_data
+    monkeypatch.setattr(fc, "_parse_data", lambda *args: parsed_columns.append(args[3]) or parse_data(*args))
+    assert np.all(fc.read_data(wide_path, columns=[150, 3]) == np.arange(2000.).reshape(10, 200)[:, [150, 3]])
+    assert parsed_columns == [[150, 3]]
+    assert fc.cache_stats()["entries"] == 1
+
+    # the entry of the whole file is used for any selection of columns
+    fc.read_data(wide_path)
+    assert np.all(fc.read_data(wide_path, columns=[7]) == np.arange(2000.).reshape(10, 200)[:, [7]])
+    assert parsed_columns == [[150, 3], None]
+
+
+def test_convert_data(tmp_path):
+    """
+    This function tests the correct behaviour of fc.convert_data() and the reading of binary files.
+    data1.txt is converted to .npy and .npz, the test is passed if the converted files are read
+    as writable memory-mapped arrays with contiguous columns and the same values of the original file.
+    """
+    for extension in [".npy", ".npz"]:
+        output_path = fc.convert_data("data1.txt", str(tmp_path / ("data1" + extension)))
+        data = fc.read_data(output_path)
+        assert isinstance(data, np.memmap)
+        assert data.T[1].flags["C_CONTIGUOUS"]
+        assert np.all(data == fc.read_data("data1.txt"))
+        data[0, 0] += 1
+        assert np.all(fc.read_data(output_path) == fc.read_data("data1.txt"))
+
+    with pytest.raises(NameError):
+        fc.convert_data("data1.txt", str(tmp_path / "data1.pdf"))
+
+
+def test_read_data_cache(monkeypatch, tmp_path):
+    """
+    This function tests the on-disk cache of fc.read_data().
+    The test is passed if a file is parsed only the first time it is read, if a modified file is parsed
+    again, if the least recently used entries are deleted when the cache is full and if the cache is cleared.
+    """
+    monkeypatch.setenv("PLAFI_CACHE_DIR", str(tmp_path / "cache"))
+    data_path = str(tmp_path / "data.csv")
+    with open(data_path, "w") as f:
+        f.write("1;2\n3;4\n")
+
+    assert np.all(fc.read_data(data_path) == [[1, 2], [3, 4]])
+    assert fc.cache_stats()["entries"] == 1
+    cached = fc.read_data(data_path)
+    assert isinstance(cached, np.memmap)
+    assert np.all(cached == [[1, 2], [3, 4]])
+    # the cache hits are writable, and the changes do not modify the cache entry
+    cached[0, 0] = 10
+    assert np.all(fc.read_data(data_path) == [[1, 2], [3, 4]])
+
+    # a modified file is parsed again
+    with open(data_path, "w") as f:
+        f.write("1;2\n3;5\n6;7\n")
+    assert np.all(fc.read_data(data_path) == [[1, 2], [3, 5], [6, 7]])
+    assert fc.cache_stats()["entries"] == 2
+
+    # with a maximum size of ~200 bytes only the last entry can be kept
+    monkeypatch.setenv("PLAFI_CACHE_SIZE", str(200 / 1024 ** 2))
+    fc.read_data(data_path, rows_to_skip=1)
+    assert fc.cache_stats()["entries"] == 1
+
+    assert fc.clear_cache() == 1
+    assert fc.cache_stats()["entries"] == 0
+
+
+def test_read_xlsx(tmp_path):
+    """
+    This function tests the streaming reader of .xlsx files used by fc.read_data().
+    The test is passed if the selected rows, columns and sheet are read correctly, if the empty cells are
+    read as nan and if a cell that is not a number raises an error with its position.
+    """
+    import openpyxl
+
+    data = fc.read_data("data2.xlsx")
+    assert np.all(fc._read_xlsx("data2.xlsx", rows_to_skip=2, sheet=0, columns=[1]) == data[2:, [1]])
+    assert np.all(fc._read_xlsx("data2.xlsx", sheet=0) == data)
+
+    with pytest.raises(KeyError):
+        fc._read_xlsx("data2.xlsx", sheet="a sheet that does not exist")
+
+    workbook = openpyxl.Workbook()
+    for row in [["x", "y", "z"], [1, 2, 3], [4, None, 6], [7, 8, "a text"]]:
+        workbook.active.append(row)
+    data_path = str(tmp_path / "text.xlsx")
+    workbook.save(data_path)
+    assert np.allclose(fc._read_xlsx(data_path, rows_to_skip=1, columns=[0, 1])[:2], [[1, 2], [4, np.nan]],
+                       equal_nan=True)
+    with pytest.raises(NameError, match="C4"):
+        fc._read_xlsx(data_path, rows_to_skip=1)
+    with pytest.raises(NameError, match="C4"):
+        fc._read_xlsx(data_path, rows_to_skip=1, columns=[2, 0])
+    with pytest.raises(NameError, match="A1"):
+        fc._read_xlsx(data_path)
+
+
+# modules that must not be imported by every subcommand, and ceilings of the import time of the subcommands in
+# seconds, about ten times the ones measured, so that only a new heavy import makes the test fail
+HEAVY_MODULES = ["pandas", "matplotlib", "scipy", "numexpr", "uncertainties", "openpyxl"]
+HELP_BUDGET, NUMPY_BUDGET, FIT_BUDGET = 0.5, 2, 10
+STARTUP_IMPORTS = [
+    (["-h"], ["numpy"] + HEAVY_MODULES, HELP_BUDGET),
+    (["plot", "-h"], ["numpy"] + HEAVY_MODULES, HELP_BUDGET),
+    (["fit", "-h"], ["numpy"] + HEAVY_MODULES, HELP_BUDGET),
+    (["fit", "-c"], HEAVY_MODULES, NUMPY_BUDGET),
+    (["cache", "stats"], HEAVY_MODULES, NUMPY_BUDGET),
+    (["const"], HEAVY_MODULES, NUMPY_BUDGET),
+    (["convert", "data1.txt"], HEAVY_MODULES, NUMPY_BUDGET),
+    (["plot", "data1.csv", "--save-plot", "plot.png"], ["scipy", "uncertainties", "openpyxl"], FIT_BUDGET),
+    (["fit", "test_conf_file.cfg", "--no-plot"], ["pandas"], FIT_BUDGET),
+]
+
+
+@pytest.mark.parametrize("arguments, forbidden_modules, budget", STARTUP_IMPORTS)
+def test_startup_imports(tmp_path, arguments, forbidden_modules, budget):
+    """
+    This function tests the startup cost of the plafi subcommands, using python -X importtime.
+    The subcommand is run in a new interpreter on copies of the test files, the test is passed if the modules
+    not needed by the subcommand are not imported and if the total import time is within the budget.
+    """
+    for file_name in ["data1.txt", "data1.csv", "data2.xlsx", "test_conf_file.cfg"]:
+        shutil.copy(file_name, tmp_path)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": root, "PLAFI_CACHE_DIR": str(tmp_path / "cache"), "MPLBACKEND": "Agg"}
+    result = subprocess.run([sys.executable, "-X", "importtime", "-m", "plafi"] + arguments, cwd=tmp_path,
+                            env=env, capture_output=True, text=True)
+    assert result.returncode == 0
+
+    # lines of the report: "import time: self [us] | cumulative | imported package", where the packages
+    # imported by other ones are indented, so the total is the sum of the cumulative times of the others
+    report = [line.split("|") for line in result.stderr.splitlines()
+              if line.startswith("import time:") and "cumulative" not in line]
+    imported_modules = {name.strip().split(".")[0] for _, _, name in report}
+    assert not imported_modules.intersection(forbidden_modules)
+    import_time = sum(int(cumulative) for _, cumulative, name in report if not name.startswith("  "))
+    assert import_time / 1e6 < budget
+
+
+def test_fit_data_headless(tmp_path):
+    """
+    This function tests fc.fit_data() and fc.plot_data() when the plot is not shown.
+    The test is passed if no figure is created when the plot is neither shown nor saved, and if
+    the saved plots are written in background.
+    """
+    data = fc.read_data("data2.xlsx")
+    fit_func = fc.generate_fitting_function("var1*sin(x)", 1)
+    figures = plt.get_fignums()
+
+    popt, perr, fig = fc.fit_data(data, fit_func, show_plot=False)
+    assert fig is None
+    assert abs(popt - 1) < 0.001
+
+    fit_plot, data_plot = str(tmp_path / "fit.png"), str(tmp_path / "data.png")
+    popt, perr, fig = fc.fit_data(data, fit_func, x_label="title", show_plot=False, save_plot=fit_plot)
+    assert fig.axes[0].xaxis.label._text == "title"
+    assert fc.plot_data(data, show_plot=False) is None
+    fc.plot_data(data, show_plot=False, save_plot=data_plot)
+    fc.wait_for_plots()
+
+    assert os.path.exists(fit_plot) and os.path.exists(data_plot)
+    # the figures that are only saved are not handled by pyplot
+    assert plt.get_fignums() == figures
+
+
+def test_decimate_minmax():
+    """
+    This function tests the correct behaviour of fc.decimate_minmax().
+    The test is passed if the decimated line has at most max_points points, in the original order,
+    and if it keeps the minimum and maximum of the line.
+    """
+    x = np.linspace(0, 10, 100003)
+    y = np.sin(x)
+    y[12345], y[54321] = 5, -7
+
+    x_dec, y_dec = fc.decimate_minmax(x, y, 1000)
+    assert len(x_dec) <= 1000
+    assert np.all(np.diff(x_dec) > 0)
+    assert y_dec.max() == 5 and y_dec.min() == -7
+    assert np.all(np.isin(x_dec, x))
+
+    short_x, short_y = fc.decimate_minmax(x[:10], y[:10], 1000)
+    assert np.all(short_x == x[:10]) and np.all(short_y == y[:10])
+
+
+def test_plot_data_decimated(monkeypatch):
+    """
+    This function tests the decimation of the plots made with fc.plot_data().
+    Monkeypatch is used to not show the plot window.
+    The test is passed if the plotted line is decimated and if it is decimated again,
+    with only the visible points, when the plot is zoomed.
+    """
+    monkeypatch.setattr(plt, 'show', lambda: None)
+
+    x = np.linspace(0, 100, 10 * fc.MAX_PLOT_POINTS)
+    fig = fc.plot_data(np.column_stack([x, np.sin(x)]))
+    line = fig.axes[0].lines[0]
+    assert len(line.get_xdata()) <= fc.MAX_PLOT_POINTS
+
+    fig.axes[0].set_xlim(10, 11)
+    assert np.all((line.get_xdata() >= 10) & (line.get_xdata() <= 11))
+    assert len(line.get_xdata()) == np.sum((x >= 10) & (x <= 11))
+
+
+def test_fit_server(tmp_path):
+    """
+    This function tests the fit server started with plafi serve, and its clients.
+    The server is started in a new process, the test is passed if the fits sent as configuration file and as
+    arrays are correct, if the errors are written in the responses, if the files outside the directory of the
+    server and the HTTP requests without the token are rejected, if plafi fit --remote prints the same parameters
+    of plafi fit without importing numpy (and rejects the options that the server does not support) and if the server stops
+    when asked.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    socket_path = str(tmp_path / "plafi.sock")
+    with socket.socket() as free_socket:
+        free_socket.bind(("127.0.0.1", 0))
+        port = free_socket.getsockname()[1]
+    env = {**os.environ, "PYTHONPATH": root, "PLAFI_CACHE_DIR": str(tmp_path), "PLAFI_SOCKET": socket_path,
+           "PLAFI_TOKEN": "a test token"}
+    process = subprocess.Popen([sys.executable, "-m", "plafi", "serve", "-j", "2", "--port", str(port)], env=env,
+                               stdout=subprocess.PIPE, text=True)
+    try:
+        assert "listening" in process.stdout.readline()
+        assert os.stat(socket_path).st_mode & 0o077 == 0
+
+        with open("test_conf_file.cfg") as f:
+            configuration = f.read()
+        x = np.linspace(0, 10, 100)
+        with server.Client(socket_path) as client:
+            assert client.request({"action": "ping"})["status"] == "ok"
+
+            response = client.request({"configuration": configuration, "directory": os.getcwd()})
+            assert response["status"] == "ok"
+            assert np.allclose(response["results"][0]["popt"], [-1, np.pi / 2])
+
+            response = client.request({"fitting function": "var1*x+var2", "x": x, "y": [2 * x + 1, 3 * x - 1],
+                                       "engine": "trf"})
+            assert np.allclose([result["popt"] for result in response["results"]], [[2, 1], [3, -1]])
+
+            assert client.request({"fitting function": "var1*y", "x": x, "y": x})["status"] != "ok"
+            assert client.request({"action": "a wrong action"})["status"] != "ok"
+
+            # the files outside the working directory of the server can be neither read nor written
+            outside_path = str(tmp_path / "outside.png")
+            for request in [{"configuration": configuration.replace("data2.xlsx", "/etc/passwd")},
+                            {"configuration": configuration.replace("data2.xlsx", "/a/file/that/does/not/exist")},
+                            {"configuration": configuration, "directory": os.getcwd(), "save plot": outside_path},
+                            {"action": "plot", "path": "../setup.py", "save plot": "plot.png"}]:
+                assert "outside" in client.request(request)["status"]
+            assert not os.path.exists(outside_path)
+
+        def http_request(headers):
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            connection.request("POST", "/fit", json.dumps({"fitting function": "var1*x", "x": [1, 2], "y": [2, 4]}),
+                               headers)
+            return connection.getresponse().status
+
+        assert http_request({"Content-Type": "application/json", "Authorization": "Bearer a test token"}) == 200
+        assert http_request({"Content-Type": "application/json"}) == 403
+        assert http_request({"Content-Type": "application/json", "Authorization": "Bearer a test token",
+                             "Origin": "http://example.com"}) == 403
+        assert http_request({"Content-Type": "text/plain", "Authorization": "Bearer a test token"}) == 415
+
+        # the body is not read (and not allocated) before the headers are checked
+        for authorization, status in [(b"", b"403"), (b"Authorization: Bearer a test token\r\n", b"413")]:
+            with socket.create_connection(("127.0.0.1", port), timeout=30) as connection:
+                connection.sendall(b"POST /fit HTTP/1.1\r\nContent-Type: application/json\r\n" + authorization +
+                                   b"Content-Length: 1000000000000\r\n\r\n")
+                assert connection.recv(1024).startswith(b"HTTP/1.1 " + status)
+
+        result = subprocess.run([sys.executable, "-X", "importtime", "-m", "plafi", "fit", "test_conf_file.cfg",
+                                 "--remote"], env=env, capture_output=True, text=True)
+        assert result.returncode == 0
+        assert "numpy" not in result.stderr
+        # the output is the same of the local fit
+        local_result = subprocess.run([sys.executable, "-m", "plafi", "fit", "test_conf_file.cfg", "--no-plot"],
+                                      env=env, capture_output=True, text=True)
+        assert "parameter 2:  " in result.stdout and result.stdout == local_result.stdout
+
+        # the options are sent to the server, or rejected if it does not support them
+        options = ["--engine", "trf", "--loss", "soft_l1", "--no-plot"]
+        result = subprocess.run([sys.executable, "-m", "plafi", "fit", "test_conf_file.cfg", "--remote"] + options,
+                                env=env, capture_output=True, text=True)
+        local_result = subprocess.run([sys.executable, "-m", "plafi", "fit", "test_conf_file.cfg"] + options,
+                                      env=env, capture_output=True, text=True)
+        assert result.returncode == 0 and result.stdout == local_result.stdout
+        for option in [["-j", "2"], ["--bootstrap", "10"], ["--watch"]]:
+            result = subprocess.run([sys.executable, "-m", "plafi", "fit", "test_conf_file.cfg", "--remote"] + option,
+                                    env=env, capture_output=True, text=True)
+            assert result.returncode == 2 and "can not be used with --remote" in result.stderr
+
+        with server.Client(socket_path) as client:
+            assert client.request({"action": "shutdown"})["status"] == "ok"
+        assert process.wait(timeout=30) == 0
+        assert not os.path.exists(socket_path)
+    finally:
+        process.kill()
+        process.stdout.close()
+
+
+def test_fit_api(capsys, tmp_path):
+    """
+    This function tests the python interface plafi.fit().
+    The test is passed if the parameters, the residuals and the timing of the fit are returned without printing
+    anything and without creating figures, and if an error is raised when the fitting function can not be used
+    (also by fc.fitting_from_conf()).
+    """
+    x = np.linspace(0, 10, 100)
+    y = 2 * np.sin(x) + 1
+    y[::2] += 0.01
+    figures = plt.get_fignums()
+
+    result = plafi.fit(x, y, "var1*sin(x)+var2")
+    assert isinstance(result, fc.FitResult)
+    assert np.allclose(result.popt, [2, 1], atol=0.01)
+    assert result.pcov.shape == (2, 2)
+    assert np.allclose(result.residuals, y - (result.popt[0] * np.sin(x) + result.popt[1]))
+    assert result.nfev > 0 and result.time > 0
+    assert capsys.readouterr().out == ""
+    assert plt.get_fignums() == figures
+
+    result = plafi.fit(x, y, "var1*sin(x)+var2", sigma=np.full(100, 0.1), engine="trf")
+    assert np.allclose(result.residuals, y - (result.popt[0] * np.sin(x) + result.popt[1]))
+
+    with pytest.raises(NameError):
+        plafi.fit(x, y, "var1*sin(y)")
+
+    conf_path = tmp_path / "invalid.cfg"
+    with open("test_conf_file.cfg") as f:
+        conf_path.write_text(f.read().replace("var1*cos(x+var2)", "var1*cos(y+var2)").replace(
+            "data2.xlsx", os.path.abspath("data2.xlsx")))
+    with pytest.raises(NameError):
+        fc.fitting_from_conf(str(conf_path), show_plot=False)
+
+
+@pytest.mark.parametrize("str_funct, token", [("var1*sinc(x)", "sinc"), ("var1*x.real", "x.real"),
+                                              ("var1*sin(x, 2)", "sin(x, 2)"), ("var1*exp", "exp"),
+                                              ("var1*(x", "("), ("var1*'a'", "'a'")])
+def test_parse_expression_error_raised(str_funct, token):
+    """
+    This function tests the errors raised by ex.parse_expression() when the expression can not be used.
+    The test is passed if the error message points at the wrong token with a caret line, and if
+    fc.valid_function() rejects the expression.
+    """
+    with pytest.raises(NameError) as error:
+        ex.parse_expression(str_funct, ["x", "var1"], {"pi": np.pi})
+    expression_line, caret_line = str(error.value).splitlines()[1:]
+    start = caret_line.index("^")
+    assert expression_line[start:len(caret_line)] == token
+    assert not fc.valid_function(str_funct)
+
+
+def test_parse_expression_folding():
+    """
+    This function tests the constant folding of ex.parse_expression() and the elimination of the common
+    subexpressions of ex.eliminate_common_subexpressions().
+    The test is passed if the operations between constants are computed (and the result still has the shape of x
+    if it does not depend on it), and if the repeated subexpressions of the partial derivatives are computed
+    only once.
+    """
+    tree = ex.parse_expression("var1*cos(2*pi*x+var2) + sqrt(4)*k", ["x", "var1", "var2"], {"pi": np.pi, "k": 3})
+    assert ast.unparse(tree) == "var1 * cos({!r} * x + var2) + 6.0".format(2 * np.pi)
+    # the folded expressions that do not depend on x are evaluated as arrays with the shape of x
+    assert ast.unparse(ex.parse_expression("0*x+var1", ["x", "var1"], {})) == "var1"
+    assert np.all(ex.compile_expression("0*x+var1", ["x", "var1"], {})(np.arange(4.), 2.) == np.full(4, 2.))
+
+    partials = [ex.differentiate(tree, var) for var in ["var1", "var2"]]
+    assignments, expressions = ex.eliminate_common_subexpressions(partials)
+    computed = [ast.unparse(node) for _, node in assignments] + [ast.unparse(node) for node in expressions]
+    assert sum("cos(" in line for line in computed) == 1
+    assert sum("sin(" in line for line in computed) == 1
+
+
+MODEL_PARAMETERS = [("gaussian", [3, 4.2, 0.7, 1]), ("lorentzian", [-2, 6, 0.5, 0.3]), ("exponential", [5, 2.5, 1]),
+                    ("sine", [2, 3.1, 0.4, 0.5]), ("damped_sine", [2, 4, 5.3, 1, 0.2]),
+                    ("polynomial3", [1, -2, 0.5, 0.03])]
+
+
+@pytest.mark.parametrize("model_name, parameters", MODEL_PARAMETERS)
+def test_built_in_models(model_name, parameters):
+    """
+    This function tests the built-in models of plafi.models.
+    The test is passed if the evaluator and the jacobian of every model are the same as the ones generated from its
+    expression, and if the initial guess computed from noisy data leads the fit to the true parameters.
+    """
+    model = models.get_model(model_name)
+    fitting_function = fc.generate_fitting_function(model_name)
+    string_function = fc.generate_fitting_function(model.expression)
+    x = np.linspace(0, 10, 300)
+    assert fc.count_parameters(model_name) == len(parameters) == len(model.parameters)
+    assert fc.valid_function(model_name)
+    assert np.allclose(fitting_function(x, *parameters), string_function(x, *parameters))
+    assert np.allclose(fitting_function.jacobian(x, *parameters), string_function.jacobian(x, *parameters))
+
+    y = fitting_function(x, *parameters) + np.random.default_rng(1).normal(0, 0.05, x.size)
+    assert np.all(np.isfinite(model.initial_guess(x, y)))
+    result = plafi.fit(x, y, model_name)
+    assert np.allclose(result.popt, parameters, rtol=0.05, atol=0.05)
+
+    with pytest.raises(NameError):
+        fc.generate_fitting_function(model_name, len(parameters) + 1)
+
+
+def test_built_in_model_conf(tmp_path):
+    """
+    This function tests a built-in model used as fitting function of a configuration file.
+    The test is passed if the gaussian is fitted without initial values.
+    """
+    x = np.linspace(-5, 5, 200)
+    y = 4 * np.exp(-(x - 1.5) ** 2 / (2 * 0.6 ** 2)) + 0.5
+    data_path = tmp_path / "peak.csv"
+    np.savetxt(data_path, np.column_stack([x, y]), delimiter=";")
+    conf_path = tmp_path / "peak.cfg"
+    conf_path.write_text("[fitting parameters]\npath = {}\nrows to skip = 0\nx data index = 0\ny data index = 1\n"
+                         "fitting function = gaussian\nx-axis title = x\ny-axis title = y\n".format(data_path))
+    popt = fc.fitting_from_conf(str(conf_path), show_plot=False)[0]
+    assert np.allclose(popt, [4, 1.5, 0.6, 0.5], atol=1e-6)